@@ -28,7 +28,11 @@ target_metadata = Base.metadata
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
-config.set_main_option("sqlalchemy.url", settings.db.url)
+# every shard has the whole schema: alembic -x shard=<name> upgrade head
+shard = context.get_x_argument(as_dictionary=True).get("shard")
+config.set_main_option(
+    "sqlalchemy.url", settings.shards.urls[shard] if shard else settings.db.url
+)
 
 
 def run_migrations_offline() -> None:
@@ -0,0 +1,36 @@
+"""add messages chat_id created_at index
+
+Revision ID: 8d2f4b6a0c19
+Revises: 3c5e8a1f9b27
+Create Date: 2026-10-18 11:47:32.905114
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2f4b6a0c19"
+down_revision: Union[str, Sequence[str], None] = "3c5e8a1f9b27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_chat_id_created_at",
+            "messages",
+            ["chat_id", "created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_chat_id_created_at", table_name="messages")
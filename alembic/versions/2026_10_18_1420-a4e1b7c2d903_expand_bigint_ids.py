@@ -0,0 +1,75 @@
+"""expand: add bigint shadow columns for ids
+
+Online switch of ids to BIGINT, step 1 of 3:
+    expand - add nullable BIGINT shadow columns, kept in sync by triggers
+    backfill - copy existing values in batches, build indexes concurrently
+    swap - swap shadow columns in under a short lock
+
+Run all three before deploying app that generates snowflake ids.
+
+Revision ID: a4e1b7c2d903
+Revises: 51a7c3e9d2b4
+Create Date: 2026-10-18 14:20:13.604821
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4e1b7c2d903"
+down_revision: Union[str, Sequence[str], None] = "51a7c3e9d2b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> columns switched to BIGINT
+ID_COLUMNS = {
+    "chats": ("id",),
+    "messages": ("id", "chat_id"),
+    "idempotency_keys": ("id", "chat_id", "message_id"),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, columns in ID_COLUMNS.items():
+        op.execute(
+            f"ALTER TABLE {table} "
+            + ", ".join(f"ADD COLUMN {column}_new BIGINT" for column in columns)
+        )
+        # NOT VALID is instant, validated after backfill, lets SET NOT NULL
+        # of the swap skip the full table scan
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_new_not_null "
+            f"CHECK ({' AND '.join(f'{column}_new IS NOT NULL' for column in columns)}) "
+            "NOT VALID"
+        )
+        op.execute(
+            f"""
+            CREATE FUNCTION {table}_sync_bigint_ids() RETURNS trigger AS $$
+            BEGIN
+                {' '.join(f'NEW.{column}_new := NEW.{column};' for column in columns)}
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_sync_bigint_ids "
+            f"BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_sync_bigint_ids()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # shadow columns are already gone when downgrading after the swap
+    for table, columns in ID_COLUMNS.items():
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_bigint_ids ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS {table}_sync_bigint_ids()")
+        op.execute(
+            f"ALTER TABLE {table} "
+            + ", ".join(f"DROP COLUMN IF EXISTS {column}_new" for column in columns)
+        )
@@ -0,0 +1,76 @@
+"""backfill: copy ids into bigint shadow columns
+
+Online switch of ids to BIGINT, step 2 of 3, see a4e1b7c2d903.
+Runs outside of transaction: rows are copied in small committed batches,
+indexes are built concurrently, so writes are never blocked for long.
+
+Revision ID: b7f3c9d1e245
+Revises: a4e1b7c2d903
+Create Date: 2026-10-18 14:21:40.220577
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7f3c9d1e245"
+down_revision: Union[str, Sequence[str], None] = "a4e1b7c2d903"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ID_COLUMNS = {
+    "chats": ("id",),
+    "messages": ("id", "chat_id"),
+    "idempotency_keys": ("id", "chat_id", "message_id"),
+}
+BATCH_SIZE = 10_000
+
+# index name -> (table, columns, unique), swapped in for the existing ones
+NEW_INDEXES = {
+    "chats_id_new_key": ("chats", "id_new", True),
+    "messages_id_new_key": ("messages", "id_new", True),
+    "ix_messages_chat_id_new_created_at": (
+        "messages",
+        "chat_id_new, created_at",
+        False,
+    ),
+    "idempotency_keys_id_new_key": ("idempotency_keys", "id_new", True),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        for table, columns in ID_COLUMNS.items():
+            assignments = ", ".join(f"{column}_new = {column}" for column in columns)
+            backfill = sa.text(
+                f"UPDATE {table} SET {assignments} WHERE id IN ("
+                f"SELECT id FROM {table} WHERE id_new IS NULL LIMIT {BATCH_SIZE})"
+            )
+            if op.get_context().as_sql:
+                # offline script can't loop, DBA batches it by hand if needed
+                op.execute(f"UPDATE {table} SET {assignments} WHERE id_new IS NULL")
+            else:
+                while connection.execute(backfill).rowcount:
+                    pass
+            op.execute(
+                f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_id_new_not_null"
+            )
+
+        for name, (table, columns, unique) in NEW_INDEXES.items():
+            op.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY "
+                f"IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in NEW_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,92 @@
+"""swap: make bigint shadow columns the ids
+
+Online switch of ids to BIGINT, step 3 of 3, see a4e1b7c2d903.
+Tables are locked only for catalog changes: NOT NULL is proven by the
+validated check constraint, primary keys reuse the prebuilt unique indexes,
+foreign keys are validated after the lock is released.
+
+Serial sequences stay as ids' defaults, so app instances which don't
+generate ids yet keep working during the rollout, their small ids never
+collide with snowflake ids.
+
+Revision ID: c2d8e4f6a178
+Revises: b7f3c9d1e245
+Create Date: 2026-10-18 14:22:58.771930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c2d8e4f6a178"
+down_revision: Union[str, Sequence[str], None] = "b7f3c9d1e245"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ID_COLUMNS = {
+    "chats": ("id",),
+    "messages": ("id", "chat_id"),
+    "idempotency_keys": ("id", "chat_id", "message_id"),
+}
+# (table, column, referenced table)
+FOREIGN_KEYS = (
+    ("messages", "chat_id", "chats"),
+    ("idempotency_keys", "chat_id", "chats"),
+    ("idempotency_keys", "message_id", "messages"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(f"LOCK TABLE {', '.join(ID_COLUMNS)} IN ACCESS EXCLUSIVE MODE")
+
+    for table, column, _ in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_fkey")
+
+    for table, columns in ID_COLUMNS.items():
+        op.execute(f"DROP TRIGGER {table}_sync_bigint_ids ON {table}")
+        op.execute(f"DROP FUNCTION {table}_sync_bigint_ids()")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        for column in columns:
+            # drops primary key and indexes on the old column too
+            op.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+            op.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_new TO {column}")
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_id_new_not_null")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey "
+            f"PRIMARY KEY USING INDEX {table}_id_new_key"
+        )
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')"
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.execute(
+        "ALTER INDEX ix_messages_chat_id_new_created_at "
+        "RENAME TO ix_messages_chat_id_created_at"
+    )
+
+    for table, column, referenced in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id) "
+            "ON DELETE CASCADE NOT VALID"
+        )
+
+    with op.get_context().autocommit_block():
+        for table, column, _ in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_fkey")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # offline, fails if snowflake ids were already generated
+    for table, columns in ID_COLUMNS.items():
+        op.execute(
+            f"ALTER TABLE {table} "
+            + ", ".join(f"ALTER COLUMN {column} TYPE INTEGER" for column in columns)
+        )
@@ -0,0 +1,108 @@
+"""expand: add messages seq and chats last_seq
+
+Online numbering of messages, step 1 of 3:
+    expand - add nullable columns, triggers number messages of old app
+    backfill - number existing messages chat by chat in small transactions
+    contract - build unique index concurrently, make columns NOT NULL
+
+Existing chats get last_seq NULL, meaning their messages aren't numbered
+yet, new chats get 0. Messages inserted without seq, by app instances that
+don't write it, get the next seq of their chat if it's numbered already,
+otherwise the backfill numbers them. Idempotency responses stored without
+seq get seq of their message.
+
+Deploy app that writes seq after the backfill, run the contract once
+no instance of the old app is left.
+
+Revision ID: d5a9e3c7f1b2
+Revises: c2d8e4f6a178
+Create Date: 2026-10-19 09:40:12.583027
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a9e3c7f1b2"
+down_revision: Union[str, Sequence[str], None] = "c2d8e4f6a178"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # without default existing rows stay NULL, no table rewrite
+    op.execute("ALTER TABLE chats ADD COLUMN last_seq BIGINT")
+    op.execute("ALTER TABLE chats ALTER COLUMN last_seq SET DEFAULT 0")
+    op.execute("ALTER TABLE messages ADD COLUMN seq BIGINT")
+    # NOT VALID is instant, validated by the contract,
+    # lets its SET NOT NULL skip the full table scan
+    op.execute(
+        "ALTER TABLE chats ADD CONSTRAINT chats_last_seq_not_null "
+        "CHECK (last_seq IS NOT NULL) NOT VALID"
+    )
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_seq_not_null "
+        "CHECK (seq IS NOT NULL) NOT VALID"
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION messages_assign_seq() RETURNS trigger AS $$
+        DECLARE
+            chat_last_seq BIGINT;
+        BEGIN
+            IF NEW.seq IS NULL THEN
+                -- the lock keeps the backfill of the chat waiting till commit,
+                -- so it sees this message
+                SELECT last_seq INTO chat_last_seq
+                FROM chats WHERE id = NEW.chat_id FOR UPDATE;
+                IF chat_last_seq IS NOT NULL THEN
+                    UPDATE chats SET last_seq = last_seq + 1 WHERE id = NEW.chat_id
+                    RETURNING last_seq INTO NEW.seq;
+                END IF;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER messages_assign_seq BEFORE INSERT ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION messages_assign_seq()"
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION idempotency_keys_add_seq() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.response::jsonb -> 'seq' IS NULL THEN
+                NEW.response := (
+                    NEW.response::jsonb || jsonb_build_object(
+                        'seq', (SELECT seq FROM messages WHERE id = NEW.message_id)
+                    )
+                )::text;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER idempotency_keys_add_seq BEFORE INSERT ON idempotency_keys "
+        "FOR EACH ROW EXECUTE FUNCTION idempotency_keys_add_seq()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # triggers and constraints are already gone when downgrading after contract
+    op.execute("DROP TRIGGER IF EXISTS idempotency_keys_add_seq ON idempotency_keys")
+    op.execute("DROP FUNCTION IF EXISTS idempotency_keys_add_seq()")
+    op.execute("DROP TRIGGER IF EXISTS messages_assign_seq ON messages")
+    op.execute("DROP FUNCTION IF EXISTS messages_assign_seq()")
+    op.execute("ALTER TABLE messages DROP COLUMN seq")
+    op.execute("ALTER TABLE chats DROP COLUMN last_seq")
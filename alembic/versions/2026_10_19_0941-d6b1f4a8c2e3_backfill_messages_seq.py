@@ -0,0 +1,99 @@
+"""backfill: number existing messages per chat
+
+Online numbering of messages, step 2 of 3, see d5a9e3c7f1b2.
+Runs outside of transaction: chats are numbered in small committed batches,
+each chat at once, so writes to a chat wait only for its batch.
+
+Revision ID: d6b1f4a8c2e3
+Revises: d5a9e3c7f1b2
+Create Date: 2026-10-19 09:41:27.350912
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d6b1f4a8c2e3"
+down_revision: Union[str, Sequence[str], None] = "d5a9e3c7f1b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHAT_BATCH_SIZE = 1_000
+KEY_BATCH_SIZE = 10_000
+
+# every statement of a plpgsql function takes a new snapshot, so numbering
+# sees messages committed while it waited for the locks of the chats
+NUMBER_CHATS = """
+    CREATE FUNCTION messages_backfill_seq(batch_size INTEGER) RETURNS INTEGER AS $$
+    DECLARE
+        batch BIGINT[];
+    BEGIN
+        SELECT array_agg(id) INTO batch FROM (
+            SELECT id FROM chats WHERE last_seq IS NULL
+            ORDER BY id LIMIT batch_size FOR UPDATE
+        ) locked;
+        IF batch IS NULL THEN
+            RETURN 0;
+        END IF;
+
+        UPDATE messages m SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY chat_id ORDER BY created_at, id
+            ) AS seq
+            FROM messages
+            WHERE chat_id = ANY(batch)
+        ) numbered
+        WHERE m.id = numbered.id;
+
+        UPDATE chats c SET last_seq = coalesce(
+            (SELECT max(seq) FROM messages WHERE chat_id = c.id), 0
+        )
+        WHERE c.id = ANY(batch);
+        RETURN cardinality(batch);
+    END
+    $$ LANGUAGE plpgsql
+"""
+# responses of messages inserted before numbering of their chats
+ADD_KEYS_SEQ = f"""
+    UPDATE idempotency_keys k
+    SET response = (k.response::jsonb || jsonb_build_object('seq', m.seq))::text
+    FROM messages m
+    WHERE m.id = k.message_id AND k.id IN (
+        SELECT id FROM idempotency_keys
+        WHERE jsonb_typeof(response::jsonb -> 'seq') IS DISTINCT FROM 'number'
+        LIMIT {KEY_BATCH_SIZE}
+    )
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    op.execute(NUMBER_CHATS)
+    with op.get_context().autocommit_block():
+        if op.get_context().as_sql:
+            # offline script can't loop, DBA batches it by hand if needed
+            op.execute(
+                "DO $$ BEGIN "
+                f"WHILE messages_backfill_seq({CHAT_BATCH_SIZE}) > 0 LOOP END LOOP; "
+                "END $$"
+            )
+            op.execute(ADD_KEYS_SEQ.replace(f"LIMIT {KEY_BATCH_SIZE}", ""))
+        else:
+            number_chats = sa.text(f"SELECT messages_backfill_seq({CHAT_BATCH_SIZE})")
+            while connection.scalar(number_chats):
+                pass
+            while connection.execute(sa.text(ADD_KEYS_SEQ)).rowcount:
+                pass
+    op.execute("DROP FUNCTION messages_backfill_seq(INTEGER)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # numbers stay, expand's downgrade drops them
+    pass
@@ -0,0 +1,55 @@
+"""contract: unique messages seq, NOT NULL seq columns
+
+Online numbering of messages, step 3 of 3, see d5a9e3c7f1b2.
+Run once every app instance writes seq. The unique index is built
+concurrently, NOT NULL is proven by the validated check constraints,
+so tables are locked only for catalog changes.
+
+Revision ID: d7c3a5e9b4f1
+Revises: d6b1f4a8c2e3
+Create Date: 2026-10-19 09:42:05.918264
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7c3a5e9b4f1"
+down_revision: Union[str, Sequence[str], None] = "d6b1f4a8c2e3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> column made NOT NULL
+SEQ_COLUMNS = {"chats": "last_seq", "messages": "seq"}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_messages_chat_id_seq "
+            "ON messages (chat_id, seq)"
+        )
+        for table, column in SEQ_COLUMNS.items():
+            op.execute(
+                f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_not_null"
+            )
+
+    op.execute("DROP TRIGGER idempotency_keys_add_seq ON idempotency_keys")
+    op.execute("DROP FUNCTION idempotency_keys_add_seq()")
+    op.execute("DROP TRIGGER messages_assign_seq ON messages")
+    op.execute("DROP FUNCTION messages_assign_seq()")
+    for table, column in SEQ_COLUMNS.items():
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_not_null")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # offline, app instances that don't write seq aren't served by triggers
+    op.drop_index("ux_messages_chat_id_seq", table_name="messages")
+    for table, column in SEQ_COLUMNS.items():
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL")
@@ -2,4 +2,4 @@ echo "Running database migrations..."
 alembic upgrade head
 
 echo "Starting application..."
-uvicorn app.app:app --host 0.0.0.0 --port 8000
+uvicorn app.app:create_app --factory --host 0.0.0.0 --port 8000
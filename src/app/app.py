@@ -1,20 +1,178 @@
-from fastapi import FastAPI
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.middlewares import (
+    AdmissionControlMiddleware,
+    CompressionMiddleware,
+    DBStatsMiddleware,
+    ProfilingMiddleware,
+    admission_limiter,
+    profiler,
+)
 from app.routers import router as api_router
+from app.routers.api.profiling import router as profiling_router
+from app.services import (
+    ArchiveService,
+    ChatService,
+    IdempotencyService,
+    WarmupService,
+)
+from app.services.outbox import outbox_dispatcher
+from core import (
+    BucketFrozen,
+    ShardMap,
+    ShardSessions,
+    get_logger,
+    settings,
+    shard_map,
+)
+from core.worker_lease import lease_worker_id
 
-app = FastAPI()
+logger = get_logger(__name__)
 
 origins = [
     "http://localhost:3000",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-app.include_router(api_router)
+async def bucket_frozen_handler(request: Request, exc: BucketFrozen):
+    # the move takes a few map reload intervals
+    retry_after = max(1, math.ceil(settings.shards.reload_interval))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Chat is being moved, retry later"},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def make_lifespan(shards: ShardMap):
+    """
+    Lifespan leasing worker id, warming up shards and running
+    background tasks, which are cancelled on shutdown
+
+    Args:
+        shards: ShardMap - shards to warm up on startup and dispose on shutdown
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        app.state.ready = False
+        # fails startup unless this process gets a unique worker id
+        lease = await lease_worker_id(shards.shards[min(shards.shards)].url)
+        shard_sessions = ShardSessions(shards)
+        try:
+            # archived chats couldn't be read by this process otherwise
+            await ArchiveService.check_segments(shard_sessions)
+        except BaseException:
+            if lease is not None:
+                await lease.release()
+            raise
+        finally:
+            await shard_sessions.close()
+        tasks = []
+        if settings.warmup.enabled:
+            started = time.perf_counter()
+            await WarmupService.warm_up(app, shards, settings.warmup.min_connections)
+            logger.info(f"Warmed up in {time.perf_counter() - started:.3f}s")
+        tasks.append(
+            asyncio.create_task(
+                ChatService.flush_read_markers_every(
+                    shards, settings.read_state.flush_interval
+                )
+            )
+        )
+        tasks.append(
+            asyncio.create_task(
+                IdempotencyService.purge_expired_every(
+                    shards, settings.idempotency.purge_interval
+                )
+            )
+        )
+        if settings.outbox.enabled:
+            # events left on shutdown are claimed by the next start
+            # or another process
+            tasks.append(
+                asyncio.create_task(
+                    outbox_dispatcher.run(shards, settings.outbox.poll_interval)
+                )
+            )
+        app.state.ready = True
+        yield
+        app.state.ready = False
+        for task in tasks:
+            task.cancel()
+        # a flush cancelled mid-write puts its positions back for the last one
+        await asyncio.gather(*tasks, return_exceptions=True)
+        shard_sessions = ShardSessions(shards)
+        try:
+            await ChatService.flush_read_markers(shard_sessions)
+        finally:
+            try:
+                await shard_sessions.close()
+                await shards.dispose()
+            finally:
+                if lease is not None:
+                    await lease.release()
+
+    return lifespan
+
+
+def create_app(shards: ShardMap = shard_map) -> FastAPI:
+    """
+    Build the app. Engines are created and warmed up by its lifespan,
+    readiness probe passes once that's done.
+
+    Args:
+        shards: ShardMap - shards to warm up on startup and dispose on shutdown
+
+    Returns:
+        FastAPI - the app
+    """
+
+    app = FastAPI(lifespan=make_lifespan(shards))
+
+    if settings.profiling.enabled:
+        app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    app.add_middleware(DBStatsMiddleware)
+    if settings.compression.enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression.minimum_size,
+            gzip_level=settings.compression.gzip_level,
+            zstd_level=settings.compression.zstd_level,
+        )
+    if settings.admission.enabled:
+        app.add_middleware(
+            AdmissionControlMiddleware,
+            limiter=admission_limiter,
+            timeout=settings.admission.request_timeout,
+        )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+
+    app.include_router(api_router)
+    if settings.profiling.enabled:
+        app.include_router(profiling_router, prefix="/api")
+    app.add_exception_handler(BucketFrozen, bucket_frozen_handler)
+    return app
+
+
+def __getattr__(name: str) -> FastAPI:
+    # app.app:app keeps working for tools not calling the factory
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,15 @@
+__all__ = (
+    "AdaptiveLimiter",
+    "AdmissionControlMiddleware",
+    "CompressionMiddleware",
+    "DBStatsMiddleware",
+    "Profiler",
+    "ProfilingMiddleware",
+    "admission_limiter",
+    "profiler",
+)
+
+from .admission import AdaptiveLimiter, AdmissionControlMiddleware, admission_limiter
+from .compression import CompressionMiddleware
+from .db_stats import DBStatsMiddleware
+from .profiling import Profiler, ProfilingMiddleware, profiler
@@ -0,0 +1,241 @@
+import asyncio
+import math
+import time
+from collections import deque
+from enum import Enum
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import get_logger, settings
+
+logger = get_logger(__name__)
+
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+# paths never shed, so overload stays observable
+EXEMPT_PREFIXES = (
+    "/api/admin",
+    "/api/health",
+    "/api/metrics",
+    "/docs",
+    "/openapi.json",
+)
+
+
+class Priority(str, Enum):
+    """Priority classes, waiting writes are admitted before waiting reads"""
+
+    write = "write"
+    read = "read"
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter with AIMD limit: the limit grows by 1/limit
+    per request faster than target_latency and shrinks by backoff
+    per slower one. Requests over the limit wait in bounded per-priority
+    queues for at most max_wait seconds, otherwise they are shed.
+
+    Args:
+        initial_limit: int - starting concurrency limit
+        min_limit: int - limit never goes below
+        max_limit: int - limit never goes above
+        target_latency: float - seconds to response start considered healthy
+        max_queue: int - waiting requests per priority
+        max_wait: float - seconds a request may wait for a slot
+        backoff: float - limit multiplier on slow request
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        max_queue: int,
+        max_wait: float,
+        backoff: float = 0.9,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.in_flight = 0
+        self._queues: dict[Priority, deque[asyncio.Future]] = {
+            priority: deque() for priority in Priority
+        }
+        self.admitted = {priority: 0 for priority in Priority}
+        self.shed = {priority: 0 for priority in Priority}
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.max_wait))
+
+    async def acquire(self, priority: Priority) -> bool:
+        """
+        Take a slot, waiting for it in priority's queue if needed
+
+        Returns:
+            bool - False if request must be shed
+        """
+
+        if self.in_flight < int(self.limit) and not any(self._queues.values()):
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return True
+
+        queue = self._queues[priority]
+        if len(queue) >= self.max_queue:
+            self.shed[priority] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except TimeoutError:
+            self._discard(queue, waiter)
+            if not (waiter.done() and not waiter.cancelled()):
+                self.shed[priority] += 1
+                return False
+            # slot was handed over just as the wait timed out, it's taken
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # slot was handed over, but nobody is going to use it
+                self.release()
+            self._discard(queue, waiter)
+            raise
+        self.admitted[priority] += 1
+        return True
+
+    def release(self, latency: float | None = None) -> None:
+        """
+        Free a slot and adapt the limit
+
+        Args:
+            latency: float | None - seconds to response start, None if unknown
+        """
+
+        self.in_flight -= 1
+        if latency is not None:
+            if latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": {
+                priority: len(queue) for priority, queue in self._queues.items()
+            },
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+        }
+
+    def _wake(self) -> None:
+        while self.in_flight < int(self.limit):
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    return waiter
+        return None
+
+    @staticmethod
+    def _discard(queue: deque[asyncio.Future], waiter: asyncio.Future) -> None:
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+
+admission_limiter = AdaptiveLimiter(
+    initial_limit=settings.admission.initial_limit,
+    min_limit=settings.admission.min_limit,
+    max_limit=settings.admission.max_limit,
+    target_latency=settings.admission.target_latency,
+    max_queue=settings.admission.max_queue,
+    max_wait=settings.admission.max_wait,
+)
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds requests over the limiter's capacity with 503 and Retry-After,
+    before they wait for a db connection. Admitted requests that haven't
+    started their response by the deadline are cancelled with 503 too.
+
+    Args:
+        app: ASGIApp - downstream app
+        limiter: AdaptiveLimiter - limiter admitting requests
+        timeout: float | None - seconds from arrival to response start,
+            queue wait included, streamed bodies aren't limited; None for no limit
+    """
+
+    def __init__(
+        self, app: ASGIApp, limiter: AdaptiveLimiter, timeout: float | None = None
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.timeout = timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        priority = Priority.read if scope["method"] in READ_METHODS else Priority.write
+        if not await self.limiter.acquire(priority):
+            logger.warning(f"Shedding {scope['method']} {scope['path']}")
+            await self._reject(scope, receive, send, "Server is overloaded")
+            return
+
+        started = time.monotonic()
+        latency = None
+        timeout = asyncio.timeout_at(deadline)
+
+        async def send_measuring(message: Message) -> None:
+            nonlocal latency
+            if message["type"] == "http.response.start":
+                # streamed bodies must not count as slowness
+                latency = time.monotonic() - started
+                timeout.reschedule(None)
+            await send(message)
+
+        try:
+            async with timeout:
+                await self.app(scope, receive, send_measuring)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            latency = time.monotonic() - started
+            logger.warning(f"Deadline exceeded by {scope['method']} {scope['path']}")
+            await self._reject(scope, receive, send, "Request took too long")
+        finally:
+            self.limiter.release(latency)
+
+    async def _reject(
+        self, scope: Scope, receive: Receive, send: Send, reason: str
+    ) -> None:
+        response = JSONResponse(
+            {"detail": f"{reason}, retry later"},
+            status_code=503,
+            headers={"Retry-After": str(self.limiter.retry_after)},
+        )
+        await response(scope, receive, send)
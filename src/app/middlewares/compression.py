@@ -0,0 +1,151 @@
+import zlib
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # optional, responses are gzipped only without it
+    zstandard = None
+
+
+class Encoder(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes:
+        """Compressed data so far, decodable by the client right away"""
+
+    def finish(self) -> bytes: ...
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Returns:
+        str | None - zstd or gzip, whichever client accepts,
+        zstd preferred, None if neither
+    """
+
+    accepted = set()
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        key, _, value = params.strip().partition("=")
+        try:
+            if key == "q" and float(value) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with zstd or gzip, as negotiated by Accept-Encoding.
+    Whole bodies smaller than minimum_size are sent as they are.
+    Streamed bodies are compressed chunk by chunk, every chunk is flushed,
+    so clients can decode it without waiting for the rest.
+
+    Args:
+        app: ASGIApp - wrapped app
+        minimum_size: int - bytes of whole body worth compressing
+        gzip_level: int - gzip compression level, 1-9
+        zstd_level: int - zstd compression level, 1-22
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        encoder: Encoder | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                # first body chunk decides whether response is compressed
+                headers = MutableHeaders(scope=start)
+                headers.add_vary_header("Accept-Encoding")
+                if "content-encoding" in headers or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                encoder = (
+                    ZstdEncoder(self.levels["zstd"])
+                    if encoding == "zstd"
+                    else GzipEncoder(self.levels["gzip"])
+                )
+                headers["Content-Encoding"] = encoding
+                del headers["Content-Length"]
+                await send(start)
+                start = None
+
+            if encoder is None:
+                await send(message)
+                return
+            data = encoder.compress(body)
+            data += encoder.flush() if more_body else encoder.finish()
+            await send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
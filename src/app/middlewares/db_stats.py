@@ -0,0 +1,58 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import DBStats, StatementBudgetExceeded, get_logger, settings, track_db_stats
+
+logger = get_logger(__name__)
+
+
+class DBStatsMiddleware:
+    """
+    Counts SQL statements and db time of every request.
+
+    Adds them to the Server-Timing response header, logs them and checks
+    them against the budget declared on the route with statement_budget.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.db_stats.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        with track_db_stats() as stats:
+
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing())
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        self.check_budget(scope, stats)
+
+    @staticmethod
+    def check_budget(scope: Scope, stats: DBStats) -> None:
+        route = f"{scope['method']} {scope['path']}"
+        logger.info(
+            f"{route}: {stats.statements} statements, {stats.duration_ms:.2f} ms in db"
+        )
+
+        budget = getattr(scope.get("endpoint"), "statement_budget", None)
+        if budget is None:
+            return
+        # scatter-gather routes run their statements on every shard involved
+        shards = max(len(stats.engines), 1)
+        if stats.statements <= budget * shards:
+            return
+
+        detail = (
+            f"{route} executed {stats.statements} statements on {shards} shards, "
+            f"budget is {budget} per shard"
+        )
+        if settings.db_stats.strict_budget:
+            raise StatementBudgetExceeded(detail)
+        logger.warning(detail)
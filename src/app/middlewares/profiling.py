@@ -0,0 +1,277 @@
+import asyncio
+import cProfile
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from enum import Enum
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core import get_logger, settings
+
+logger = get_logger(__name__)
+
+# profiling routes, never profiled themselves
+ADMIN_PREFIX = "/api/admin"
+# frames kept per sampled stack, the outermost ones are dropped
+MAX_STACK_DEPTH = 128
+# allocation sites in report
+TOP_ALLOCATIONS = 20
+
+
+class ProfileMode(str, Enum):
+    # stacks of the event loop thread sampled by another thread
+    sample = "sample"
+    # every call on the event loop thread traced by cProfile
+    cprofile = "cprofile"
+
+
+class ProfileSession:
+    """
+    Profiles the worker while the next requests are served, stops
+    after that many requests finish or after max_duration seconds.
+    Event loop lag is probed all along, allocations are traced if memory.
+
+    Args:
+        mode: ProfileMode - how CPU time is profiled
+        requests: int - requests to profile
+        memory: bool - trace allocations with tracemalloc
+        sample_interval: float - seconds between stack samples
+        lag_interval: float - seconds between event loop lag probes
+        max_duration: float - seconds the session runs at most
+        tracemalloc_frames: int - frames kept per traced allocation
+    """
+
+    def __init__(
+        self,
+        mode: ProfileMode,
+        requests: int,
+        memory: bool,
+        sample_interval: float,
+        lag_interval: float,
+        max_duration: float,
+        tracemalloc_frames: int,
+    ):
+        self.mode = mode
+        self.requests = requests
+        self.memory = memory
+        self.sample_interval = sample_interval
+        self.lag_interval = lag_interval
+        self.max_duration = max_duration
+        self.tracemalloc_frames = tracemalloc_frames
+
+        self.started_requests = 0
+        self.finished_requests = 0
+        self.done = False
+        self.stacks: Counter[str] = Counter()
+        self.lags: list[float] = []
+        self.allocations: list[tracemalloc.Statistic] = []
+        self.stats: pstats.Stats | None = None
+
+        self._started_at = 0.0
+        self._finished_at: float | None = None
+        self._loop_thread_id = 0
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._profile: cProfile.Profile | None = None
+        self._lag_probe: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start profiling, must be called on the event loop thread"""
+
+        self._started_at = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        if self.memory:
+            tracemalloc.start(self.tracemalloc_frames)
+        if self.mode == ProfileMode.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = threading.Thread(
+                target=self._sample, name="profile-sampler", daemon=True
+            )
+            self._sampler.start()
+        self._lag_probe = asyncio.create_task(self._probe_loop_lag())
+        logger.info(f"Profiling next {self.requests} requests, {self.mode.value} mode")
+
+    def stop(self) -> None:
+        """Stop profiling and collect results, must be called on the loop thread"""
+
+        if self.done:
+            return
+        self.done = True
+        self._finished_at = time.monotonic()
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._profile is not None:
+            self._profile.disable()
+            self.stats = pstats.Stats(self._profile)
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            tracemalloc.stop()
+            self.allocations = snapshot.statistics("traceback")
+        if (
+            self._lag_probe is not None
+            and self._lag_probe is not asyncio.current_task()
+        ):
+            self._lag_probe.cancel()
+        logger.info(
+            f"Profiled {self.finished_requests} requests in {self.duration:.3f}s"
+        )
+
+    def request_started(self) -> bool:
+        """
+        Returns:
+            bool - whether the request is one of the profiled ones
+        """
+
+        if self.done or self.started_requests >= self.requests:
+            return False
+        self.started_requests += 1
+        return True
+
+    def request_finished(self) -> None:
+        self.finished_requests += 1
+        if self.finished_requests >= self.requests:
+            self.stop()
+
+    @property
+    def duration(self) -> float:
+        return (self._finished_at or time.monotonic()) - self._started_at
+
+    def report(self) -> dict:
+        lags = sorted(self.lags)
+        return {
+            "mode": self.mode,
+            "done": self.done,
+            "requests": self.requests,
+            "profiled_requests": self.finished_requests,
+            "duration": self.duration,
+            "samples": self.stacks.total() if self.done else None,
+            "loop_lag": {
+                "probes": len(lags),
+                "mean_ms": sum(lags) / len(lags) * 1000 if lags else 0.0,
+                "p99_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+                "max_ms": lags[-1] * 1000 if lags else 0.0,
+            },
+            "allocations": [
+                {
+                    "trace": str(stat.traceback[-1]),
+                    "size_kb": stat.size / 1024,
+                    "count": stat.count,
+                }
+                for stat in self.allocations[:TOP_ALLOCATIONS]
+            ],
+        }
+
+    def folded_stacks(self) -> str:
+        """
+        Returns:
+            str - sampled stacks in folded format, one "frame;frame;... count"
+            line per stack, input of flamegraph.pl, speedscope and the like
+        """
+
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def folded_allocations(self) -> str:
+        """
+        Returns:
+            str - live allocations in folded format weighted by bytes
+        """
+
+        return "".join(
+            ";".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+            + f" {stat.size}\n"
+            for stat in self.allocations
+        )
+
+    def pstats_dump(self) -> bytes:
+        """
+        Returns:
+            bytes - cProfile stats, same as pstats.Stats.dump_stats writes
+        """
+
+        return marshal.dumps(self.stats.stats)
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            frames = []
+            while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    async def _probe_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self.done:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lags.append(max(0.0, loop.time() - started - self.lag_interval))
+            if self.duration >= self.max_duration:
+                self.stop()
+
+
+class Profiler:
+    """Holds the worker's one profiling session, running or last finished"""
+
+    def __init__(self):
+        self.session: ProfileSession | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.session is not None and not self.session.done
+
+    def start(self, mode: ProfileMode, requests: int, memory: bool) -> ProfileSession:
+        self.session = ProfileSession(
+            mode,
+            requests,
+            memory,
+            sample_interval=settings.profiling.sample_interval,
+            lag_interval=settings.profiling.loop_lag_interval,
+            max_duration=settings.profiling.max_duration,
+            tracemalloc_frames=settings.profiling.tracemalloc_frames,
+        )
+        self.session.start()
+        return self.session
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """
+    Counts requests of the running profiling session, stopping it
+    after the last one. Added to the app only if profiling is enabled.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        session = self.profiler.session
+        if (
+            scope["type"] != "http"
+            or session is None
+            or scope["path"].startswith(ADMIN_PREFIX)
+            or not session.request_started()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.request_finished()
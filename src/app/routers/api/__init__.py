@@ -3,6 +3,12 @@ __all__ = ("router",)
 from fastapi import APIRouter
 
 from .chat import router as chats_router
+from .health import router as health_router
+from .metrics import router as metrics_router
+from .sync import router as sync_router
 
 router = APIRouter(prefix="/api", tags=["api"])
 router.include_router(chats_router)
+router.include_router(health_router)
+router.include_router(metrics_router)
+router.include_router(sync_router)
@@ -0,0 +1,22 @@
+import hmac
+from collections.abc import Awaitable, Callable
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(get_token: Callable[[], str | None]) -> Callable[..., Awaitable]:
+    """
+    Args:
+        get_token: Callable[[], str | None] - returns X-Admin-Token expected,
+            read on every request, requests are refused to everyone if None
+
+    Returns:
+        Callable[..., Awaitable] - dependency raising 403 on wrong token
+    """
+
+    async def dependency(x_admin_token: str = Header("")) -> None:
+        token = get_token()
+        if not token or not hmac.compare_digest(x_admin_token, token):
+            raise HTTPException(status_code=403, detail="Admin token required")
+
+    return dependency
@@ -1,54 +1,246 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 
-from core import db_helper, get_logger
-from app.services import ChatService
-from app.schemas.chat import ChatCreate, ChatResponse, ChatWithMessages
+from core import ShardSessions, get_logger, settings, shard_map, statement_budget
+from app.services import ChatService, IdempotencyService, ImportService
+from app.services.encoding import (
+    ResponseFormat,
+    encode,
+    encoded_response,
+    msgpack,
+)
+from app.services.export import SERIALIZERS, ExportFormat
+from app.services.importer import iter_lines
+from app.schemas.chat import (
+    ChatBatchGet,
+    ChatBatchResponse,
+    ChatCreate,
+    ChatResponse,
+    ChatWithMessages,
+)
+from app.schemas.ids import MAX_BIGINT
+from app.schemas.imports import ImportReport
 from app.schemas.message import MessageCreate, MessageResponse
+from app.schemas.read_state import (
+    ReadMark,
+    ReadStateBatchGet,
+    ReadStateBatchResponse,
+    ReadStateResponse,
+)
+from .admin import require_admin
 
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/chats", tags=["chats"])
 
+# routes answering with MessagePack too, by Accept header
+NEGOTIATED_RESPONSES = {200: {"content": {ResponseFormat.msgpack.media_type: {}}}}
+
 
 @router.post("", response_model=ChatResponse, status_code=status.HTTP_201_CREATED)
+@statement_budget(2)
 async def create_new_chat(
     chat_in: ChatCreate,
-    session: AsyncSession = Depends(db_helper.session_dependency),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
 ):
     logger.debug("Creating a new chat via ChatService.create_chat")
-    chat = await ChatService.create_chat(session, chat_in.title)
+    chat = await ChatService.create_chat(shards, chat_in.title)
     return ChatResponse.model_validate(chat)
 
 
-@router.get("/{chat_id}", response_model=ChatWithMessages)
+@router.post(
+    ":batchGet", response_model=ChatBatchResponse, responses=NEGOTIATED_RESPONSES
+)
+@statement_budget(2)
+async def batch_get_chats(
+    batch_in: ChatBatchGet,
+    accept: str | None = Header(None),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    chat_ids = list(dict.fromkeys(batch_in.chat_ids))
+    logger.debug(
+        f"Getting details for {len(chat_ids)} chats "
+        "via ChatService.get_recent_messages_batch"
+    )
+    chats = {chat.id: chat for chat in await ChatService.get_chats(shards, chat_ids)}
+    messages = await ChatService.get_recent_messages_batch(
+        shards, list(chats), batch_in.limit, chats
+    )
+
+    batch = ChatBatchResponse(
+        chats=[
+            ChatWithMessages(
+                chat=ChatResponse.model_validate(chats[chat_id]),
+                messages=[
+                    MessageResponse.model_validate(msg)
+                    for msg in messages.get(chat_id, [])
+                ],
+            )
+            for chat_id in chat_ids
+            if chat_id in chats
+        ],
+        not_found=[chat_id for chat_id in chat_ids if chat_id not in chats],
+    )
+    response_format = ResponseFormat.from_accept(accept)
+    return encoded_response(encode(batch, response_format), response_format)
+
+
+@router.post(":batchReadStates", response_model=ReadStateBatchResponse)
+@statement_budget(1)
+async def batch_get_read_states(
+    batch_in: ReadStateBatchGet,
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    """Reader's positions and unread counts in several chats"""
+
+    chat_ids = list(dict.fromkeys(batch_in.chat_ids))
+    logger.debug(
+        f"Getting read states in {len(chat_ids)} chats "
+        "via ChatService.get_read_states"
+    )
+    read_states = await ChatService.get_read_states(
+        shards, chat_ids, batch_in.reader_id
+    )
+    found = {read_state.chat_id for read_state in read_states}
+    return ReadStateBatchResponse(
+        read_states=read_states,
+        not_found=[chat_id for chat_id in chat_ids if chat_id not in found],
+    )
+
+
+@router.post(
+    "/import",
+    response_model=ImportReport,
+    dependencies=[Depends(require_admin(lambda: settings.imports.admin_token))],
+)
+async def import_chats(
+    request: Request,
+    start_line: int = Query(0, ge=0),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    """
+    Import chats and messages from NDJSON request body, admins only.
+    Pass next_line of an interrupted import as start_line to resume it.
+    """
+
+    logger.debug(
+        f"Importing chats from line {start_line} via ImportService.import_ndjson"
+    )
+    return await ImportService.import_ndjson(
+        shards, iter_lines(request.stream()), start_line
+    )
+
+
+@router.get(
+    "/{chat_id}", response_model=ChatWithMessages, responses=NEGOTIATED_RESPONSES
+)
+@statement_budget(2)
 async def get_chat_detail(
     chat_id: int,
     limit: int = Query(20, ge=1, le=100),
-    session: AsyncSession = Depends(db_helper.session_dependency),
+    accept: str | None = Header(None),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    logger.debug(
+        f"Getting a details for chat with id: {chat_id} via ChatService.get_chat_detail"
+    )
+    response_format = ResponseFormat.from_accept(accept)
+    detail = await ChatService.get_chat_detail(shards, chat_id, limit, response_format)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    # already serialized, possibly shared with concurrent requests
+    return encoded_response(detail, response_format)
+
+
+@router.get("/{chat_id}/export", response_class=StreamingResponse)
+@statement_budget(2)
+async def export_chat(
+    chat_id: int,
+    format: ExportFormat | None = Query(
+        None, description="by Accept header if not set, ndjson or msgpack"
+    ),
+    accept: str | None = Header(None),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
 ):
+    if format is None:
+        if ResponseFormat.from_accept(accept) == ResponseFormat.msgpack:
+            format = ExportFormat.msgpack
+        else:
+            format = ExportFormat.ndjson
+    elif format == ExportFormat.msgpack and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack is not available")
+
     logger.debug(
-        f"Getting a details for chat with id: {chat_id} via ChatService.get_chat"
+        f"Exporting chat with id: {chat_id} as {format.value} "
+        "via ChatService.stream_messages"
     )
-    chat = await ChatService.get_chat(session, chat_id)
+    chat = await ChatService.get_chat(shards, chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    messages = await ChatService.get_recent_messages(session, chat_id, limit)
+    batches = ChatService.stream_messages(shards, chat_id, chat)
+    return StreamingResponse(
+        SERIALIZERS[format](batches),
+        media_type=format.media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="chat_{chat_id}.{format.value}"'
+            ),
+            "Vary": "Accept",
+        },
+    )
+
+
+@router.put("/{chat_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+@statement_budget(0)
+async def mark_chat_read(
+    mark_in: ReadMark, chat_id: int = Path(..., ge=0, le=MAX_BIGINT)
+):
+    """
+    Move reader's position in chat forward. Written to db in bulk
+    within READ_STATE_FLUSH_INTERVAL, positions in unknown chats are dropped.
+    """
+
+    logger.debug(f"Marking chat with id: {chat_id} read via ChatService.mark_read")
+    ChatService.mark_read(chat_id, mark_in.reader_id, mark_in.seq)
 
-    return ChatWithMessages(
-        chat=ChatResponse.model_validate(chat),
-        messages=[MessageResponse.model_validate(msg) for msg in messages],
+
+@router.get("/{chat_id}/read", response_model=ReadStateResponse)
+@statement_budget(1)
+async def get_read_state(
+    chat_id: int,
+    reader_id: int = Query(..., ge=0, le=MAX_BIGINT),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    logger.debug(
+        f"Getting read state in chat with id: {chat_id} "
+        "via ChatService.get_read_states"
     )
+    read_states = await ChatService.get_read_states(shards, [chat_id], reader_id)
+    if not read_states:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return read_states[0]
 
 
 @router.delete("/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
+@statement_budget(4)
 async def remove_chat(
     chat_id: int,
-    session: AsyncSession = Depends(db_helper.session_dependency),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
 ):
     logger.debug(f"Deleting a chat with id: {chat_id} via ChatService.delete_chat")
-    await ChatService.delete_chat(session, chat_id)
+    await ChatService.delete_chat(shards, chat_id)
 
 
 @router.post(
@@ -56,13 +248,28 @@ async def remove_chat(
     response_model=MessageResponse,
     status_code=status.HTTP_201_CREATED,
 )
+@statement_budget(5)
 async def send_message_to_chat(
     chat_id: int,
     message_in: MessageCreate,
-    session: AsyncSession = Depends(db_helper.session_dependency),
+    response: Response,
+    idempotency_key: str | None = Header(None, min_length=1, max_length=255),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
 ):
+    if idempotency_key is not None:
+        logger.debug(
+            f"Sending a message to a chat with id: {chat_id} "
+            "via IdempotencyService.create_message"
+        )
+        message, replayed = await IdempotencyService.create_message(
+            shards, chat_id, message_in.text, idempotency_key
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return message
+
     logger.debug(
         f"Sending a message to a chat with id: {chat_id} via ChatService.create_message"
     )
-    message = await ChatService.create_message(session, chat_id, message_in.text)
+    message = await ChatService.create_message(shards, chat_id, message_in.text)
     return MessageResponse.model_validate(message)
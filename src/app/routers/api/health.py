@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.schemas import HealthStatus
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live", response_model=HealthStatus)
+async def live():
+    return HealthStatus(status="ok")
+
+
+@router.get(
+    "/ready",
+    response_model=HealthStatus,
+    responses={503: {"model": HealthStatus}},
+)
+async def ready(request: Request):
+    """Ready once lifespan startup, with warm-up, is done"""
+
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return HealthStatus(status="ready")
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends
+
+from app.middlewares import admission_limiter
+from app.schemas.metrics import AdmissionStats, HotTailStats, OutboxStats
+from app.services import OutboxService
+from app.services.chat import hot_tail
+from app.services.outbox import outbox_dispatcher
+from core import ShardSessions, shard_map
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/hot-tail", response_model=HotTailStats)
+async def get_hot_tail_stats():
+    return HotTailStats(**hot_tail.stats())
+
+
+@router.get("/admission", response_model=AdmissionStats)
+async def get_admission_stats():
+    return AdmissionStats(**admission_limiter.stats())
+
+
+@router.get("/outbox", response_model=OutboxStats)
+async def get_outbox_stats(
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    """
+    Events waiting for dispatch and how long they wait. Lag is the time
+    from commit to handled, pending age the wait of the oldest one.
+    """
+
+    backlog = await OutboxService.get_backlog(shards)
+    return OutboxStats(**backlog, **outbox_dispatcher.stats())
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse, Response
+
+from app.middlewares import profiler
+from app.middlewares.profiling import ProfileMode, ProfileSession
+from app.schemas import ProfileReport, ProfileStart
+from core import get_logger, settings
+from .admin import require_admin
+
+logger = get_logger(__name__)
+
+
+router = APIRouter(
+    prefix="/admin/profile",
+    tags=["admin"],
+    dependencies=[Depends(require_admin(lambda: settings.profiling.admin_token))],
+)
+
+
+def get_finished_session() -> ProfileSession:
+    session = profiler.session
+    if session is None:
+        raise HTTPException(status_code=404, detail="Nothing was profiled")
+    if not session.done:
+        raise HTTPException(status_code=409, detail="Profiling is still running")
+    return session
+
+
+@router.post("", response_model=ProfileReport, status_code=status.HTTP_202_ACCEPTED)
+async def start_profile(profile_in: ProfileStart):
+    """Profile this worker while it serves the next requests"""
+
+    if profiler.active:
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+    logger.debug(f"Starting profiling via profiler.start: {profile_in}")
+    session = profiler.start(profile_in.mode, profile_in.requests, profile_in.memory)
+    return ProfileReport(**session.report())
+
+
+@router.get("", response_model=ProfileReport)
+async def get_profile():
+    if profiler.session is None:
+        raise HTTPException(status_code=404, detail="Nothing was profiled")
+    return ProfileReport(**profiler.session.report())
+
+
+@router.delete("", response_model=ProfileReport)
+async def stop_profile():
+    """Stop running profiling before all its requests are served"""
+
+    if profiler.session is None:
+        raise HTTPException(status_code=404, detail="Nothing was profiled")
+    profiler.session.stop()
+    return ProfileReport(**profiler.session.report())
+
+
+@router.get("/flamegraph", response_class=PlainTextResponse)
+async def get_flamegraph(
+    kind: str = Query("cpu", pattern="^(cpu|memory)$"),
+    session: ProfileSession = Depends(get_finished_session),
+):
+    """
+    Folded stacks of sampled CPU time or of live allocations,
+    e.g. for flamegraph.pl or speedscope
+    """
+
+    if kind == "memory":
+        if not session.memory:
+            raise HTTPException(status_code=404, detail="Memory was not profiled")
+        return session.folded_allocations()
+    if session.mode != ProfileMode.sample:
+        raise HTTPException(status_code=404, detail="Stacks were not sampled")
+    return session.folded_stacks()
+
+
+@router.get("/pstats", response_class=Response)
+async def get_pstats(session: ProfileSession = Depends(get_finished_session)):
+    """cProfile stats, for pstats, snakeviz or flameprof"""
+
+    if session.mode != ProfileMode.cprofile:
+        raise HTTPException(status_code=404, detail="Profiled in sample mode")
+    return Response(
+        session.pstats_dump(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="profile.prof"'},
+    )
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from core import ShardSessions, get_logger, shard_map, statement_budget
+from app.services import SyncService
+from app.services.sync import parse_since
+
+logger = get_logger(__name__)
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+@router.get("", response_class=StreamingResponse)
+@statement_budget(2)
+async def sync_messages(
+    since: str = Query(..., description="chat_id:seq,... of last messages client has"),
+    limit: int = Query(1000, ge=1, le=5000),
+    shards: ShardSessions = Depends(shard_map.session_dependency),
+):
+    """
+    Stream messages newer than given seqs as NDJSON, at most limit of them.
+    Last line is SyncCursor with positions for the next sync.
+    """
+
+    try:
+        positions = parse_since(since)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    logger.debug(f"Syncing {len(positions)} chats via SyncService.stream_missing")
+    last_seqs = await SyncService.get_last_seqs(shards, list(positions))
+    return StreamingResponse(
+        SyncService.stream_missing(shards, positions, last_seqs, limit),
+        media_type="application/x-ndjson",
+    )
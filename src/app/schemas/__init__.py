@@ -1,12 +1,43 @@
 __all__ = (
+    "ChatBatchGet",
+    "ChatBatchResponse",
     "ChatCreate",
+    "ChatImport",
     "ChatResponse",
     "ChatWithMessages",
+    "HealthStatus",
+    "ImportReport",
     "MessageCreate",
+    "MessageImport",
     "MessageResponse",
+    "ProfileReport",
+    "ProfileStart",
+    "ReadMark",
+    "ReadStateBatchGet",
+    "ReadStateBatchResponse",
+    "ReadStateResponse",
+    "SyncCursor",
 )
 
-from .chat import ChatCreate, ChatResponse, ChatWithMessages
-from .message import MessageCreate, MessageResponse
+from .chat import (
+    ChatBatchGet,
+    ChatBatchResponse,
+    ChatCreate,
+    ChatImport,
+    ChatResponse,
+    ChatWithMessages,
+)
+from .health import HealthStatus
+from .imports import ImportReport
+from .message import MessageCreate, MessageImport, MessageResponse
+from .profiling import ProfileReport, ProfileStart
+from .read_state import (
+    ReadMark,
+    ReadStateBatchGet,
+    ReadStateBatchResponse,
+    ReadStateResponse,
+)
+from .sync import SyncCursor
 
 ChatWithMessages.model_rebuild()
+ChatBatchResponse.model_rebuild()
@@ -3,6 +3,8 @@ from typing import TYPE_CHECKING
 
 from pydantic import BaseModel, Field
 
+from .ids import MAX_BIGINT, Id
+
 if TYPE_CHECKING:
     from .message import MessageResponse
 
@@ -16,7 +18,7 @@ class ChatCreate(ChatBase):
 
 
 class ChatResponse(ChatBase):
-    id: int
+    id: Id
     created_at: datetime
 
     model_config = {"from_attributes": True}
@@ -27,3 +29,20 @@ class ChatWithMessages(BaseModel):
     messages: list["MessageResponse"]
 
     model_config = {"from_attributes": True}
+
+
+class ChatBatchGet(BaseModel):
+    chat_ids: list[Id] = Field(..., min_length=1, max_length=100)
+    limit: int = Field(20, ge=1, le=100)
+
+
+class ChatBatchResponse(BaseModel):
+    chats: list[ChatWithMessages]
+    not_found: list[Id]
+
+
+class ChatImport(ChatCreate):
+    """Chat record of bulk import, id is the chat's id in legacy system"""
+
+    id: int = Field(..., ge=0, le=MAX_BIGINT)
+    created_at: datetime | None = None
@@ -0,0 +1,10 @@
+from typing import Annotated
+
+from pydantic import PlainSerializer
+
+# ids and seqs are BIGINT columns
+MAX_BIGINT = 2**63 - 1
+
+# snowflake ids take up to 63 bits, JavaScript numbers are exact up to 53,
+# so ids are strings in JSON (and MessagePack), requests may send either
+Id = Annotated[int, PlainSerializer(str, return_type=str, when_used="json")]
@@ -0,0 +1,39 @@
+from pydantic import BaseModel
+
+# how many line errors are kept in the report
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+
+class ImportReport(BaseModel):
+    """
+    Progress of bulk import
+
+    Fields:
+        chats: int - imported chats
+        skipped_chats: int - chats already imported before (resumed import)
+        messages: int - imported messages
+        skipped_messages: int - messages with id already imported before
+        error_count: int - invalid lines, skipped
+        errors: list[ImportLineError] - first MAX_REPORTED_ERRORS invalid lines
+        next_line: int - lines committed so far, pass as start_line to resume
+        aborted: str | None - db error that stopped import
+    """
+
+    chats: int = 0
+    skipped_chats: int = 0
+    messages: int = 0
+    skipped_messages: int = 0
+    error_count: int = 0
+    errors: list[ImportLineError] = []
+    next_line: int = 0
+    aborted: str | None = None
+
+    def add_error(self, line: int, detail: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(ImportLineError(line=line, detail=detail))
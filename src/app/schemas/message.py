@@ -2,6 +2,8 @@ from datetime import datetime
 
 from pydantic import BaseModel, Field
 
+from .ids import MAX_BIGINT, Id
+
 
 class MessageBase(BaseModel):
     text: str = Field(..., min_length=1, max_length=5000)
@@ -12,8 +14,20 @@ class MessageCreate(MessageBase):
 
 
 class MessageResponse(MessageBase):
-    id: int
-    chat_id: int
+    id: Id
+    chat_id: Id
+    seq: int
     created_at: datetime
 
     model_config = {"from_attributes": True}
+
+
+class MessageImport(MessageCreate):
+    """
+    Message record of bulk import, chat_id is the chat's id in legacy system.
+    Messages with id are imported once, however many times import is resumed.
+    """
+
+    id: int | None = Field(None, ge=0, le=MAX_BIGINT)
+    chat_id: int = Field(..., ge=0, le=MAX_BIGINT)
+    created_at: datetime | None = None
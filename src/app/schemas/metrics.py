@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+
+
+class HotTailStats(BaseModel):
+    chats: int
+    max_chats: int
+    messages: int
+    bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+
+
+class AdmissionStats(BaseModel):
+    limit: int
+    in_flight: int
+    queued: dict[str, int]
+    admitted: dict[str, int]
+    shed: dict[str, int]
+
+
+class OutboxStats(BaseModel):
+    # over all shards
+    pending: int
+    dead: int
+    oldest_pending_age: float
+    # by dispatcher of this process
+    dispatched: dict[str, int]
+    retried: int
+    given_up: int
+    last_lag: float
+    max_lag: float
@@ -0,0 +1,34 @@
+from pydantic import BaseModel, Field
+
+from app.middlewares.profiling import ProfileMode
+
+
+class ProfileStart(BaseModel):
+    mode: ProfileMode = ProfileMode.sample
+    requests: int = Field(100, ge=1, le=10_000)
+    # trace allocations with tracemalloc, slows the worker down considerably
+    memory: bool = False
+
+
+class LoopLagStats(BaseModel):
+    probes: int
+    mean_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+class AllocationStats(BaseModel):
+    trace: str
+    size_kb: float
+    count: int
+
+
+class ProfileReport(BaseModel):
+    mode: ProfileMode
+    done: bool
+    requests: int
+    profiled_requests: int
+    duration: float
+    samples: int | None
+    loop_lag: LoopLagStats
+    allocations: list[AllocationStats]
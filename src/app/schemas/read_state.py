@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+
+from .ids import MAX_BIGINT, Id
+
+
+class ReadMark(BaseModel):
+    reader_id: Id = Field(..., ge=0, le=MAX_BIGINT)
+    seq: int = Field(..., ge=0, le=MAX_BIGINT)
+
+
+class ReadStateResponse(BaseModel):
+    chat_id: Id
+    reader_id: Id
+    last_read_seq: int
+    last_seq: int
+    unread: int
+
+
+class ReadStateBatchGet(BaseModel):
+    reader_id: Id = Field(..., ge=0, le=MAX_BIGINT)
+    chat_ids: list[Id] = Field(..., min_length=1, max_length=500)
+
+
+class ReadStateBatchResponse(BaseModel):
+    read_states: list[ReadStateResponse]
+    not_found: list[Id]
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+
+from .ids import Id
+
+
+class SyncCursor(BaseModel):
+    """
+    Last line of sync response
+
+    Fields:
+        since: str - positions to sync from next time, chat_id:seq,...
+        more: bool - some chats have messages past the limit, sync again
+        not_found: list[Id] - requested chats that don't exist
+    """
+
+    since: str
+    more: bool
+    not_found: list[Id]
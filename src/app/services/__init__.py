@@ -1,3 +1,19 @@
-__all__ = ("ChatService",)
+__all__ = (
+    "ArchiveService",
+    "ChatService",
+    "IdempotencyService",
+    "ImportService",
+    "OutboxService",
+    "RebalanceService",
+    "SyncService",
+    "WarmupService",
+)
 
+from .archive import ArchiveService
 from .chat import ChatService
+from .idempotency import IdempotencyService
+from .importer import ImportService
+from .outbox import OutboxService
+from .rebalance import RebalanceService
+from .sync import SyncService
+from .warmup import WarmupService
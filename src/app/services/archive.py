@@ -0,0 +1,238 @@
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import Row, delete, exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from core import ShardSessions, get_logger, settings
+from core.ids import generate_id, id_created_at
+from core.models import Chat, Message
+from core.models.base import utcnow
+from core.sharding import bucket_of
+from .segments import LocalSegmentStore, SegmentStore, encode_segment
+
+logger = get_logger(__name__)
+
+segment_store: SegmentStore = LocalSegmentStore(Path(settings.archive.path))
+
+
+class SegmentMissing(RuntimeError):
+    """Raised on startup if archived chats' segments can't be read"""
+
+
+class ArchiveService:
+    @staticmethod
+    async def read_messages(
+        chat: Chat | Row, first_seq: int, last_seq: int
+    ) -> list[Message]:
+        """
+        Read archived messages of chat
+
+        Args:
+            chat: Chat | Row - chat, or row with its id and archive marker
+            first_seq: int - first seq to read, from 1
+            last_seq: int - last seq to read, capped by chat.archived_seq
+
+        Returns:
+            list[Message] - messages in seq order, not attached to a session
+        """
+
+        last_seq = min(last_seq, chat.archived_seq)
+        if chat.archive_segment is None or first_seq > last_seq:
+            return []
+        return await segment_store.read_messages(
+            chat.archive_segment, chat.id, max(first_seq, 1), last_seq
+        )
+
+    @classmethod
+    async def archive_idle_chats(
+        cls,
+        shards: ShardSessions,
+        idle_since: datetime,
+        segment_chats: int = settings.archive.segment_chats,
+        block_size: int = settings.archive.block_size,
+    ) -> int:
+        """
+        Move messages of chats idle since idle_since to archive segments,
+        one segment per segment_chats chats of a shard. Messages sent
+        while a chat is archived stay in db, they have greater seqs.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            idle_since: datetime - chats without newer messages are archived
+            segment_chats: int - chats per segment
+            block_size: int - messages per compressed block
+
+        Returns:
+            int - archived chats count
+        """
+
+        archived = 0
+        for shard in shards.map.shards:
+            session = shards.get(shard)
+            after_id = -1
+            while True:
+                chats = await cls._get_idle_chats(
+                    session, idle_since, after_id, segment_chats
+                )
+                if not chats:
+                    break
+                after_id = chats[-1].id
+                # chats being moved to another shard are left for the next run
+                chats = [
+                    chat
+                    for chat in chats
+                    if bucket_of(chat.id) not in shards.map.frozen
+                ]
+                if chats:
+                    await cls._archive_chats(session, chats, block_size)
+                    archived += len(chats)
+        return archived
+
+    @classmethod
+    async def compact_segments(
+        cls,
+        shards: ShardSessions,
+        block_size: int = settings.archive.block_size,
+        grace: timedelta = timedelta(seconds=settings.archive.segment_grace),
+    ) -> int:
+        """
+        Drop messages of deleted and re-archived chats from segments.
+        Segments no chat refers to are removed, ones holding such chats
+        are rewritten with the rest, the old copy is removed by the next run.
+        Segments younger than grace are left alone, chats may not refer
+        to them yet, or reads may still be using them.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            block_size: int - messages per compressed block
+            grace: timedelta - age of segments to compact
+
+        Returns:
+            int - removed and rewritten segments count
+        """
+
+        compacted = 0
+        oldest = utcnow() - grace
+        for name in await segment_store.names():
+            if id_created_at(int(name)) > oldest:
+                continue
+            index = await asyncio.to_thread(segment_store.open_index, name)
+            indexed = index.chat_ids()
+            stmt = (
+                select(Chat)
+                .where(Chat.archive_segment == name)
+                .options(noload(Chat.messages))
+                .with_for_update()
+            )
+            referring = {}
+            for shard in shards.map.shards:
+                referring[shard] = (await shards.get(shard).scalars(stmt)).all()
+            if {chat.id for chats in referring.values() for chat in chats} == indexed:
+                for shard in referring:
+                    await shards.get(shard).commit()
+                continue
+
+            for shard, chats in referring.items():
+                if chats:
+                    await cls._rewrite_chats(shards.get(shard), chats, block_size)
+                else:
+                    await shards.get(shard).commit()
+            if not any(referring.values()):
+                await segment_store.remove(name)
+                logger.info(f"Removed archive segment {name}")
+            compacted += 1
+        return compacted
+
+    @staticmethod
+    async def check_segments(shards: ShardSessions) -> None:
+        """
+        Make sure segments of archived chats can be read from this process,
+        one query per shard
+
+        Raises:
+            SegmentMissing - a segment of archived chat isn't found
+        """
+
+        stmt = select(Chat.archive_segment).where(Chat.archive_segment.is_not(None))
+        for name in await shards.broadcast(
+            lambda session: session.scalar(stmt.limit(1))
+        ):
+            if name is not None and not await segment_store.exists(name):
+                raise SegmentMissing(
+                    f"Archive segment {name} isn't found in {settings.archive.path}, "
+                    "ARCHIVE_PATH must be storage shared by all processes"
+                )
+
+    @staticmethod
+    async def _get_idle_chats(
+        session: AsyncSession, idle_since: datetime, after_id: int, limit: int
+    ) -> list[Chat]:
+        recent = exists().where(
+            Message.chat_id == Chat.id, Message.created_at >= idle_since
+        )
+        stmt = (
+            select(Chat)
+            .where(Chat.id > after_id, Chat.last_seq > Chat.archived_seq, ~recent)
+            .order_by(Chat.id)
+            .limit(limit)
+            .options(noload(Chat.messages))
+        )
+        return (await session.scalars(stmt)).all()
+
+    @classmethod
+    async def _archive_chats(
+        cls, session: AsyncSession, chats: list[Chat], block_size: int
+    ) -> None:
+        stmt = (
+            select(Message)
+            .where(Message.chat_id.in_([chat.id for chat in chats]))
+            .order_by(Message.chat_id, Message.seq)
+            .options(noload(Message.chat))
+        )
+        messages: dict[int, list[Message]] = {}
+        for message in await session.scalars(stmt):
+            messages.setdefault(message.chat_id, []).append(message)
+
+        segment = []
+        for chat in chats:
+            # chat is kept in one segment, earlier archived messages move along
+            earlier = await cls.read_messages(chat, 1, chat.archived_seq)
+            segment.append((chat.id, earlier + messages.get(chat.id, [])))
+        name = str(generate_id())
+        await segment_store.write(name, *encode_segment(segment, block_size))
+
+        for chat_id, chat_messages in segment:
+            archived_seq = chat_messages[-1].seq
+            await session.execute(
+                update(Chat)
+                .where(Chat.id == chat_id)
+                .values(archived_seq=archived_seq, archive_segment=name)
+            )
+            await session.execute(
+                delete(Message).where(
+                    Message.chat_id == chat_id, Message.seq <= archived_seq
+                )
+            )
+        await session.commit()
+        logger.info(f"Archived {len(segment)} chats to segment {name}")
+
+    @classmethod
+    async def _rewrite_chats(
+        cls, session: AsyncSession, chats: list[Chat], block_size: int
+    ) -> None:
+        segment = [
+            (chat.id, await cls.read_messages(chat, 1, chat.archived_seq))
+            for chat in chats
+        ]
+        name = str(generate_id())
+        await segment_store.write(name, *encode_segment(segment, block_size))
+        await session.execute(
+            update(Chat)
+            .where(Chat.id.in_([chat.id for chat in chats]))
+            .values(archive_segment=name)
+        )
+        await session.commit()
+        logger.info(f"Rewrote {len(chats)} chats to archive segment {name}")
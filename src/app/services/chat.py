@@ -1,37 +1,199 @@
+import asyncio
+from typing import AsyncIterator, Sequence
+
 from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    and_,
+    case,
+    bindparam,
+    select,
+    delete,
+    func,
+    update,
+)
+from sqlalchemy.orm import aliased, noload, raiseload
+
+from app.schemas.chat import ChatResponse, ChatWithMessages
+from app.schemas.message import MessageResponse
+from app.schemas.read_state import ReadStateResponse
+from core import BucketFrozen, ShardMap, ShardSessions, get_logger, settings
+from core.ids import generate_id
+from core.models import Chat, IdempotencyKey, Message, ReadState
+from core.models.base import utcnow
+from .archive import ArchiveService
+from .encoding import ResponseFormat, encode
+from .hot_tail import ChatTail, HotTail
+from .outbox import EventType, OutboxService, outbox_dispatcher
+from .read_markers import ReadMarkers
+from .single_flight import SingleFlight
+
+logger = get_logger(__name__)
+
+# rows fetched from server-side cursor at once while exporting
+EXPORT_BATCH_SIZE = 1000
 
-from core.models import Chat, Message
+# concurrent get_chat_detail reads of the same (chat_id, limit)
+chat_detail_flights = SingleFlight(window=settings.chat_read.coalesce_window)
+# last messages of active chats, serves get_chat_detail without db
+hot_tail = HotTail(
+    capacity=settings.hot_tail.capacity,
+    max_chats=settings.hot_tail.max_chats,
+    max_bytes=settings.hot_tail.max_bytes,
+    max_age=settings.hot_tail.max_age,
+)
+hot_tail_fills = SingleFlight()
+# read positions waiting for the next bulk write
+read_markers = ReadMarkers()
 
 
 class ChatService:
     @staticmethod
-    async def get_chat(session: AsyncSession, chat_id: int) -> Chat | None:
+    async def get_chat(shards: ShardSessions, chat_id: int) -> Chat | None:
         """
         Get chat by id
 
         Args:
-            session: AsyncSession - db async session
+            shards: ShardSessions - db async sessions of shards
             chat_id: int - chat's id to retrieve
 
         Returns:
             Chat or None
         """
 
-        return await session.get(Chat, chat_id)
+        session = shards.for_chat(chat_id)
+        return await session.get(Chat, chat_id, options=[noload(Chat.messages)])
+
+    @classmethod
+    async def get_chat_detail(
+        cls,
+        shards: ShardSessions,
+        chat_id: int,
+        limit: int,
+        response_format: ResponseFormat = ResponseFormat.json,
+    ) -> bytes | None:
+        """
+        Get chat with its recent messages, serialized.
+        Served from hot tail cache when it has enough messages, else from db.
+        Concurrent identical reads share one fetch and its serialization.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_id: int - chat's id to retrieve
+            limit: int - how many messages to retrieve
+            response_format: ResponseFormat - format to serialize to
+
+        Returns:
+            bytes | None - ChatWithMessages or None if chat is not found
+        """
+
+        async def fetch() -> bytes | None:
+            # shared by callers, any of which may be gone before it's done,
+            # so it doesn't use sessions of the one that started it
+            own_shards = shards.fork()
+            try:
+                if limit > hot_tail.capacity:
+                    detail = await cls._read_chat_detail(own_shards, chat_id, limit)
+                else:
+                    detail = await cls._read_hot_tail(own_shards, chat_id, limit)
+            finally:
+                await own_shards.close()
+            if detail is None:
+                return None
+            return encode(detail, response_format)
+
+        return await chat_detail_flights.do((chat_id, limit, response_format), fetch)
+
+    @classmethod
+    async def _read_chat_detail(
+        cls, shards: ShardSessions, chat_id: int, limit: int
+    ) -> ChatWithMessages | None:
+        chat = await cls.get_chat(shards, chat_id)
+        if not chat:
+            return None
+        messages = await cls.get_recent_messages(shards, chat_id, limit, chat)
+        return ChatWithMessages(
+            chat=ChatResponse.model_validate(chat),
+            messages=[MessageResponse.model_validate(msg) for msg in messages],
+        )
+
+    @classmethod
+    async def _read_hot_tail(
+        cls, shards: ShardSessions, chat_id: int, limit: int
+    ) -> ChatWithMessages | None:
+        tail = hot_tail.get(chat_id, limit)
+        if tail is None:
+            # one fill per chat, whatever limits concurrent reads have
+            tail = await hot_tail_fills.do(
+                chat_id, lambda: cls._fill_hot_tail(shards, chat_id)
+            )
+        if tail is None:
+            return None
+        return tail.detail(limit)
+
+    @classmethod
+    async def _fill_hot_tail(
+        cls, shards: ShardSessions, chat_id: int
+    ) -> ChatTail | None:
+        # shared by reads of any limit, like get_chat_detail's fetch
+        shards = shards.fork()
+        try:
+            hot_tail.begin_fill(chat_id)
+            chat = await cls.get_chat(shards, chat_id)
+            if not chat:
+                hot_tail.evict(chat_id)
+                return None
+            messages = await cls.get_recent_messages(
+                shards, chat_id, hot_tail.capacity, chat
+            )
+        finally:
+            await shards.close()
+        return hot_tail.fill(chat, messages)
 
     @staticmethod
+    def forget_chat_detail(chat_id: int) -> None:
+        """Make next reads of chat detail run anew instead of sharing results"""
+
+        chat_detail_flights.forget(lambda key: key[0] == chat_id)
+
+    @staticmethod
+    async def chat_exists(shards: ShardSessions, chat_id: int) -> bool:
+        """
+        Check that chat exists without loading it and its messages
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_id: int - chat's id to check
+
+        Returns:
+            bool - whether chat exists
+        """
+
+        stmt = select(Chat.id).where(Chat.id == chat_id)
+        return await shards.for_chat(chat_id).scalar(stmt) is not None
+
+    @classmethod
     async def get_recent_messages(
-        session: AsyncSession, chat_id: int, limit: int
+        cls,
+        shards: ShardSessions,
+        chat_id: int,
+        limit: int,
+        chat: Chat | None = None,
     ) -> list[Message]:
         """
-        Get list of messages in chat limited by limit
+        Get list of messages in chat limited by limit, newest first.
+        Reads through to archive when db has fewer than limit of them.
 
         Args:
-            session: AsyncSession - db async session
+            shards: ShardSessions - db async sessions of shards
             chat_id: int - chat's id to retrieve messages from
             limit: int - how many messages to retrieve
+            chat: Chat | None - the chat if already loaded, for archive marker
 
         Returns:
             list[Message] - retrieved messages
@@ -40,19 +202,158 @@ class ChatService:
         stmt = (
             select(Message)
             .where(Message.chat_id == chat_id)
-            .order_by(Message.created_at.desc())
+            .order_by(Message.seq.desc())
             .limit(limit)
         )
-        result = await session.execute(stmt)
-        return result.scalars().all()
+        result = await shards.for_chat(chat_id).execute(stmt)
+        messages = list(result.scalars().all())
+        if len(messages) < limit and (not messages or messages[-1].seq > 1):
+            if chat is None:
+                chat = await cls.get_chat(shards, chat_id)
+            if chat is not None:
+                messages += await cls._read_archived_before(chat, messages, limit)
+        return messages
+
+    @staticmethod
+    async def _read_archived_before(
+        chat: Chat, messages: list[Message], limit: int
+    ) -> list[Message]:
+        """Archived messages older than messages, newest first, up to limit total"""
+
+        last_seq = messages[-1].seq - 1 if messages else chat.archived_seq
+        archived = await ArchiveService.read_messages(
+            chat, last_seq - (limit - len(messages)) + 1, last_seq
+        )
+        return archived[::-1]
+
+    @staticmethod
+    async def get_chats(shards: ShardSessions, chat_ids: list[int]) -> list[Chat]:
+        """
+        Get chats by ids without their messages, in one query per shard
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_ids: list[int] - chats' ids to retrieve
+
+        Returns:
+            list[Chat] - found chats, in no particular order
+        """
+
+        async def get_shard_chats(session: AsyncSession, ids: list[int]) -> list[Chat]:
+            stmt = select(Chat).where(Chat.id.in_(ids)).options(noload(Chat.messages))
+            result = await session.execute(stmt)
+            return result.scalars().all()
+
+        results = await shards.scatter(chat_ids, get_shard_chats)
+        return [chat for chats in results for chat in chats]
+
+    @classmethod
+    async def get_recent_messages_batch(
+        cls,
+        shards: ShardSessions,
+        chat_ids: list[int],
+        limit: int,
+        chats: dict[int, Chat] | None = None,
+    ) -> dict[int, list[Message]]:
+        """
+        Get recent messages of several chats in one query per shard,
+        ranking them per chat with ROW_NUMBER() OVER (PARTITION BY chat_id)
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_ids: list[int] - chats' ids to retrieve messages from
+            limit: int - how many messages to retrieve per chat
+            chats: dict[int, Chat] | None - the chats by id if already loaded,
+                archived messages are read through for them
+
+        Returns:
+            dict[int, list[Message]] - newest first messages by chat's id,
+            chats without messages are omitted
+        """
+
+        rank = (
+            func.row_number()
+            .over(
+                partition_by=Message.chat_id,
+                order_by=Message.seq.desc(),
+            )
+            .label("rank")
+        )
+
+        async def get_shard_messages(
+            session: AsyncSession, ids: list[int]
+        ) -> list[Message]:
+            ranked = select(Message, rank).where(Message.chat_id.in_(ids)).subquery()
+            recent = aliased(Message, ranked)
+            stmt = (
+                select(recent)
+                .where(ranked.c.rank <= limit)
+                .order_by(ranked.c.chat_id, ranked.c.rank)
+                .options(raiseload(recent.chat))
+            )
+            result = await session.execute(stmt)
+            return result.scalars().all()
+
+        messages: dict[int, list[Message]] = {}
+        for shard_messages in await shards.scatter(chat_ids, get_shard_messages):
+            for message in shard_messages:
+                messages.setdefault(message.chat_id, []).append(message)
+
+        for chat in (chats or {}).values():
+            chat_messages = messages.get(chat.id, [])
+            if chat.archived_seq and len(chat_messages) < limit:
+                archived = await cls._read_archived_before(chat, chat_messages, limit)
+                if archived:
+                    messages[chat.id] = chat_messages + archived
+        return messages
 
     @staticmethod
-    async def create_chat(session: AsyncSession, title: str) -> Chat:
+    async def stream_messages(
+        shards: ShardSessions, chat_id: int, chat: Chat | None = None
+    ) -> AsyncIterator[Sequence[Row | Message]]:
         """
-        Create a new chat
+        Stream all messages of chat, oldest first, archived ones first,
+        then ones in db through server-side cursor
 
         Args:
-            session: AsyncSession - db async session
+            shards: ShardSessions - db async sessions of shards
+            chat_id: int - chat's id to stream messages from
+            chat: Chat | None - the chat, archived messages are skipped if None
+
+        Returns:
+            AsyncIterator[Sequence[Row | Message]] - batches of at most
+            EXPORT_BATCH_SIZE rows with id, chat_id, seq, text and created_at
+        """
+
+        archived_seq = chat.archived_seq if chat is not None else 0
+        for first_seq in range(1, archived_seq + 1, EXPORT_BATCH_SIZE):
+            yield await ArchiveService.read_messages(
+                chat, first_seq, first_seq + EXPORT_BATCH_SIZE - 1
+            )
+
+        stmt = (
+            select(
+                Message.id,
+                Message.chat_id,
+                Message.seq,
+                Message.text,
+                Message.created_at,
+            )
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.seq)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        result = await shards.for_chat(chat_id).stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+
+    @staticmethod
+    async def create_chat(shards: ShardSessions, title: str) -> Chat:
+        """
+        Create a new chat on shard of a round-robin bucket
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
             title: str - chat's title, non-empty
 
         Returns:
@@ -63,23 +364,41 @@ class ChatService:
         title = title.strip()
         if title == "":
             raise HTTPException(status_code=400, detail="Title cannot be empty")
-        chat = Chat(title=title)
+        # id and created_at are set by app, no need to read them back
+        chat = Chat(id=shards.map.new_chat_id(), title=title, created_at=utcnow())
+        session = shards.for_chat(chat.id)
         session.add(chat)
+        OutboxService.add_event(
+            session,
+            EventType.chat_created,
+            chat.id,
+            ChatResponse.model_validate(chat).model_dump_json(),
+        )
         await session.commit()
-        await session.refresh(chat)
+        outbox_dispatcher.notify()
         return chat
 
     @classmethod
     async def create_message(
-        cls, session: AsyncSession, chat_id: int, text: str
+        cls,
+        shards: ShardSessions,
+        chat_id: int,
+        text: str,
+        idempotency_key: str | None = None,
+        request_hash: str | None = None,
     ) -> Message:
         """
-        Create message in chat
+        Create message in chat, next seq of the chat is taken
+        by incrementing Chat.last_seq, which locks the chat till commit.
+        message.created event is committed with it.
 
         Args:
-            session: AsyncSession - db async session
+            shards: ShardSessions - db async sessions of shards
             chat_id: int - chat's id to create message in
             text: str - message's text
+            idempotency_key: str | None - stored with the message's response
+                in the same transaction, unique
+            request_hash: str | None - hash of the request stored with the key
 
         Returns:
             Message - created message
@@ -89,33 +408,248 @@ class ChatService:
         if not text:
             raise HTTPException(status_code=400, detail="Text cannot be empty")
 
-        chat = await cls.get_chat(session, chat_id)
-        if not chat:
+        session = shards.for_chat(chat_id, write=True)
+        seq = await session.scalar(
+            update(Chat)
+            .where(Chat.id == chat_id)
+            .values(last_seq=Chat.last_seq + 1)
+            .returning(Chat.last_seq)
+            .execution_options(synchronize_session=False)
+        )
+        if seq is None:
             raise HTTPException(status_code=404, detail="Chat not found")
 
-        message = Message(chat_id=chat_id, text=text)
+        # id and created_at are set by app, nothing is read back after insert
+        message = Message(
+            id=generate_id(),
+            chat_id=chat_id,
+            seq=seq,
+            text=text,
+            created_at=utcnow(),
+        )
         session.add(message)
+        response = MessageResponse.model_validate(message).model_dump_json()
+        if idempotency_key is not None:
+            # the key references the message, which must be inserted first
+            await session.flush()
+            session.add(
+                IdempotencyKey(
+                    key=idempotency_key,
+                    chat_id=chat_id,
+                    message_id=message.id,
+                    request_hash=request_hash,
+                    response=response,
+                )
+            )
+        OutboxService.add_event(session, EventType.message_created, chat_id, response)
         await session.commit()
-        await session.refresh(message)
+        # caches of this process stay inline, reads right after must see the write
+        hot_tail.append(message)
+        cls.forget_chat_detail(chat_id)
+        outbox_dispatcher.notify()
         return message
 
     @classmethod
-    async def delete_chat(cls, session: AsyncSession, chat_id: int):
+    async def delete_chat(cls, shards: ShardSessions, chat_id: int):
         """
-        Delete chat by id
+        Delete chat by id, chat.deleted event is committed with it.
+        Its archived messages can't be read without the chat,
+        ArchiveService.compact_segments drops them from the segment.
 
         Args:
-            session: AsyncSession - db async session
+            shards: ShardSessions - db async sessions of shards
             chat_id: int - chat's id to delete
 
         Returns:
             None
         """
 
-        chat = await cls.get_chat(session, chat_id)
+        chat = await cls.get_chat(shards, chat_id)
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
 
+        session = shards.for_chat(chat_id, write=True)
         await session.execute(delete(Message).where(Message.chat_id == chat_id))
         await session.delete(chat)
+        OutboxService.add_event(session, EventType.chat_deleted, chat_id, "{}")
         await session.commit()
+        hot_tail.evict(chat_id)
+        cls.forget_chat_detail(chat_id)
+        outbox_dispatcher.notify()
+
+    @staticmethod
+    def mark_read(chat_id: int, reader_id: int, seq: int) -> None:
+        """
+        Move reader's position in chat to seq, unless it's further already.
+        Kept in memory till the next flush_read_markers, no db access.
+
+        Args:
+            chat_id: int - chat's id
+            reader_id: int - reader's id
+            seq: int - seq of the last message reader has read
+        """
+
+        read_markers.mark(chat_id, reader_id, seq)
+
+    @staticmethod
+    async def get_read_states(
+        shards: ShardSessions, chat_ids: list[int], reader_id: int
+    ) -> list[ReadStateResponse]:
+        """
+        Get reader's positions and unread counts in chats, in one query
+        per shard. Unread count is chat's last seq minus reader's position,
+        no messages are counted.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_ids: list[int] - chats' ids
+            reader_id: int - reader's id
+
+        Returns:
+            list[ReadStateResponse] - in chat_ids order, missing chats are omitted
+        """
+
+        async def get_shard_read_states(
+            session: AsyncSession, ids: list[int]
+        ) -> list[Row]:
+            stmt = (
+                select(Chat.id, Chat.last_seq, ReadState.last_read_seq)
+                .outerjoin(
+                    ReadState,
+                    and_(
+                        ReadState.chat_id == Chat.id, ReadState.reader_id == reader_id
+                    ),
+                )
+                .where(Chat.id.in_(ids))
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+        results = await shards.scatter(chat_ids, get_shard_read_states)
+        rows = {row.id: row for shard_rows in results for row in shard_rows}
+
+        read_states = []
+        for chat_id in chat_ids:
+            row = rows.get(chat_id)
+            if row is None:
+                continue
+            # positions not flushed yet are ahead of stored ones
+            last_read_seq = min(
+                max(row.last_read_seq or 0, read_markers.get(chat_id, reader_id) or 0),
+                row.last_seq,
+            )
+            read_states.append(
+                ReadStateResponse(
+                    chat_id=chat_id,
+                    reader_id=reader_id,
+                    last_read_seq=last_read_seq,
+                    last_seq=row.last_seq,
+                    unread=max(0, row.last_seq - last_read_seq),
+                )
+            )
+        return read_states
+
+    @classmethod
+    async def flush_read_markers(cls, shards: ShardSessions) -> int:
+        """
+        Write buffered read positions in bulk, one upsert per shard,
+        keeping the furthest of buffered and stored positions.
+        Positions in frozen buckets, on failing shards or not written
+        when the flush is cancelled are put back for the next flush,
+        ones in deleted chats are dropped.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+
+        Returns:
+            int - positions written or dropped
+        """
+
+        now = utcnow()
+        by_shard: dict[str, list[dict]] = {}
+        for (chat_id, reader_id), seq in read_markers.drain().items():
+            try:
+                shard = shards.map.shard_of(chat_id, write=True)
+            except BucketFrozen:
+                read_markers.mark(chat_id, reader_id, seq)
+                continue
+            by_shard.setdefault(shard, []).append(
+                {
+                    "new_id": generate_id(),
+                    "new_chat_id": chat_id,
+                    "new_reader_id": reader_id,
+                    "new_seq": seq,
+                    "now": now,
+                }
+            )
+
+        flushed = 0
+        unwritten = dict(by_shard)
+        try:
+            for shard, rows in by_shard.items():
+                session = shards.get(shard)
+                try:
+                    connection = await session.connection()
+                    await session.execute(
+                        cls._upsert_read_states(connection.dialect.name), rows
+                    )
+                    await session.commit()
+                except SQLAlchemyError as exc:
+                    await session.rollback()
+                    logger.warning(f"Flushing read positions to {shard} failed: {exc}")
+                    continue
+                del unwritten[shard]
+                flushed += len(rows)
+        finally:
+            # failed shards, and on any other error or cancellation
+            # the rest too, rewriting a written position does no harm
+            for rows in unwritten.values():
+                for row in rows:
+                    read_markers.mark(
+                        row["new_chat_id"], row["new_reader_id"], row["new_seq"]
+                    )
+        return flushed
+
+    @classmethod
+    async def flush_read_markers_every(
+        cls, shard_map: ShardMap, interval: float
+    ) -> None:
+        """Flush read positions every interval seconds, till cancelled"""
+
+        while True:
+            await asyncio.sleep(interval)
+            shards = ShardSessions(shard_map)
+            try:
+                await cls.flush_read_markers(shards)
+            except Exception:
+                # one bad flush must not stop flushing for good
+                logger.exception("Flushing read positions failed")
+            finally:
+                await shards.close()
+
+    @staticmethod
+    def _upsert_read_states(dialect: str):
+        # positions of chats deleted meanwhile are skipped by the join,
+        # ones past chat's last message are moved back to it, as they
+        # would hide later messages for good
+        insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[dialect]
+        table = ReadState.__table__
+        new_seq = bindparam("new_seq", type_=BigInteger)
+        stmt = insert(table).from_select(
+            ["id", "chat_id", "reader_id", "last_read_seq", "updated_at"],
+            select(
+                bindparam("new_id", type_=BigInteger),
+                Chat.id,
+                bindparam("new_reader_id", type_=BigInteger),
+                case((new_seq < Chat.last_seq, new_seq), else_=Chat.last_seq),
+                bindparam("now", type_=DateTime(timezone=True)),
+            ).where(Chat.id == bindparam("new_chat_id", type_=BigInteger)),
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.chat_id, table.c.reader_id],
+            set_={
+                "last_read_seq": stmt.excluded.last_read_seq,
+                "updated_at": stmt.excluded.updated_at,
+            },
+            where=stmt.excluded.last_read_seq > table.c.last_read_seq,
+        )
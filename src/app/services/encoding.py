@@ -0,0 +1,95 @@
+from enum import Enum
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # optional, responses are JSON only without it
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = frozenset(
+    ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+)
+JSON_MEDIA_RANGES = frozenset(("application/json", "application/*", "*/*"))
+
+
+class ResponseFormat(str, Enum):
+    json = "json"
+    msgpack = "msgpack"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            ResponseFormat.json: "application/json",
+            ResponseFormat.msgpack: "application/msgpack",
+        }[self]
+
+    @classmethod
+    def from_accept(cls, accept: str | None) -> "ResponseFormat":
+        """
+        Pick format by Accept header, the one of highest quality,
+        the first listed of equal ones. JSON if nothing else fits.
+
+        Args:
+            accept: str | None - Accept header
+
+        Returns:
+            ResponseFormat - response format
+        """
+
+        best, best_quality = cls.json, 0.0
+        for media_range in (accept or "").split(","):
+            media_type, *params = media_range.split(";")
+            media_type = media_type.strip().lower()
+            quality = 1.0
+            for param in params:
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if media_type in MSGPACK_MEDIA_TYPES and msgpack is not None:
+                response_format = cls.msgpack
+            elif media_type in JSON_MEDIA_RANGES:
+                response_format = cls.json
+            else:
+                continue
+            if quality > best_quality:
+                best, best_quality = response_format, quality
+        return best
+
+
+def pack(data: object) -> bytes:
+    """MessagePack of JSON-compatible data, 406 if msgpack isn't installed"""
+
+    if msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack is not available")
+    return msgpack.packb(data)
+
+
+def encode(model: BaseModel, response_format: ResponseFormat) -> bytes:
+    """
+    Serialize model, datetimes are ISO 8601 strings in every format,
+    so clients decode both to the same values
+
+    Args:
+        model: BaseModel - response
+        response_format: ResponseFormat - format to serialize to
+
+    Returns:
+        bytes - serialized model
+    """
+
+    if response_format == ResponseFormat.msgpack:
+        return pack(model.model_dump(mode="json"))
+    return model.model_dump_json().encode()
+
+
+def encoded_response(content: bytes, response_format: ResponseFormat) -> Response:
+    return Response(
+        content=content,
+        media_type=response_format.media_type,
+        headers={"Vary": "Accept"},
+    )
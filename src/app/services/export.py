@@ -0,0 +1,95 @@
+import csv
+import io
+from enum import Enum
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy.engine import Row
+
+from app.schemas.message import MessageResponse
+from .encoding import pack
+
+CSV_COLUMNS = ("id", "chat_id", "seq", "text", "created_at")
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    # MessagePack map per message, one after another
+    msgpack = "msgpack"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            ExportFormat.ndjson: "application/x-ndjson",
+            ExportFormat.csv: "text/csv",
+            ExportFormat.msgpack: "application/msgpack",
+        }[self]
+
+
+async def to_ndjson(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[str]:
+    """
+    Serialize batches of message rows to NDJSON, one chunk per batch
+
+    Args:
+        batches: AsyncIterator[Sequence[Row]] - message rows
+
+    Returns:
+        AsyncIterator[str] - NDJSON chunks
+    """
+
+    async for rows in batches:
+        yield "".join(
+            MessageResponse.model_validate(row).model_dump_json() + "\n" for row in rows
+        )
+
+
+async def to_csv(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[str]:
+    """
+    Serialize batches of message rows to CSV with header, one chunk per batch
+
+    Args:
+        batches: AsyncIterator[Sequence[Row]] - message rows
+
+    Returns:
+        AsyncIterator[str] - CSV chunks
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(
+                (row.id, row.chat_id, row.seq, row.text, row.created_at.isoformat())
+            )
+        yield buffer.getvalue()
+
+
+async def to_msgpack(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[bytes]:
+    """
+    Serialize batches of message rows to stream of MessagePack maps,
+    one chunk per batch
+
+    Args:
+        batches: AsyncIterator[Sequence[Row]] - message rows
+
+    Returns:
+        AsyncIterator[bytes] - MessagePack chunks
+    """
+
+    async for rows in batches:
+        yield b"".join(
+            pack(MessageResponse.model_validate(row).model_dump(mode="json"))
+            for row in rows
+        )
+
+
+SERIALIZERS = {
+    ExportFormat.ndjson: to_ndjson,
+    ExportFormat.csv: to_csv,
+    ExportFormat.msgpack: to_msgpack,
+}
@@ -0,0 +1,218 @@
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Sequence
+
+from app.schemas.chat import ChatResponse, ChatWithMessages
+from app.schemas.message import MessageResponse
+from core.models import Chat, Message
+
+# rough per-message memory besides text: slots object, deque cell, ints, datetime
+MESSAGE_OVERHEAD = 200
+CHAT_OVERHEAD = 500
+
+
+class TailMessage:
+    __slots__ = ("id", "seq", "text", "created_at")
+
+    def __init__(self, id: int, seq: int, text: str, created_at: datetime):
+        self.id = id
+        self.seq = seq
+        self.text = text
+        self.created_at = created_at
+
+    @property
+    def size(self) -> int:
+        return MESSAGE_OVERHEAD + sys.getsizeof(self.text)
+
+
+class ChatTail:
+    """
+    Chat and its last messages, oldest first
+
+    Fields:
+        complete: bool - messages are all messages of the chat
+    """
+
+    __slots__ = ("chat", "messages", "complete", "size", "expires_at")
+
+    def __init__(
+        self,
+        chat: ChatResponse,
+        messages: deque[TailMessage],
+        complete: bool,
+        expires_at: float,
+    ):
+        self.chat = chat
+        self.messages = messages
+        self.complete = complete
+        self.size = CHAT_OVERHEAD + sum(message.size for message in messages)
+        self.expires_at = expires_at
+
+    def serves(self, limit: int) -> bool:
+        return self.complete or len(self.messages) >= limit
+
+    def detail(self, limit: int) -> ChatWithMessages:
+        """Chat with newest limit messages, newest first"""
+
+        chat_id = self.chat.id
+        count = min(limit, len(self.messages))
+        return ChatWithMessages(
+            chat=self.chat,
+            messages=[
+                MessageResponse.model_construct(
+                    id=message.id,
+                    chat_id=chat_id,
+                    seq=message.seq,
+                    text=message.text,
+                    created_at=message.created_at,
+                )
+                for message in (self.messages[-i] for i in range(1, count + 1))
+            ],
+        )
+
+
+class HotTail:
+    """
+    Per-process LRU cache of the last capacity messages of active chats,
+    bounded by chats count and approximate memory.
+
+    Writes of this process are appended right away, writes of other processes
+    are seen after max_age seconds, when the chat is filled from db again.
+
+    Args:
+        capacity: int - messages kept per chat
+        max_chats: int - chats kept
+        max_bytes: int - approximate memory cap for kept messages
+        max_age: float - seconds before chat is refilled from db
+    """
+
+    def __init__(self, capacity: int, max_chats: int, max_bytes: int, max_age: float):
+        self.capacity = capacity
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._chats: OrderedDict[int, ChatTail] = OrderedDict()
+        # chat id -> whether it was written to while its fill is in flight
+        self._fills: dict[int, bool] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_id: int, limit: int) -> ChatTail | None:
+        """
+        Returns:
+            ChatTail | None - chat's tail if it has limit messages
+        """
+
+        tail = self._chats.get(chat_id)
+        if tail is not None and tail.expires_at <= time.monotonic():
+            self._remove(chat_id)
+            tail = None
+        if tail is None or not tail.serves(limit):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._chats.move_to_end(chat_id)
+        return tail
+
+    def begin_fill(self, chat_id: int) -> None:
+        """Mark chat as being read from db, call before reading it"""
+
+        self._fills[chat_id] = False
+
+    def fill(self, chat: Chat, messages: Sequence[Message]) -> ChatTail:
+        """
+        Store chat read from db, unless it was written to since begin_fill
+
+        Args:
+            chat: Chat - the chat
+            messages: Sequence[Message] - its last capacity messages, newest first
+
+        Returns:
+            ChatTail - chat's tail, stored or not
+        """
+
+        tail = ChatTail(
+            chat=ChatResponse.model_validate(chat),
+            messages=deque(
+                (
+                    TailMessage(
+                        message.id, message.seq, message.text, message.created_at
+                    )
+                    for message in reversed(messages)
+                ),
+                maxlen=self.capacity,
+            ),
+            complete=len(messages) < self.capacity,
+            expires_at=time.monotonic() + self.max_age,
+        )
+        if self._fills.pop(chat.id, True):
+            return tail
+
+        self._remove(chat.id)
+        self._chats[chat.id] = tail
+        self._bytes += tail.size
+        self._shrink()
+        return tail
+
+    def append(self, message: Message) -> None:
+        """Add message just written to its chat's tail"""
+
+        chat_id = message.chat_id
+        if chat_id in self._fills:
+            self._fills[chat_id] = True
+        tail = self._chats.get(chat_id)
+        if tail is None:
+            return
+
+        if len(tail.messages) == self.capacity:
+            dropped = tail.messages[0]
+            tail.size -= dropped.size
+            self._bytes -= dropped.size
+            tail.complete = False
+        added = TailMessage(message.id, message.seq, message.text, message.created_at)
+        tail.messages.append(added)
+        tail.size += added.size
+        self._bytes += added.size
+        self._shrink()
+
+    def evict(self, chat_id: int) -> None:
+        if chat_id in self._fills:
+            self._fills[chat_id] = True
+        self._remove(chat_id)
+
+    def clear(self) -> None:
+        self._chats.clear()
+        self._fills.clear()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        reads = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "max_chats": self.max_chats,
+            "messages": sum(len(tail.messages) for tail in self._chats.values()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / reads if reads else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, chat_id: int) -> None:
+        tail = self._chats.pop(chat_id, None)
+        if tail is not None:
+            self._bytes -= tail.size
+
+    def _shrink(self) -> None:
+        while self._chats and (
+            len(self._chats) > self.max_chats or self._bytes > self.max_bytes
+        ):
+            _, tail = self._chats.popitem(last=False)
+            self._bytes -= tail.size
+            self.evictions += 1
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.message import MessageResponse
+from core import ShardMap, ShardSessions, get_logger, settings
+from core.models import IdempotencyKey
+from .chat import ChatService
+
+logger = get_logger(__name__)
+
+
+class IdempotencyCache:
+    """
+    Bounded per-process LRU cache of idempotency keys with TTL eviction,
+    in front of the idempotency_keys table
+
+    Args:
+        max_size: int - max keys kept, least recently used are evicted first
+        ttl: float - seconds a key lives
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[
+            str, tuple[float, int, str | None, MessageResponse]
+        ] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> tuple[int, str | None, MessageResponse] | None:
+        """
+        Returns:
+            tuple[int, str | None, MessageResponse] | None - chat's id, request's
+            hash and response stored for key, None if key is unknown or expired
+        """
+
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, chat_id, request_hash, response = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return chat_id, request_hash, response
+
+    def put(
+        self,
+        key: str,
+        chat_id: int,
+        request_hash: str | None,
+        response: MessageResponse,
+        ttl: float | None = None,
+    ) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._items[key] = (expires_at, chat_id, request_hash, response)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+idempotency_cache = IdempotencyCache(
+    max_size=settings.idempotency.cache_size,
+    ttl=settings.idempotency.ttl_seconds,
+)
+
+
+class IdempotencyService:
+    @classmethod
+    async def create_message(
+        cls, shards: ShardSessions, chat_id: int, text: str, key: str
+    ) -> tuple[MessageResponse, bool]:
+        """
+        Create message in chat once per idempotency key.
+        Retries with the same key get the original response back,
+        from the process cache while the key is still in idempotency_keys
+        table on the chat's shard, else from the table itself.
+        A key reused for another chat or text is rejected.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_id: int - chat's id to create message in
+            text: str - message's text
+            key: str - client provided Idempotency-Key
+
+        Returns:
+            tuple[MessageResponse, bool] - message and whether it is a replay
+
+        Raises:
+            HTTPException - 422 if key is already used for another request
+        """
+
+        request_hash = hashlib.sha256(text.encode()).hexdigest()
+        session = shards.for_chat(chat_id, write=True)
+        cached = idempotency_cache.get(key)
+        if cached is not None:
+            response = cls._replay(chat_id, request_hash, *cached)
+            # key is gone if purged or its chat deleted by another process
+            if await cls._is_stored(session, key, response.id):
+                return response, True
+            idempotency_cache.discard(key)
+
+        stored = await cls._get_stored(session, key)
+        if stored is not None:
+            ttl = cls._remaining_ttl(stored)
+            if ttl > 0:
+                return (
+                    cls._replay(chat_id, request_hash, *cls._cache(stored, ttl)),
+                    True,
+                )
+            # expired key is replaced in the same transaction as the message
+            await session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.id == stored.id)
+            )
+
+        try:
+            message = await ChatService.create_message(
+                shards, chat_id, text, idempotency_key=key, request_hash=request_hash
+            )
+        except IntegrityError:
+            await session.rollback()
+            stored = await cls._get_stored(session, key)
+            if stored is None:
+                raise
+            logger.debug(f"Concurrent request stored Idempotency-Key {key} first")
+            return cls._replay(chat_id, request_hash, *cls._cache(stored)), True
+
+        response = MessageResponse.model_validate(message)
+        idempotency_cache.put(key, chat_id, request_hash, response)
+        return response, False
+
+    @staticmethod
+    async def purge_expired(session: AsyncSession) -> int:
+        """
+        Delete expired keys from db
+
+        Returns:
+            int - deleted keys count
+        """
+
+        cutoff = datetime.now(UTC) - timedelta(seconds=idempotency_cache.ttl)
+        result = await session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)
+        )
+        await session.commit()
+        return result.rowcount
+
+    @classmethod
+    async def purge_expired_every(cls, shard_map: ShardMap, interval: float) -> None:
+        """Delete expired keys of every shard every interval seconds, till cancelled"""
+
+        while True:
+            await asyncio.sleep(interval)
+            shards = ShardSessions(shard_map)
+            try:
+                purged = await shards.broadcast(cls.purge_expired)
+                logger.info(f"Purged {sum(purged)} expired idempotency keys")
+            except Exception:
+                # one bad purge must not stop purging for good
+                logger.exception("Purging expired idempotency keys failed")
+            finally:
+                await shards.close()
+
+    @staticmethod
+    async def _is_stored(session: AsyncSession, key: str, message_id: int) -> bool:
+        stmt = select(IdempotencyKey.id).where(
+            IdempotencyKey.key == key, IdempotencyKey.message_id == message_id
+        )
+        return await session.scalar(stmt) is not None
+
+    @staticmethod
+    async def _get_stored(session: AsyncSession, key: str) -> IdempotencyKey | None:
+        stmt = select(IdempotencyKey).where(IdempotencyKey.key == key)
+        return await session.scalar(stmt)
+
+    @staticmethod
+    def _remaining_ttl(stored: IdempotencyKey) -> float:
+        created_at = stored.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=UTC)
+        age = datetime.now(UTC) - created_at
+        return idempotency_cache.ttl - age.total_seconds()
+
+    @staticmethod
+    def _cache(
+        stored: IdempotencyKey, ttl: float | None = None
+    ) -> tuple[int, str | None, MessageResponse]:
+        response = MessageResponse.model_validate_json(stored.response)
+        idempotency_cache.put(
+            stored.key, stored.chat_id, stored.request_hash, response, ttl
+        )
+        return stored.chat_id, stored.request_hash, response
+
+    @staticmethod
+    def _replay(
+        chat_id: int,
+        request_hash: str,
+        stored_chat_id: int,
+        stored_request_hash: str | None,
+        response: MessageResponse,
+    ) -> MessageResponse:
+        if stored_chat_id != chat_id:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key is already used for another chat",
+            )
+        # keys stored before request hashes were kept match any text
+        if stored_request_hash not in (None, request_hash):
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key is already used for another request",
+            )
+        return response
@@ -0,0 +1,367 @@
+import json
+from datetime import UTC, datetime
+from typing import AsyncIterable, AsyncIterator, Callable
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas import ChatImport, ImportReport, MessageImport
+from core import BucketFrozen, ShardMap, ShardSessions, get_logger
+from core.ids import generate_id
+from core.sharding import bucket_of
+from core.models import Chat, Message
+from .chat import hot_tail
+
+logger = get_logger(__name__)
+
+# lines loaded and committed in one transaction
+IMPORT_CHUNK_SIZE = 5000
+RECORD_SCHEMAS: dict[str, type[BaseModel]] = {
+    "chat": ChatImport,
+    "message": MessageImport,
+}
+MESSAGE_COLUMNS = ("id", "chat_id", "seq", "text", "created_at", "legacy_id")
+
+Chunk = list[tuple[int, bytes | str]]
+ChunkRecords = tuple[dict[int, ChatImport], list[tuple[int, MessageImport]]]
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split stream of byte chunks into lines
+
+    Args:
+        chunks: AsyncIterable[bytes] - e.g. request body stream
+
+    Returns:
+        AsyncIterator[bytes] - lines without line breaks
+    """
+
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+def parse_record(line: bytes | str) -> ChatImport | MessageImport:
+    """
+    Parse and validate NDJSON record
+
+    Args:
+        line: bytes | str - {"type": "chat", "id", "title", "created_at"?}
+            or {"type": "message", "chat_id", "text", "created_at"?}
+
+    Returns:
+        ChatImport | MessageImport - validated record, texts are stripped
+
+    Raises:
+        ValueError - record is invalid
+    """
+
+    record = json.loads(line)
+    record_type = record.get("type") if isinstance(record, dict) else None
+    schema = RECORD_SCHEMAS.get(record_type) if isinstance(record_type, str) else None
+    if schema is None:
+        raise ValueError(f"Record type must be one of: {', '.join(RECORD_SCHEMAS)}")
+
+    try:
+        item = schema.model_validate(record)
+    except ValidationError as exc:
+        raise ValueError(
+            "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in exc.errors()
+            )
+        ) from None
+
+    if isinstance(item, ChatImport):
+        item.title = item.title.strip()
+        if not item.title:
+            raise ValueError("Title cannot be empty")
+    else:
+        item.text = item.text.strip()
+        if not item.text:
+            raise ValueError("Text cannot be empty")
+    return item
+
+
+class ImportService:
+    @classmethod
+    async def import_ndjson(
+        cls,
+        shards: ShardSessions,
+        lines: AsyncIterable[bytes | str],
+        start_line: int = 0,
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+        on_progress: Callable[[ImportReport], None] | None = None,
+    ) -> ImportReport:
+        """
+        Import chats and messages from NDJSON, chunk by chunk.
+        Chats get new ids, their legacy ids are kept in Chat.legacy_id,
+        so chat must come before its messages, but may be in earlier import.
+        New id is in the bucket of legacy id, so both lead to the same shard.
+        Chats and messages with legacy id already imported are skipped,
+        so a chunk committed before its checkpoint is saved isn't duplicated.
+        Messages without id are imported again in that case.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            lines: AsyncIterable[bytes | str] - NDJSON lines
+            start_line: int - lines to skip, next_line of interrupted import
+            chunk_size: int - lines per transaction
+            on_progress: callable - called with report after each commit
+
+        Returns:
+            ImportReport - counters and line to resume from
+        """
+
+        report = ImportReport(next_line=start_line)
+        chunk: Chunk = []
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if line_no <= start_line:
+                continue
+            chunk.append((line_no, line))
+            if len(chunk) < chunk_size:
+                continue
+            if not await cls._commit_chunk(shards, chunk, report, on_progress):
+                return report
+            chunk = []
+
+        if chunk:
+            await cls._commit_chunk(shards, chunk, report, on_progress)
+        return report
+
+    @classmethod
+    async def _commit_chunk(
+        cls,
+        shards: ShardSessions,
+        chunk: Chunk,
+        report: ImportReport,
+        on_progress: Callable[[ImportReport], None] | None,
+    ) -> bool:
+        last_line = chunk[-1][0]
+        sessions = []
+        try:
+            chat_ids = set()
+            for shard, records in cls._parse_chunk(shards.map, chunk, report).items():
+                session = shards.get(shard)
+                sessions.append(session)
+                chat_ids |= await cls._load_chunk(session, shards.map, records, report)
+            # every statement has succeeded by now, so commits only fail
+            # when a shard is lost, leaving the chunk partially imported
+            for session in sessions:
+                await session.commit()
+        except (SQLAlchemyError, BucketFrozen) as exc:
+            for session in sessions:
+                await session.rollback()
+            report.aborted = f"Chunk ending at line {last_line} failed: {exc}"
+            logger.exception(f"Import aborted, resume from line {report.next_line}")
+            return False
+
+        for chat_id in chat_ids:
+            hot_tail.evict(chat_id)
+        report.next_line = last_line
+        logger.info(
+            f"Imported up to line {last_line}: {report.chats} chats, "
+            f"{report.messages} messages, {report.error_count} errors"
+        )
+        if on_progress is not None:
+            on_progress(report)
+        return True
+
+    @staticmethod
+    def _parse_chunk(
+        shard_map: ShardMap, chunk: Chunk, report: ImportReport
+    ) -> dict[str, ChunkRecords]:
+        """
+        Returns:
+            dict[str, ChunkRecords] - chats and messages by shard's name
+        """
+
+        records: dict[str, ChunkRecords] = {}
+        for line_no, line in chunk:
+            if not line.strip():
+                continue
+            try:
+                item = parse_record(line)
+            except ValueError as exc:
+                report.add_error(line_no, str(exc))
+                continue
+            legacy_id = item.id if isinstance(item, ChatImport) else item.chat_id
+            try:
+                shard = shard_map.shard_of(legacy_id, write=True)
+            except BucketFrozen as exc:
+                # the rest of the chunk goes on, the line can be imported again
+                # once rebalancing is done
+                report.add_error(line_no, f"Chat {legacy_id} is being moved: {exc}")
+                continue
+            chats, messages = records.setdefault(shard, ({}, []))
+            if isinstance(item, ChatImport):
+                chats[item.id] = item
+            else:
+                messages.append((line_no, item))
+        return records
+
+    @classmethod
+    async def _load_chunk(
+        cls,
+        session: AsyncSession,
+        shard_map: ShardMap,
+        records: ChunkRecords,
+        report: ImportReport,
+    ) -> set[int]:
+        """
+        Returns:
+            set[int] - ids of chats that got messages
+        """
+
+        chats, messages = records
+        legacy_ids = chats.keys() | {message.chat_id for _, message in messages}
+        if not legacy_ids:
+            return set()
+
+        now = datetime.now(UTC)
+        id_map = await cls._get_chat_ids(session, legacy_ids)
+        new_chats = [chat for chat in chats.values() if chat.id not in id_map]
+        report.skipped_chats += len(chats) - len(new_chats)
+        if new_chats:
+            id_map.update(await cls._insert_chats(session, shard_map, new_chats, now))
+            report.chats += len(new_chats)
+
+        imported = []
+        for line_no, message in messages:
+            chat_id = id_map.get(message.chat_id)
+            if chat_id is None:
+                report.add_error(line_no, f"Chat {message.chat_id} is not imported")
+                continue
+            imported.append((chat_id, message))
+        if not imported:
+            return set()
+
+        last_seqs = await cls._lock_last_seqs(
+            session, {chat_id for chat_id, _ in imported}
+        )
+        # read after locking chats, so concurrent imports don't both miss them
+        seen = await cls._get_message_legacy_ids(session, imported)
+        rows = []
+        for chat_id, message in imported:
+            if message.id is not None:
+                if (chat_id, message.id) in seen:
+                    report.skipped_messages += 1
+                    continue
+                seen.add((chat_id, message.id))
+            last_seqs[chat_id] += 1
+            rows.append(
+                (
+                    generate_id(),
+                    chat_id,
+                    last_seqs[chat_id],
+                    message.text,
+                    message.created_at or now,
+                    message.id,
+                )
+            )
+        if not rows:
+            return set()
+        await cls._copy_messages(session, rows)
+        await session.execute(
+            update(Chat),
+            [
+                {"id": chat_id, "last_seq": last_seq}
+                for chat_id, last_seq in last_seqs.items()
+            ],
+        )
+        report.messages += len(rows)
+        return set(last_seqs)
+
+    @staticmethod
+    async def _get_chat_ids(
+        session: AsyncSession, legacy_ids: set[int]
+    ) -> dict[int, int]:
+        stmt = select(Chat.legacy_id, Chat.id).where(Chat.legacy_id.in_(legacy_ids))
+        result = await session.execute(stmt)
+        return dict(result.tuples().all())
+
+    @staticmethod
+    async def _get_message_legacy_ids(
+        session: AsyncSession, imported: list[tuple[int, MessageImport]]
+    ) -> set[tuple[int, int]]:
+        """
+        Returns:
+            set[tuple[int, int]] - chat's id and legacy id of imported messages
+        """
+
+        legacy_ids = {message.id for _, message in imported if message.id is not None}
+        if not legacy_ids:
+            return set()
+        stmt = select(Message.chat_id, Message.legacy_id).where(
+            Message.chat_id.in_({chat_id for chat_id, _ in imported}),
+            Message.legacy_id.in_(legacy_ids),
+        )
+        result = await session.execute(stmt)
+        return set(result.tuples().all())
+
+    @staticmethod
+    async def _lock_last_seqs(
+        session: AsyncSession, chat_ids: set[int]
+    ) -> dict[int, int]:
+        """Lock chats till commit, messages are numbered from their last_seq"""
+
+        stmt = (
+            select(Chat.id, Chat.last_seq)
+            .where(Chat.id.in_(chat_ids))
+            .with_for_update()
+        )
+        result = await session.execute(stmt)
+        return dict(result.tuples().all())
+
+    @staticmethod
+    async def _insert_chats(
+        session: AsyncSession,
+        shard_map: ShardMap,
+        chats: list[ChatImport],
+        now: datetime,
+    ) -> dict[int, int]:
+        id_map = {
+            chat.id: shard_map.new_chat_id(bucket=bucket_of(chat.id)) for chat in chats
+        }
+        await session.execute(
+            insert(Chat),
+            [
+                {
+                    "id": id_map[chat.id],
+                    "legacy_id": chat.id,
+                    "title": chat.title,
+                    "created_at": chat.created_at or now,
+                }
+                for chat in chats
+            ],
+        )
+        return id_map
+
+    @staticmethod
+    async def _copy_messages(
+        session: AsyncSession,
+        rows: list[tuple[int, int, int, str, datetime, int | None]],
+    ) -> None:
+        """Load messages with COPY on asyncpg, with executemany elsewhere"""
+
+        connection = await session.connection()
+        if connection.dialect.driver == "asyncpg":
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                Message.__tablename__, records=rows, columns=MESSAGE_COLUMNS
+            )
+            return
+
+        await session.execute(
+            insert(Message), [dict(zip(MESSAGE_COLUMNS, row)) for row in rows]
+        )
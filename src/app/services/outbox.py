@@ -0,0 +1,413 @@
+import asyncio
+import json
+import time
+from datetime import UTC, datetime, timedelta
+from enum import Enum
+from typing import Awaitable, Callable, NamedTuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from core import ShardMap, ShardSessions, get_logger, settings
+from core.ids import generate_id
+from core.models import OutboxEvent
+from core.models.base import utcnow
+
+logger = get_logger(__name__)
+
+
+class EventType(str, Enum):
+    chat_created = "chat.created"
+    chat_deleted = "chat.deleted"
+    message_created = "message.created"
+
+
+class Event(NamedTuple):
+    """Outbox event as handlers get it, payload decoded"""
+
+    id: int
+    chat_id: int
+    type: str
+    payload: dict
+    created_at: datetime
+    attempts: int
+
+
+Handler = Callable[[Event], Awaitable[None]]
+
+
+def aware(moment: datetime) -> datetime:
+    # SQLite gives back naive datetimes, stored ones are UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=UTC)
+    return moment
+
+
+class OutboxService:
+    @staticmethod
+    def add_event(
+        session: AsyncSession, event_type: EventType, chat_id: int, payload: str
+    ) -> OutboxEvent | None:
+        """
+        Add event to session, it's inserted by the commit of the change
+        it's about, so it exists if and only if the change does.
+        Events of types no handler is registered for aren't written.
+
+        Args:
+            session: AsyncSession - db async session of chat's shard
+            event_type: EventType - event type
+            chat_id: int - chat the event is about
+            payload: str - event data as JSON
+
+        Returns:
+            OutboxEvent | None - added event, None if nobody handles it
+        """
+
+        if not outbox_dispatcher.handles(event_type):
+            return None
+        now = utcnow()
+        event = OutboxEvent(
+            id=generate_id(),
+            chat_id=chat_id,
+            type=event_type.value,
+            payload=payload,
+            created_at=now,
+            available_at=now,
+            attempts=0,
+        )
+        session.add(event)
+        return event
+
+    @staticmethod
+    async def get_backlog(shards: ShardSessions) -> dict:
+        """
+        Pending and dead events over all shards, one query per shard
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+
+        Returns:
+            dict - pending and dead counts, age in seconds of the oldest pending
+        """
+
+        async def get_shard_backlog(session: AsyncSession):
+            stmt = select(
+                func.count(OutboxEvent.id).filter(OutboxEvent.dead_at.is_(None)),
+                func.count(OutboxEvent.id).filter(OutboxEvent.dead_at.is_not(None)),
+                func.min(OutboxEvent.created_at).filter(OutboxEvent.dead_at.is_(None)),
+            )
+            return (await session.execute(stmt)).one()
+
+        pending = dead = 0
+        oldest = None
+        for shard_pending, shard_dead, shard_oldest in await shards.broadcast(
+            get_shard_backlog
+        ):
+            pending += shard_pending
+            dead += shard_dead
+            if shard_oldest is not None:
+                shard_oldest = aware(shard_oldest)
+                oldest = shard_oldest if oldest is None else min(oldest, shard_oldest)
+        oldest_age = (utcnow() - oldest).total_seconds() if oldest else 0.0
+        return {"pending": pending, "dead": dead, "oldest_pending_age": oldest_age}
+
+
+class OutboxDispatcher:
+    """
+    Runs handlers of outbox events after their transactions commit,
+    so requests pay only for inserting them. Events of a chat are
+    handled one after another in the order they were written,
+    events of different chats concurrently. Delivery is at least once,
+    handlers must tolerate repeated events.
+
+    Args:
+        batch_size: int - events claimed per shard in one transaction
+        handler_timeout: float - seconds a handler may take
+        lease: float - seconds claimed events are kept from other
+            dispatchers, more than handler_timeout
+        max_attempts: int - failed attempts before an event is dead
+        retry_delay: float - seconds before the first retry, doubled after
+        max_retry_delay: float - longest delay between retries
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        handler_timeout: float = 10.0,
+        lease: float = 60.0,
+        max_attempts: int = 10,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 300.0,
+    ):
+        if lease <= handler_timeout:
+            raise ValueError("Lease must be longer than handler timeout")
+        self.batch_size = batch_size
+        self.handler_timeout = handler_timeout
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._handlers: dict[str, list[Handler]] = {}
+        self._wakeup = asyncio.Event()
+        self.reset_stats()
+
+    def register(self, event_type: EventType) -> Callable[[Handler], Handler]:
+        """Decorator adding handler of events of the type"""
+
+        def decorator(handler: Handler) -> Handler:
+            self._handlers.setdefault(event_type.value, []).append(handler)
+            return handler
+
+        return decorator
+
+    def unregister(self, event_type: EventType, handler: Handler) -> None:
+        self._handlers.get(event_type.value, []).remove(handler)
+
+    def handles(self, event_type: EventType) -> bool:
+        return bool(self._handlers.get(event_type.value))
+
+    def notify(self) -> None:
+        """Wake the dispatcher up, new events were committed"""
+
+        self._wakeup.set()
+
+    def reset_stats(self) -> None:
+        self.dispatched: dict[str, int] = {}
+        self.retried = 0
+        self.given_up = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "dispatched": dict(self.dispatched),
+            "retried": self.retried,
+            "given_up": self.given_up,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+        }
+
+    async def dispatch(self, shards: ShardSessions) -> int:
+        """
+        Dispatch one batch on every shard. A failing shard is logged
+        and tried again on the next call.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+
+        Returns:
+            int - events handled or given up
+        """
+
+        handled = 0
+        for shard in shards.map.shards:
+            session = shards.get(shard)
+            try:
+                handled += await self.dispatch_batch(session)
+            except Exception as exc:
+                logger.warning(f"Dispatching outbox of {shard} failed: {exc!r}")
+                await session.rollback()
+        return handled
+
+    async def dispatch_batch(self, session: AsyncSession) -> int:
+        """
+        Claim a batch of events of one shard and run their handlers.
+        Only chats whose first pending event is due are claimed,
+        by locking that event with SKIP LOCKED, so concurrent
+        dispatchers take different chats and a chat waiting for
+        a retry holds back its later events. Claimed events are leased,
+        due again only after lease seconds, and the claim is committed
+        before handlers run, so no transaction is open meanwhile.
+        A second short transaction deletes handled events, schedules
+        failed ones for a retry or marks them dead and frees the rest.
+        Events of a dispatcher that died are claimed again after the lease.
+
+        Args:
+            session: AsyncSession - db async session of the shard
+
+        Returns:
+            int - events handled or given up
+        """
+
+        now = utcnow()
+        events = await self._claim(session, now)
+        if not events:
+            return 0
+
+        by_chat: dict[int, list[OutboxEvent]] = {}
+        for event in events:
+            by_chat.setdefault(event.chat_id, []).append(event)
+        # no handler starts that could outlive the lease
+        deadline = time.monotonic() + self.lease - self.handler_timeout
+        results = await asyncio.gather(
+            *(
+                self._handle_chat(chat_events, now, deadline)
+                for chat_events in by_chat.values()
+            )
+        )
+        done = [event for handled, _ in results for event in handled]
+        failed = [failure for _, failure in results if failure is not None]
+
+        finished_ids = {event.id for event in done}
+        finished_ids.update(event.id for event, _ in failed)
+        unfinished_ids = [event.id for event in events if event.id not in finished_ids]
+        if done:
+            await session.execute(
+                delete(OutboxEvent).where(
+                    OutboxEvent.id.in_([event.id for event in done])
+                )
+            )
+        for event, error in failed:
+            await session.execute(self._fail(event, error, now))
+        if unfinished_ids:
+            await session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(unfinished_ids))
+                .values(available_at=now)
+            )
+        await session.commit()
+
+        finished = utcnow()
+        for event in done:
+            self.dispatched[event.type] = self.dispatched.get(event.type, 0) + 1
+            lag = (finished - aware(event.created_at)).total_seconds()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+        return len(done) + sum(
+            1 for event, _ in failed if event.attempts + 1 >= self.max_attempts
+        )
+
+    async def _claim(self, session: AsyncSession, now: datetime) -> list[OutboxEvent]:
+        earlier = aliased(OutboxEvent)
+        heads = (
+            select(OutboxEvent.chat_id)
+            .where(
+                OutboxEvent.dead_at.is_(None),
+                OutboxEvent.available_at <= now,
+                ~select(earlier.id)
+                .where(
+                    earlier.chat_id == OutboxEvent.chat_id,
+                    earlier.id < OutboxEvent.id,
+                    earlier.dead_at.is_(None),
+                )
+                .exists(),
+            )
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        chat_ids = (await session.scalars(heads)).all()
+        if not chat_ids:
+            await session.commit()
+            return []
+
+        # later events of claimed chats can't be claimed by anyone else
+        # while their first one is locked, and then leased
+        stmt = (
+            select(OutboxEvent)
+            .where(OutboxEvent.chat_id.in_(chat_ids), OutboxEvent.dead_at.is_(None))
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        )
+        events = list(await session.scalars(stmt))
+        await session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_([event.id for event in events]))
+            .values(available_at=now + timedelta(seconds=self.lease))
+            # loaded events keep their due times, handling checks them
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return events
+
+    async def _handle_chat(
+        self, events: list[OutboxEvent], now: datetime, deadline: float
+    ) -> tuple[list[OutboxEvent], tuple[OutboxEvent, str] | None]:
+        # in order, the first failure holds back the rest of the chat,
+        # events left when the lease runs short are freed for the next batch
+        handled = []
+        for event in events:
+            if aware(event.available_at) > now or time.monotonic() > deadline:
+                break
+            try:
+                await self._handle(event)
+            except Exception as exc:
+                return handled, (event, repr(exc))
+            handled.append(event)
+        return handled, None
+
+    async def _handle(self, event: OutboxEvent) -> None:
+        handlers = self._handlers.get(event.type)
+        if not handlers:
+            return
+        decoded = Event(
+            id=event.id,
+            chat_id=event.chat_id,
+            type=event.type,
+            payload=json.loads(event.payload),
+            created_at=aware(event.created_at),
+            attempts=event.attempts,
+        )
+        async with asyncio.timeout(self.handler_timeout):
+            for handler in handlers:
+                await handler(decoded)
+
+    def _fail(self, event: OutboxEvent, error: str, now: datetime):
+        attempts = event.attempts + 1
+        values = {"attempts": attempts, "last_error": error}
+        if attempts >= self.max_attempts:
+            self.given_up += 1
+            values["dead_at"] = now
+            logger.error(
+                f"Outbox event {event.id} ({event.type}) is dead "
+                f"after {attempts} attempts: {error}"
+            )
+        else:
+            self.retried += 1
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+            values["available_at"] = now + timedelta(seconds=delay)
+        return update(OutboxEvent).where(OutboxEvent.id == event.id).values(**values)
+
+    async def run(self, shard_map: ShardMap, poll_interval: float) -> None:
+        """
+        Dispatch till cancelled. Full batches are followed right away,
+        otherwise waits for notify or poll_interval seconds,
+        whichever comes first.
+
+        Args:
+            shard_map: ShardMap - shards to dispatch events of
+            poll_interval: float - longest wait between batches
+        """
+
+        while True:
+            self._wakeup.clear()
+            try:
+                handled = await self._dispatch_once(shard_map)
+            except Exception:
+                # e.g. connection refused, the next poll tries again
+                logger.exception("Dispatching outbox failed")
+                handled = 0
+            if handled >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+            except TimeoutError:
+                pass
+
+    async def _dispatch_once(self, shard_map: ShardMap) -> int:
+        shards = ShardSessions(shard_map)
+        try:
+            return await self.dispatch(shards)
+        finally:
+            await shards.close()
+
+
+outbox_dispatcher = OutboxDispatcher(
+    batch_size=settings.outbox.batch_size,
+    handler_timeout=settings.outbox.handler_timeout,
+    lease=settings.outbox.lease,
+    max_attempts=settings.outbox.max_attempts,
+    retry_delay=settings.outbox.retry_delay,
+    max_retry_delay=settings.outbox.max_retry_delay,
+)
@@ -0,0 +1,34 @@
+class ReadMarkers:
+    """
+    Per-process buffer of read positions not yet written to db.
+    Repeated marks of a reader in a chat coalesce into one, the furthest
+    position wins, so positions never move back however marks interleave.
+    """
+
+    def __init__(self):
+        self._positions: dict[tuple[int, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def mark(self, chat_id: int, reader_id: int, seq: int) -> None:
+        key = (chat_id, reader_id)
+        if seq > self._positions.get(key, -1):
+            self._positions[key] = seq
+
+    def get(self, chat_id: int, reader_id: int) -> int | None:
+        return self._positions.get((chat_id, reader_id))
+
+    def drain(self) -> dict[tuple[int, int], int]:
+        """
+        Take all buffered positions, leaving the buffer empty
+
+        Returns:
+            dict[tuple[int, int], int] - last read seq by chat's and reader's id
+        """
+
+        positions, self._positions = self._positions, {}
+        return positions
+
+    def clear(self) -> None:
+        self._positions.clear()
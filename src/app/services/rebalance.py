@@ -0,0 +1,235 @@
+from typing import AsyncIterator
+
+from sqlalchemy import Table, bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import get_logger
+from core.models import Chat, IdempotencyKey, Message, OutboxEvent, ReadState
+from core.sharding import BUCKET_MASK
+
+logger = get_logger(__name__)
+
+# chats copied or deleted in one transaction, rows read at once while copying
+REBALANCE_BATCH_SIZE = 1000
+# tables holding chat's data, parents first
+CHAT_TABLES: tuple[Table, ...] = (
+    Chat.__table__,
+    Message.__table__,
+    IdempotencyKey.__table__,
+    ReadState.__table__,
+    # events copied and dispatched on both shards are delivered twice,
+    # which is within at least once delivery
+    OutboxEvent.__table__,
+)
+# columns of already copied rows that still change on source
+MUTABLE_COLUMNS: dict[str, tuple[str, ...]] = {
+    "chats": ("last_seq", "archived_seq", "archive_segment"),
+    "read_states": ("last_read_seq", "updated_at"),
+    "outbox_events": ("available_at", "attempts", "last_error", "dead_at"),
+}
+
+
+def chat_column(table: Table):
+    return table.c.id if table is Chat.__table__ else table.c.chat_id
+
+
+class RebalanceService:
+    @classmethod
+    async def copy_bucket(
+        cls,
+        source: AsyncSession,
+        target: AsyncSession,
+        bucket: int,
+        batch_size: int = REBALANCE_BATCH_SIZE,
+    ) -> dict[str, int]:
+        """
+        Copy chats of bucket with all their rows from source shard to target,
+        skipping rows target already has, so copying again picks up
+        only rows written to source since the last copy.
+        Mutable columns of rows target already has are updated.
+
+        Args:
+            source: AsyncSession - session of shard bucket is moved from
+            target: AsyncSession - session of shard bucket is moved to
+            bucket: int - bucket to copy
+            batch_size: int - chats per transaction on target
+
+        Returns:
+            dict[str, int] - copied rows by table's name
+        """
+
+        copied = {table.name: 0 for table in CHAT_TABLES}
+        async for chat_ids in cls._iter_chat_ids(source, bucket, batch_size):
+            for table in CHAT_TABLES:
+                copied[table.name] += await cls._copy_rows(
+                    source, target, table, chat_ids, batch_size
+                )
+            await target.commit()
+            logger.info(f"Bucket {bucket}: copied up to chat {chat_ids[-1]}")
+        await source.commit()
+        return copied
+
+    @classmethod
+    async def prune_bucket(
+        cls,
+        source: AsyncSession,
+        target: AsyncSession,
+        bucket: int,
+        batch_size: int = REBALANCE_BATCH_SIZE,
+    ) -> dict[str, int]:
+        """
+        Delete rows of bucket's chats target has, but source doesn't anymore,
+        e.g. chats deleted, messages archived or events dispatched since
+        they were copied. Chats gone from source are deleted from target with
+        all their rows. Run after the last copy, once bucket is frozen.
+
+        Args:
+            source: AsyncSession - session of shard bucket is moved from
+            target: AsyncSession - session of shard bucket is moved to
+            bucket: int - bucket to prune
+            batch_size: int - chats per transaction on target
+
+        Returns:
+            dict[str, int] - deleted rows by table's name
+        """
+
+        pruned = {table.name: 0 for table in CHAT_TABLES}
+        async for chat_ids in cls._iter_chat_ids(target, bucket, batch_size):
+            kept = set(
+                await source.scalars(select(Chat.id).where(Chat.id.in_(chat_ids)))
+            )
+            gone = [chat_id for chat_id in chat_ids if chat_id not in kept]
+            for table in reversed(CHAT_TABLES):
+                if gone:
+                    result = await target.execute(
+                        delete(table).where(chat_column(table).in_(gone))
+                    )
+                    pruned[table.name] += result.rowcount
+                if kept:
+                    pruned[table.name] += await cls._prune_rows(
+                        source, target, table, list(kept), batch_size
+                    )
+            await target.commit()
+        await source.commit()
+        return pruned
+
+    @classmethod
+    async def delete_bucket(
+        cls,
+        session: AsyncSession,
+        bucket: int,
+        batch_size: int = REBALANCE_BATCH_SIZE,
+    ) -> int:
+        """
+        Delete chats of bucket with all their rows from shard
+
+        Args:
+            session: AsyncSession - session of shard bucket was moved from
+            bucket: int - bucket to delete
+            batch_size: int - chats per transaction
+
+        Returns:
+            int - deleted chats count
+        """
+
+        deleted = 0
+        async for chat_ids in cls._iter_chat_ids(session, bucket, batch_size):
+            for table in reversed(CHAT_TABLES):
+                await session.execute(
+                    delete(table).where(chat_column(table).in_(chat_ids))
+                )
+            await session.commit()
+            deleted += len(chat_ids)
+        return deleted
+
+    @staticmethod
+    async def _iter_chat_ids(
+        session: AsyncSession, bucket: int, batch_size: int
+    ) -> AsyncIterator[list[int]]:
+        last_id = -1
+        while True:
+            stmt = (
+                select(Chat.id)
+                .where(Chat.id.op("&")(BUCKET_MASK) == bucket, Chat.id > last_id)
+                .order_by(Chat.id)
+                .limit(batch_size)
+            )
+            chat_ids = (await session.scalars(stmt)).all()
+            if not chat_ids:
+                return
+            yield chat_ids
+            last_id = chat_ids[-1]
+
+    @staticmethod
+    async def _prune_rows(
+        source: AsyncSession,
+        target: AsyncSession,
+        table: Table,
+        chat_ids: list[int],
+        batch_size: int,
+    ) -> int:
+        target_ids = list(
+            await target.scalars(
+                select(table.c.id).where(chat_column(table).in_(chat_ids))
+            )
+        )
+        pruned = 0
+        for start in range(0, len(target_ids), batch_size):
+            end = start + batch_size
+            ids = target_ids[start:end]
+            source_ids = set(
+                await source.scalars(select(table.c.id).where(table.c.id.in_(ids)))
+            )
+            missing = [id_ for id_ in ids if id_ not in source_ids]
+            if missing:
+                await target.execute(delete(table).where(table.c.id.in_(missing)))
+                pruned += len(missing)
+        return pruned
+
+    @staticmethod
+    async def _copy_rows(
+        source: AsyncSession,
+        target: AsyncSession,
+        table: Table,
+        chat_ids: list[int],
+        batch_size: int,
+    ) -> int:
+        copied = 0
+        stmt = (
+            select(table)
+            .where(chat_column(table).in_(chat_ids))
+            .execution_options(yield_per=batch_size)
+        )
+        result = await source.stream(stmt)
+        async for rows in result.mappings().partitions():
+            existing = set(
+                await target.scalars(
+                    select(table.c.id).where(
+                        table.c.id.in_([row["id"] for row in rows])
+                    )
+                )
+            )
+            new_rows = [dict(row) for row in rows if row["id"] not in existing]
+            if new_rows:
+                await target.execute(insert(table), new_rows)
+                copied += len(new_rows)
+
+            columns = MUTABLE_COLUMNS.get(table.name, ())
+            if columns and existing:
+                stmt = (
+                    update(table)
+                    .where(table.c.id == bindparam("row_id"))
+                    .values({column: bindparam(f"new_{column}") for column in columns})
+                )
+                await target.execute(
+                    stmt,
+                    [
+                        {
+                            "row_id": row["id"],
+                            **{f"new_{column}": row[column] for column in columns},
+                        }
+                        for row in rows
+                        if row["id"] in existing
+                    ],
+                )
+        return copied
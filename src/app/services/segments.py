@@ -0,0 +1,278 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, NamedTuple, Sequence
+
+from core.models import Message
+
+# chat_id, first_seq, last_seq, offset and length of block in data file
+INDEX_RECORD = struct.Struct("<qqqqq")
+# segments kept mapped per process
+MAX_OPEN_SEGMENTS = 128
+
+
+class BlockRef(NamedTuple):
+    chat_id: int
+    first_seq: int
+    last_seq: int
+    offset: int
+    length: int
+
+
+class SegmentIndex(Sequence[BlockRef]):
+    """
+    Index of segment's blocks, sorted by chat_id and first_seq,
+    read in place from memory-mapped index file
+
+    Args:
+        buffer: mmap | bytes - index file contents
+    """
+
+    def __init__(self, buffer: mmap.mmap | bytes):
+        self._buffer = buffer
+        self._len = len(buffer) // INDEX_RECORD.size
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, i: int) -> BlockRef:
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return BlockRef(*INDEX_RECORD.unpack_from(self._buffer, i * INDEX_RECORD.size))
+
+    def chat_ids(self) -> set[int]:
+        return {ref.chat_id for ref in self}
+
+    def blocks(self, chat_id: int, first_seq: int, last_seq: int) -> list[BlockRef]:
+        """
+        Returns:
+            list[BlockRef] - chat's blocks overlapping first_seq..last_seq
+        """
+
+        refs = []
+        i = bisect_left(self, chat_id, key=lambda ref: ref.chat_id)
+        while i < self._len:
+            ref = self[i]
+            if ref.chat_id != chat_id or ref.first_seq > last_seq:
+                break
+            if ref.last_seq >= first_seq:
+                refs.append(ref)
+            i += 1
+        return refs
+
+
+def encode_segment(
+    chats: Iterable[tuple[int, Sequence[Message]]], block_size: int
+) -> tuple[bytes, bytes]:
+    """
+    Pack chats' messages into segment: zlib-compressed NDJSON blocks
+    of at most block_size messages of one chat, and their index
+
+    Args:
+        chats: Iterable[tuple[int, Sequence[Message]]] - chat's id and its
+            messages in seq order
+        block_size: int - messages per block
+
+    Returns:
+        tuple[bytes, bytes] - data and index files contents
+    """
+
+    data = bytearray()
+    index = bytearray()
+    for chat_id, messages in sorted(chats, key=lambda chat: chat[0]):
+        for start in range(0, len(messages), block_size):
+            end = start + block_size
+            block = messages[start:end]
+            payload = zlib.compress(
+                "".join(
+                    json.dumps(
+                        [message.id, message.seq, message.text, message.created_at],
+                        default=datetime.isoformat,
+                    )
+                    + "\n"
+                    for message in block
+                ).encode()
+            )
+            index += INDEX_RECORD.pack(
+                chat_id, block[0].seq, block[-1].seq, len(data), len(payload)
+            )
+            data += payload
+    return bytes(data), bytes(index)
+
+
+def decode_block(chat_id: int, payload: bytes) -> list[Message]:
+    """
+    Returns:
+        list[Message] - block's messages in seq order, not attached to a session
+    """
+
+    messages = []
+    for line in zlib.decompress(payload).splitlines():
+        id_, seq, text, created_at = json.loads(line)
+        messages.append(
+            Message(
+                id=id_,
+                chat_id=chat_id,
+                seq=seq,
+                text=text,
+                created_at=datetime.fromisoformat(created_at),
+            )
+        )
+    return messages
+
+
+class SegmentStore(ABC):
+    """
+    Where segments live. Segments are immutable once written.
+    Object store implementations read data with ranged GETs and keep
+    local copies of index files to map them.
+    """
+
+    @abstractmethod
+    async def write(self, name: str, data: bytes, index: bytes) -> None:
+        """Store segment, index last, so indexed segments are complete"""
+
+    @abstractmethod
+    async def read(self, name: str, offset: int, length: int) -> bytes:
+        """Read block from segment's data"""
+
+    @abstractmethod
+    def open_index(self, name: str) -> SegmentIndex:
+        """Segment's index, mapped into memory"""
+
+    @abstractmethod
+    async def names(self) -> list[str]:
+        """Names of complete segments"""
+
+    @abstractmethod
+    async def exists(self, name: str) -> bool: ...
+
+    @abstractmethod
+    async def remove(self, name: str) -> None:
+        """Delete segment, index first, so it isn't listed half removed"""
+
+    async def read_messages(
+        self, name: str, chat_id: int, first_seq: int, last_seq: int
+    ) -> list[Message]:
+        """
+        Returns:
+            list[Message] - chat's messages with first_seq..last_seq, in seq order
+        """
+
+        messages = []
+        for ref in self.open_index(name).blocks(chat_id, first_seq, last_seq):
+            payload = await self.read(name, ref.offset, ref.length)
+            block = await asyncio.to_thread(decode_block, chat_id, payload)
+            messages.extend(
+                message for message in block if first_seq <= message.seq <= last_seq
+            )
+        return messages
+
+
+class LocalSegmentStore(SegmentStore):
+    """
+    Segments as <name>.data and <name>.idx files in root directory,
+    both memory-mapped on first read. Mapping, reading and decoding
+    run in threads, page faults on cold segments don't block the event loop.
+
+    Args:
+        root: Path - segments' directory, created on first write
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._maps: OrderedDict[str, tuple[mmap.mmap, SegmentIndex]] = OrderedDict()
+        # segments are opened from several threads
+        self._lock = threading.Lock()
+
+    async def write(self, name: str, data: bytes, index: bytes) -> None:
+        await asyncio.to_thread(self._write, name, data, index)
+
+    async def read(self, name: str, offset: int, length: int) -> bytes:
+        return await asyncio.to_thread(self._read, name, offset, length)
+
+    def open_index(self, name: str) -> SegmentIndex:
+        _, index = self._open(name)
+        return index
+
+    async def names(self) -> list[str]:
+        paths = await asyncio.to_thread(lambda: list(self.root.glob("*.idx")))
+        return sorted(path.stem for path in paths)
+
+    async def exists(self, name: str) -> bool:
+        return await asyncio.to_thread((self.root / f"{name}.idx").exists)
+
+    async def remove(self, name: str) -> None:
+        with self._lock:
+            self._maps.pop(name, None)
+        for suffix in ("idx", "data"):
+            await asyncio.to_thread(
+                (self.root / f"{name}.{suffix}").unlink, missing_ok=True
+            )
+
+    async def read_messages(
+        self, name: str, chat_id: int, first_seq: int, last_seq: int
+    ) -> list[Message]:
+        return await asyncio.to_thread(
+            self._read_messages, name, chat_id, first_seq, last_seq
+        )
+
+    def _read_messages(
+        self, name: str, chat_id: int, first_seq: int, last_seq: int
+    ) -> list[Message]:
+        messages = []
+        for ref in self.open_index(name).blocks(chat_id, first_seq, last_seq):
+            block = decode_block(chat_id, self._read(name, ref.offset, ref.length))
+            messages.extend(
+                message for message in block if first_seq <= message.seq <= last_seq
+            )
+        return messages
+
+    def _read(self, name: str, offset: int, length: int) -> bytes:
+        data, _ = self._open(name)
+        end = offset + length
+        return data[offset:end]
+
+    def _open(self, name: str) -> tuple[mmap.mmap, SegmentIndex]:
+        with self._lock:
+            maps = self._maps.get(name)
+            if maps is not None:
+                self._maps.move_to_end(name)
+                return maps
+
+            maps = (
+                self._map(self.root / f"{name}.data"),
+                SegmentIndex(self._map(self.root / f"{name}.idx")),
+            )
+            self._maps[name] = maps
+            # evicted maps are closed once blocks being read from them are done
+            while len(self._maps) > MAX_OPEN_SEGMENTS:
+                self._maps.popitem(last=False)
+            return maps
+
+    @staticmethod
+    def _map(path: Path) -> mmap.mmap | bytes:
+        with path.open("rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _write(self, name: str, data: bytes, index: bytes) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        for suffix, contents in (("data", data), ("idx", index)):
+            path = self.root / f"{name}.{suffix}"
+            tmp = path.with_name(f"{path.name}.tmp")
+            with tmp.open("wb") as file:
+                file.write(contents)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, path)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+# completed results kept for the coalescing window, at most
+MAX_RESULTS = 10_000
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: callers with the same key share
+    one in-flight call and its result. Completed results are also shared
+    for window seconds, 0 to share in-flight calls only.
+
+    Args:
+        window: float - seconds to reuse completed call's result
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self.calls = 0
+        self.shared = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._results: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn, unless call with the same key is in flight or recently done
+
+        Args:
+            key: Hashable - identifies equal calls
+            fn: Callable[[], Awaitable[T]] - the call
+
+        Returns:
+            T - result of fn, own or shared
+        """
+
+        result = self._recent_result(key)
+        if result is not None:
+            self.shared += 1
+            return result[1]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._in_flight[key] = task
+        else:
+            self.shared += 1
+        # callers' cancellation must not cancel the call others wait for
+        return await asyncio.shield(task)
+
+    def forget(self, match: Callable[[Hashable], bool]) -> None:
+        """
+        Make next calls with matching keys run anew, calls in flight
+        are still awaited by their callers, but their results are not shared
+
+        Args:
+            match: Callable[[Hashable], bool] - selects keys to forget
+        """
+
+        for key in [key for key in self._in_flight if match(key)]:
+            del self._in_flight[key]
+        for key in [key for key in self._results if match(key)]:
+            del self._results[key]
+
+    def clear(self) -> None:
+        self._in_flight.clear()
+        self._results.clear()
+
+    def _recent_result(self, key: Hashable) -> tuple[float, Any] | None:
+        result = self._results.get(key)
+        if result is not None and result[0] > time.monotonic():
+            return result
+        return None
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        try:
+            result = await fn()
+        finally:
+            forgotten = self._in_flight.get(key) is not asyncio.current_task()
+            if not forgotten:
+                del self._in_flight[key]
+
+        if self.window and not forgotten:
+            self._results[key] = (time.monotonic() + self.window, result)
+            self._results.move_to_end(key)
+            self._prune_results()
+        return result
+
+    def _prune_results(self) -> None:
+        now = time.monotonic()
+        while self._results and (
+            len(self._results) > MAX_RESULTS
+            or next(iter(self._results.values()))[0] <= now
+        ):
+            self._results.popitem(last=False)
@@ -0,0 +1,161 @@
+from typing import AsyncIterator
+
+from sqlalchemy import Row, and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.message import MessageResponse
+from app.schemas.sync import SyncCursor
+from core import ShardSessions
+from core.models import Chat, Message
+from .archive import ArchiveService
+
+# chats one sync may ask about
+MAX_SYNC_CHATS = 500
+# rows fetched from server-side cursor at once
+SYNC_BATCH_SIZE = 500
+
+
+def parse_since(value: str) -> dict[int, int]:
+    """
+    Parse sync positions
+
+    Args:
+        value: str - chat_id:seq,... where seq is the last message client has
+
+    Returns:
+        dict[int, int] - seq by chat's id
+
+    Raises:
+        ValueError - positions are malformed
+    """
+
+    since: dict[int, int] = {}
+    for position in value.split(","):
+        chat_id, sep, seq = position.partition(":")
+        if not sep or not chat_id.isdigit() or not seq.isdigit():
+            raise ValueError(f"Position must be chat_id:seq, got {position!r}")
+        if int(chat_id) in since:
+            raise ValueError(f"Chat {chat_id} is given more than once")
+        since[int(chat_id)] = int(seq)
+    if len(since) > MAX_SYNC_CHATS:
+        raise ValueError(f"At most {MAX_SYNC_CHATS} chats can be synced at once")
+    return since
+
+
+def format_since(since: dict[int, int]) -> str:
+    return ",".join(f"{chat_id}:{seq}" for chat_id, seq in since.items())
+
+
+class SyncService:
+    @staticmethod
+    async def get_last_seqs(
+        shards: ShardSessions, chat_ids: list[int]
+    ) -> dict[int, Row]:
+        """
+        Get last seq and archive marker of chats, in one query per shard
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            chat_ids: list[int] - chats' ids
+
+        Returns:
+            dict[int, Row] - rows with id, last_seq, archived_seq and
+            archive_segment by chat's id, missing chats are omitted
+        """
+
+        async def get_shard_last_seqs(
+            session: AsyncSession, ids: list[int]
+        ) -> list[Row]:
+            stmt = select(
+                Chat.id, Chat.last_seq, Chat.archived_seq, Chat.archive_segment
+            ).where(Chat.id.in_(ids))
+            result = await session.execute(stmt)
+            return result.all()
+
+        results = await shards.scatter(chat_ids, get_shard_last_seqs)
+        return {row.id: row for rows in results for row in rows}
+
+    @staticmethod
+    async def stream_missing(
+        shards: ShardSessions,
+        since: dict[int, int],
+        last_seqs: dict[int, Row],
+        limit: int,
+    ) -> AsyncIterator[str]:
+        """
+        Stream messages client is missing as NDJSON, in seq order per chat,
+        archived ones first, then shard by shard, ending with SyncCursor line.
+        Seqs have no gaps, so every chat's share of limit is a plain seq range.
+
+        Args:
+            shards: ShardSessions - db async sessions of shards
+            since: dict[int, int] - seq client has by chat's id
+            last_seqs: dict[int, int] - from get_last_seqs
+            limit: int - max messages, split evenly between chats behind,
+                at most limit of them are served, in since order
+
+        Returns:
+            AsyncIterator[str] - NDJSON chunks
+        """
+
+        cursor = dict(since)
+        behind = [
+            chat_id
+            for chat_id, seq in since.items()
+            if chat_id in last_seqs and last_seqs[chat_id].last_seq > seq
+        ]
+        # with more chats behind than limit, the rest wait for the next sync
+        served = behind[:limit]
+        per_chat = max(1, limit // len(served)) if served else 0
+
+        for chat_id in served:
+            archived = await ArchiveService.read_messages(
+                last_seqs[chat_id], since[chat_id] + 1, since[chat_id] + per_chat
+            )
+            if archived:
+                cursor[chat_id] = archived[-1].seq
+                yield "".join(
+                    MessageResponse.model_validate(message).model_dump_json() + "\n"
+                    for message in archived
+                )
+
+        for shard, chat_ids in shards.map.group(served).items():
+            stmt = (
+                select(
+                    Message.id,
+                    Message.chat_id,
+                    Message.seq,
+                    Message.text,
+                    Message.created_at,
+                )
+                .where(
+                    or_(
+                        *(
+                            and_(
+                                Message.chat_id == chat_id,
+                                Message.seq > since[chat_id],
+                                Message.seq <= since[chat_id] + per_chat,
+                            )
+                            for chat_id in chat_ids
+                        )
+                    )
+                )
+                .order_by(Message.chat_id, Message.seq)
+                .execution_options(yield_per=SYNC_BATCH_SIZE)
+            )
+            result = await shards.get(shard).stream(stmt)
+            async for rows in result.partitions():
+                for row in rows:
+                    cursor[row.chat_id] = row.seq
+                yield "".join(
+                    MessageResponse.model_validate(row).model_dump_json() + "\n"
+                    for row in rows
+                )
+
+        yield SyncCursor(
+            since=format_since(cursor),
+            more=any(
+                last_seqs[chat_id].last_seq > cursor[chat_id] for chat_id in behind
+            ),
+            not_found=[chat_id for chat_id in since if chat_id not in last_seqs],
+        ).model_dump_json() + "\n"
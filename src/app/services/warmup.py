@@ -0,0 +1,83 @@
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.schemas import ChatBatchResponse, ChatWithMessages, SyncCursor
+from core import DBHelper, ShardMap, ShardSessions, get_logger
+from core.models import Chat, Message
+from core.models.base import utcnow
+from .chat import ChatService, hot_tail
+from .sync import SyncService
+
+logger = get_logger(__name__)
+
+# no chat has id 0, warm-up queries find nothing
+WARMUP_CHAT_ID = 0
+
+
+class WarmupService:
+    @classmethod
+    async def warm_up(cls, app: FastAPI, shard_map: ShardMap, connections: int) -> None:
+        """
+        Get the app ready to serve its first requests as fast as the rest
+
+        Args:
+            app: FastAPI - app to build OpenAPI schema of
+            shard_map: ShardMap - shards to open pool connections to
+            connections: int - connections opened per shard
+        """
+
+        cls.warm_schemas(app)
+        for name, shard in shard_map.shards.items():
+            await cls.warm_pool(shard, shard_map, connections)
+            logger.info(f"Shard {name}: {connections} connections warmed up")
+
+    @classmethod
+    async def warm_pool(
+        cls, shard: DBHelper, shard_map: ShardMap, connections: int
+    ) -> None:
+        """
+        Open connections to shard at once, so the pool keeps all of them,
+        and run read queries of ChatService on each. That compiles them into
+        engine's cache and prepares them in connection's statement cache.
+        """
+
+        opened: list[AsyncConnection] = []
+        try:
+            for _ in range(connections):
+                opened.append(await shard.engine.connect())
+            for conn in opened:
+                async with AsyncSession(bind=conn) as session:
+                    await cls.warm_queries(ShardSessions(shard_map, lambda _: session))
+                    await session.rollback()
+        finally:
+            for conn in opened:
+                await conn.close()
+
+    @staticmethod
+    async def warm_queries(shards: ShardSessions) -> None:
+        await ChatService.get_chat(shards, WARMUP_CHAT_ID)
+        await ChatService.get_recent_messages(shards, WARMUP_CHAT_ID, hot_tail.capacity)
+        await ChatService.get_chats(shards, [WARMUP_CHAT_ID])
+        await ChatService.get_recent_messages_batch(
+            shards, [WARMUP_CHAT_ID], hot_tail.capacity
+        )
+        await SyncService.get_last_seqs(shards, [WARMUP_CHAT_ID])
+
+    @staticmethod
+    def warm_schemas(app: FastAPI) -> None:
+        """
+        Validate and serialize sample of every response schema once,
+        and build OpenAPI schema, which FastAPI does on first request
+        """
+
+        now = utcnow()
+        chat = Chat(id=WARMUP_CHAT_ID, title="Warm-up", created_at=now)
+        message = Message(
+            id=WARMUP_CHAT_ID, chat_id=chat.id, seq=1, text="Warm-up", created_at=now
+        )
+        detail = ChatWithMessages.model_validate({"chat": chat, "messages": [message]})
+        batch = ChatBatchResponse(chats=[detail], not_found=[WARMUP_CHAT_ID])
+        cursor = SyncCursor(since="0:0", more=False, not_found=[])
+        for model in (detail, batch, cursor):
+            type(model).model_validate_json(model.model_dump_json())
+        app.openapi()
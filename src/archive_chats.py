@@ -0,0 +1,53 @@
+"""
+Archive messages of idle chats to compressed segments
+
+Usage:
+    python src/archive_chats.py [--idle-days 90]
+
+Chats without messages for idle days get their messages moved out of
+the database, reads fall through to the segments transparently.
+Safe to run again, chats with new messages are archived anew.
+Messages of deleted chats are then dropped from the segments.
+"""
+
+import argparse
+import asyncio
+from datetime import timedelta
+
+from app.services import ArchiveService
+from core import ShardSessions, get_logger, settings, setup_logging, shard_map
+from core.models.base import utcnow
+from core.worker_lease import lease_worker_id
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+async def main(idle_days: int, segment_chats: int) -> int:
+    # segment names are ids
+    lease = await lease_worker_id(shard_map.shards[min(shard_map.shards)].url)
+    shards = ShardSessions(shard_map)
+    try:
+        archived = await ArchiveService.archive_idle_chats(
+            shards, utcnow() - timedelta(days=idle_days), segment_chats
+        )
+        compacted = await ArchiveService.compact_segments(shards)
+        logger.info(f"Compacted {compacted} segments")
+        return archived
+    finally:
+        await shards.close()
+        await shard_map.dispose()
+        if lease is not None:
+            await lease.release()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--idle-days", type=int, default=settings.archive.idle_days)
+    parser.add_argument(
+        "--segment-chats", type=int, default=settings.archive.segment_chats
+    )
+    args = parser.parse_args()
+
+    archived = asyncio.run(main(args.idle_days, args.segment_chats))
+    logger.info(f"Archived {archived} chats")
@@ -0,0 +1,79 @@
+"""
+Measure how long the app takes to start and to serve its first requests
+
+Usage:
+    python src/benchmark_startup.py [--runs 5] [--requests 3]
+
+Every run is a fresh process, like a new pod: it imports the app, creates it,
+runs lifespan startup and sends the first requests to the configured db,
+once with warm-up and once without. Prints median seconds of every step.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# chat detail goes through the pool, compiled SQL and response schemas
+REQUEST_URL = "/api/chats/1"
+
+
+async def measure(requests: int) -> dict[str, float]:
+    started = time.perf_counter()
+    from httpx import ASGITransport, AsyncClient
+
+    from app.app import create_app
+
+    timings = {"import": time.perf_counter() - started}
+    started = time.perf_counter()
+    app = create_app()
+    timings["create_app"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - started
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(1, requests + 1):
+                started = time.perf_counter()
+                await client.get(REQUEST_URL)
+                timings[f"request {i}"] = time.perf_counter() - started
+    return timings
+
+
+def run(warmup: bool, requests: int) -> dict[str, float]:
+    env = {**os.environ, "WARMUP_ENABLED": str(warmup), "ECHO": "false"}
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", "--requests", str(requests)],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(runs: int, requests: int) -> None:
+    for warmup in (False, True):
+        results = [run(warmup, requests) for _ in range(runs)]
+        print(f"warm-up {'on' if warmup else 'off'}, median of {runs} runs:")
+        for step in results[0]:
+            median = statistics.median(result[step] for result in results)
+            print(f"  {step:<12} {median * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.requests))))
+    else:
+        main(args.runs, args.requests)
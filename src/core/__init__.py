@@ -1,14 +1,31 @@
 __all__ = (
     "Base",
+    "BucketFrozen",
     "DBHelper",
+    "DBStats",
+    "ShardMap",
+    "ShardSessions",
+    "StatementBudgetExceeded",
     "db_helper",
     "get_logger",
+    "instrument_engine",
     "settings",
     "setup_logging",
+    "shard_map",
+    "statement_budget",
+    "track_db_stats",
 )
 
 
 from core.models import Base
 from .config import settings
 from .db_helper import DBHelper, db_helper
+from .db_stats import (
+    DBStats,
+    StatementBudgetExceeded,
+    instrument_engine,
+    statement_budget,
+    track_db_stats,
+)
 from .logger import setup_logging, get_logger
+from .sharding import BucketFrozen, ShardMap, ShardSessions, shard_map
@@ -1,4 +1,6 @@
-from pydantic_settings import BaseSettings
+from functools import cached_property
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class DBSettings(BaseSettings):
@@ -20,8 +22,239 @@ class DBSettings(BaseSettings):
         )
 
 
+class DBStatsSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="DB_STATS_")
+
+    enabled: bool = True
+    # raise StatementBudgetExceeded instead of logging a warning
+    strict_budget: bool = False
+
+
+class IdempotencySettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="IDEMPOTENCY_")
+
+    # how long a key replays the original response
+    ttl_seconds: int = 24 * 60 * 60
+    # keys kept in per-process cache in front of the db
+    cache_size: int = 10_000
+    # seconds between purges of expired keys from every shard
+    purge_interval: float = 60.0
+
+
+class IdSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ID_")
+
+    # unique per running process, leased from the first shard if not set,
+    # which has to be PostgreSQL then
+    worker_id: int | None = None
+    # derive worker id from host name and pid instead, for dev and tests only
+    derive_worker_id: bool = False
+    # seconds between checks that the leased worker id is still held
+    lease_check_interval: float = 1.0
+    # seconds a leased worker id is used after a successful check, and waited
+    # for after locking it, so a process that lost the lock stops first;
+    # more than twice lease_check_interval
+    lease_ttl: float = 5.0
+
+
+class ChatReadSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CHAT_READ_")
+
+    # seconds a chat detail read is shared with identical reads after it's done
+    coalesce_window: float = 0.0
+
+
+class HotTailSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="HOT_TAIL_")
+
+    # last messages kept per chat, 0 disables the cache
+    capacity: int = 100
+    max_chats: int = 10_000
+    max_bytes: int = 64 * 1024 * 1024
+    # seconds before a chat is refilled, bounds staleness of other workers' writes
+    max_age: float = 5.0
+
+
+class AdmissionSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ADMISSION_")
+
+    enabled: bool = True
+    # concurrent requests, adapted between min and max by response latency
+    initial_limit: int = 20
+    min_limit: int = 4
+    max_limit: int = 100
+    # seconds to response start, slower responses shrink the limit
+    target_latency: float = 0.5
+    # waiting requests per priority class, more are shed right away
+    max_queue: int = 100
+    # seconds a request may wait for a slot before it's shed
+    max_wait: float = 1.0
+    # seconds from arrival to response start, wait for a slot included,
+    # slower requests are cancelled with 503; streamed bodies aren't limited
+    request_timeout: float | None = 10.0
+
+
+class ShardSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="SHARD_")
+
+    # shard name -> db url, as JSON; single shard on DB_* settings if empty
+    urls: dict[str, str] = {}
+    # JSON file assigning buckets to shards, buckets are spread evenly if not set
+    map_file: str | None = None
+    # seconds between checks of map_file for changes made by rebalancing
+    reload_interval: float = 1.0
+
+
+class ArchiveSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ARCHIVE_")
+
+    # directory of segment files
+    path: str = "archive"
+    # chats without messages for that long are moved to segments
+    idle_days: int = 90
+    # chats per archived segment
+    segment_chats: int = 1000
+    # messages per compressed block, the unit of reading from segment
+    block_size: int = 256
+    # seconds before a segment is compacted, chats may not refer to
+    # a new one yet, reads may still use one just rewritten
+    segment_grace: int = 60 * 60
+
+
+class WarmupSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="WARMUP_")
+
+    enabled: bool = True
+    # pool connections opened per shard on startup, each gets queries prepared
+    min_connections: int = 2
+
+
+class ProfilingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PROFILING_")
+
+    # profiling routes and middleware are added to the app only if enabled
+    enabled: bool = False
+    # X-Admin-Token of profiling routes, they are refused to everyone if not set
+    admin_token: str | None = None
+    # seconds between stack samples of the event loop thread
+    sample_interval: float = 0.005
+    # seconds between event loop lag probes
+    loop_lag_interval: float = 0.05
+    # seconds a profiling session runs at most, however few requests come
+    max_duration: float = 60.0
+    # frames kept per traced allocation
+    tracemalloc_frames: int = 16
+
+
+class CompressionSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="COMPRESSION_")
+
+    enabled: bool = True
+    # bytes of whole response body worth compressing, streamed ones always are
+    minimum_size: int = 1024
+    gzip_level: int = 6
+    # used when zstandard is installed and client accepts zstd
+    zstd_level: int = 3
+
+
+class ImportSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="IMPORT_")
+
+    # X-Admin-Token of the import route, it's refused to everyone if not set,
+    # src/import_chats.py needs none
+    admin_token: str | None = None
+
+
+class ReadStateSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="READ_STATE_")
+
+    # seconds read positions are coalesced in memory before a bulk write
+    flush_interval: float = 1.0
+
+
+class OutboxSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OUTBOX_")
+
+    # run the dispatcher in this process, any number of processes may
+    enabled: bool = True
+    # events claimed per shard in one transaction
+    batch_size: int = 100
+    # seconds between polls when nothing was written by this process
+    poll_interval: float = 1.0
+    # seconds a handler may take before the attempt counts as failed
+    handler_timeout: float = 10.0
+    # seconds claimed events are kept from other dispatchers while handled,
+    # more than handler_timeout, events of a dispatcher that died wait as long
+    lease: float = 60.0
+    # failed attempts before an event is dead and stops holding its chat
+    max_attempts: int = 10
+    # seconds before the first retry, doubled for every next one
+    retry_delay: float = 1.0
+    max_retry_delay: float = 300.0
+
+
 class Settings:
-    db: DBSettings = DBSettings()
+    """Settings groups, each read from environment on first access"""
+
+    @cached_property
+    def db(self) -> DBSettings:
+        return DBSettings()
+
+    @cached_property
+    def db_stats(self) -> DBStatsSettings:
+        return DBStatsSettings()
+
+    @cached_property
+    def idempotency(self) -> IdempotencySettings:
+        return IdempotencySettings()
+
+    @cached_property
+    def ids(self) -> IdSettings:
+        return IdSettings()
+
+    @cached_property
+    def chat_read(self) -> ChatReadSettings:
+        return ChatReadSettings()
+
+    @cached_property
+    def hot_tail(self) -> HotTailSettings:
+        return HotTailSettings()
+
+    @cached_property
+    def admission(self) -> AdmissionSettings:
+        return AdmissionSettings()
+
+    @cached_property
+    def shards(self) -> ShardSettings:
+        return ShardSettings()
+
+    @cached_property
+    def archive(self) -> ArchiveSettings:
+        return ArchiveSettings()
+
+    @cached_property
+    def warmup(self) -> WarmupSettings:
+        return WarmupSettings()
+
+    @cached_property
+    def profiling(self) -> ProfilingSettings:
+        return ProfilingSettings()
+
+    @cached_property
+    def compression(self) -> CompressionSettings:
+        return CompressionSettings()
+
+    @cached_property
+    def imports(self) -> ImportSettings:
+        return ImportSettings()
+
+    @cached_property
+    def read_state(self) -> ReadStateSettings:
+        return ReadStateSettings()
+
+    @cached_property
+    def outbox(self) -> OutboxSettings:
+        return OutboxSettings()
 
 
 settings = Settings()
@@ -1,7 +1,9 @@
 from asyncio import current_task
+from functools import cached_property
 from typing import AsyncGenerator
 
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_scoped_session,
     async_sessionmaker,
@@ -9,18 +11,44 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from .config import settings
+from .db_stats import instrument_engine
 
 
 class DBHelper:
+    """
+    Engine and session factory of a database, created on first use,
+    so importing the app builds no engines
+
+    Args:
+        url: str - db url
+        echo: bool - log SQL statements
+    """
+
     def __init__(self, url: str, echo: bool = False):
-        self.engine = create_async_engine(url=url, echo=echo)
-        self.session_factory = async_sessionmaker(
+        self.url = url
+        self.echo = echo
+
+    @cached_property
+    def engine(self) -> AsyncEngine:
+        engine = create_async_engine(url=self.url, echo=self.echo)
+        instrument_engine(engine)
+        return engine
+
+    @cached_property
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
             bind=self.engine,
             autoflush=False,
             autocommit=False,
             expire_on_commit=False,
         )
 
+    async def dispose(self) -> None:
+        """Close pooled connections, if the engine was ever created"""
+
+        if "engine" in self.__dict__:
+            await self.engine.dispose()
+
     def get_scoped_session(self):
         return async_scoped_session(
             session_factory=self.session_factory,
@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+F = TypeVar("F", bound=Callable)
+
+_current_stats: ContextVar["DBStats | None"] = ContextVar("db_stats", default=None)
+
+
+class StatementBudgetExceeded(Exception):
+    """Raised when a route runs more SQL statements than it has declared"""
+
+
+class DBStats:
+    """
+    SQL statements count and time spent in db during a unit of work
+
+    Fields:
+        statements: int - how many statements were executed
+        duration: float - total time spent executing them, in seconds
+        engines: set - engines, i.e. shards, statements were executed on
+    """
+
+    __slots__ = ("statements", "duration", "engines", "parent")
+
+    def __init__(self, parent: "DBStats | None" = None):
+        self.statements = 0
+        self.duration = 0.0
+        self.engines = set()
+        self.parent = parent
+
+    def record(self, duration: float, engine: Engine | None = None) -> None:
+        stats = self
+        while stats is not None:
+            stats.statements += 1
+            stats.duration += duration
+            if engine is not None:
+                stats.engines.add(engine)
+            stats = stats.parent
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+
+        return f'db;dur={self.duration_ms:.2f};desc="{self.statements} statements"'
+
+
+@contextmanager
+def track_db_stats() -> Iterator[DBStats]:
+    """
+    Count statements executed on instrumented engines inside the block.
+    Nested blocks also count towards the outer ones.
+
+    Returns:
+        DBStats - filled while the block runs
+    """
+
+    stats = DBStats(parent=_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def statement_budget(limit: int) -> Callable[[F], F]:
+    """
+    Declare how many SQL statements a route is allowed to execute
+
+    Args:
+        limit: int - max statements per request on every shard it touches
+    """
+
+    def decorator(endpoint: F) -> F:
+        endpoint.statement_budget = limit
+        return endpoint
+
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.db_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is not None and context is not None:
+        stats.record(time.perf_counter() - context.db_stats_started, conn.engine)
+
+
+def instrument_engine(engine: AsyncEngine | Engine) -> None:
+    """
+    Attach statement counting to engine, safe to call more than once
+
+    Args:
+        engine: AsyncEngine | Engine - engine to instrument
+    """
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,161 @@
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import UTC, datetime
+
+from .config import settings
+
+# 2026-01-01T00:00:00Z, ids' timestamps are counted from it
+EPOCH_MS = 1_767_225_600_000
+
+TIMESTAMP_BITS = 41
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_ID_BITS + SEQUENCE_BITS
+
+
+class WorkerIdUnavailable(RuntimeError):
+    """Raised on generating ids before this process has a unique worker id"""
+
+
+class SnowflakeGenerator:
+    """
+    Generator of 64-bit time-ordered ids, snowflake layout:
+    41 bits of ms since EPOCH_MS | 10 bits of worker id | 12 bits of sequence.
+    With tag_bits the lowest bits of sequence are given to a caller's tag,
+    leaving 2 ** (12 - tag_bits) ids per millisecond.
+
+    Ids are unique as long as every process has its own worker id,
+    and increase monotonically within a process, even if the clock goes back.
+    A leased worker id is used only till the lease may have been lost,
+    valid_until of assign.
+
+    Args:
+        worker_id: int | None - 0..MAX_WORKER_ID, None till assigned
+        tag_bits: int - 0..SEQUENCE_BITS - 1
+    """
+
+    def __init__(self, worker_id: int | None, tag_bits: int = 0):
+        if not 0 <= tag_bits < SEQUENCE_BITS:
+            raise ValueError(f"Tag bits must be in 0..{SEQUENCE_BITS - 1}")
+        self.tag_bits = tag_bits
+        self._sequence_mask = SEQUENCE_MASK >> tag_bits
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self.worker_id: int | None = None
+        self._valid_until: float | None = None
+        self.assign(worker_id)
+
+    def assign(self, worker_id: int | None, valid_until: float | None = None) -> None:
+        """
+        Set worker id, None stops generating ids till the next one is set
+
+        Args:
+            worker_id: int | None - worker id of this process
+            valid_until: float | None - time.monotonic() the worker id can't be
+                used from, unless assigned again, None if it's not leased
+        """
+
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"Worker id must be in 0..{MAX_WORKER_ID}")
+        with self._lock:
+            self.worker_id = worker_id
+            self._valid_until = valid_until
+
+    def next_id(self, tag: int = 0) -> int:
+        if not 0 <= tag < 1 << self.tag_bits:
+            raise ValueError(f"Tag must be in 0..{(1 << self.tag_bits) - 1}")
+        with self._lock:
+            if self.worker_id is None:
+                raise WorkerIdUnavailable("Worker id of this process isn't assigned")
+            if self._valid_until is not None and time.monotonic() >= self._valid_until:
+                raise WorkerIdUnavailable(
+                    f"Lease of worker id {self.worker_id} isn't confirmed"
+                )
+            now_ms = max(time.time_ns() // 1_000_000 - EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & self._sequence_mask
+                if self._sequence == 0:
+                    # sequence is exhausted, borrow the next millisecond
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+
+            return (
+                (now_ms << TIMESTAMP_SHIFT)
+                | (self.worker_id << SEQUENCE_BITS)
+                | (self._sequence << self.tag_bits)
+                | tag
+            )
+
+
+def id_created_at(id_: int) -> datetime:
+    """
+    Get creation time encoded into snowflake id
+
+    Args:
+        id_: int - id made by SnowflakeGenerator
+
+    Returns:
+        datetime - UTC time with ms precision
+    """
+
+    return datetime.fromtimestamp(((id_ >> TIMESTAMP_SHIFT) + EPOCH_MS) / 1000, tz=UTC)
+
+
+def default_worker_id() -> int:
+    """
+    Worker id derived from host name and pid, for local runs only,
+    two of a few dozen processes likely get the same one
+    """
+
+    return zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) & (
+        MAX_WORKER_ID
+    )
+
+
+def configured_worker_id() -> int | None:
+    """
+    Returns:
+        int | None - ID_WORKER_ID, derived one if ID_DERIVE_WORKER_ID is on,
+        None if this process has to lease one
+    """
+
+    if settings.ids.worker_id is not None:
+        return settings.ids.worker_id
+    if settings.ids.derive_worker_id:
+        return default_worker_id()
+    return None
+
+
+# generators sharing worker id of this process
+process_generators: list[SnowflakeGenerator] = []
+
+
+def process_generator(tag_bits: int = 0) -> SnowflakeGenerator:
+    """Generator using worker id of this process, assigned by assign_worker_id"""
+
+    generator = SnowflakeGenerator(configured_worker_id(), tag_bits=tag_bits)
+    process_generators.append(generator)
+    return generator
+
+
+def assign_worker_id(worker_id: int | None, valid_until: float | None = None) -> None:
+    for generator in process_generators:
+        generator.assign(worker_id, valid_until)
+
+
+id_generator = process_generator()
+
+
+def generate_id() -> int:
+    """Next id of this process, default for primary keys"""
+
+    return id_generator.next_id()
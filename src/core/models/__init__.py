@@ -1,5 +1,8 @@
-__all__ = ("Base", "Chat", "Message")
+__all__ = ("Base", "Chat", "IdempotencyKey", "Message", "OutboxEvent", "ReadState")
 
 from .base import Base
 from .chat import Chat
+from .idempotency_key import IdempotencyKey
 from .message import Message
+from .outbox_event import OutboxEvent
+from .read_state import ReadState
@@ -1,10 +1,26 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import BigInteger
 from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column
 
+from ..ids import generate_id
+
+
+def utcnow() -> datetime:
+    """Default for creation times, set by app so inserts don't need RETURNING"""
+
+    return datetime.now(UTC)
+
 
 class Base(DeclarativeBase):
     """Base Abstract Model"""
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=False,
+        default=generate_id,
+    )
 
     @declared_attr.directive
     def __tablename__(self) -> str:
@@ -2,9 +2,9 @@ from datetime import datetime
 from typing import TYPE_CHECKING
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import DateTime, CheckConstraint, String, func
+from sqlalchemy import BigInteger, DateTime, CheckConstraint, String, func
 
-from .base import Base
+from .base import Base, utcnow
 
 if TYPE_CHECKING:
     from .message import Message
@@ -17,6 +17,10 @@ class Chat(Base):
     Fields:
         title: VARCHAR - chat title, must not be empty
         created_at: timestamp with time zone - chat's creation time
+        legacy_id: BIGINT - chat's id in legacy system, set by bulk import
+        last_seq: BIGINT - seq of chat's last message, 0 if it has none
+        archived_seq: BIGINT - messages up to this seq are moved to archive
+        archive_segment: VARCHAR - name of archive segment holding them
 
     Relationships:
         messages: lits[Message] - points at chat's messages
@@ -30,9 +34,32 @@ class Chat(Base):
     )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
+        default=utcnow,
         server_default=func.now(),
         nullable=False,
     )
+    legacy_id: Mapped[int | None] = mapped_column(
+        BigInteger,
+        nullable=True,
+        unique=True,
+        index=True,
+    )
+    last_seq: Mapped[int] = mapped_column(
+        BigInteger,
+        default=0,
+        server_default="0",
+        nullable=False,
+    )
+    archived_seq: Mapped[int] = mapped_column(
+        BigInteger,
+        default=0,
+        server_default="0",
+        nullable=False,
+    )
+    archive_segment: Mapped[str | None] = mapped_column(
+        String(64),
+        nullable=True,
+    )
     messages: Mapped[list["Message"]] = relationship(
         "Message",
         back_populates="chat",
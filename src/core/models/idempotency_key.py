@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DateTime, ForeignKey, String, Text, func
+
+from .base import Base, utcnow
+
+
+class IdempotencyKey(Base):
+    """
+    Model for idempotency keys of message posting
+
+    Fields:
+        key: VARCHAR - client provided Idempotency-Key, unique
+        chat_id: BIGINT - chat the message was posted to
+        message_id: BIGINT - message created with this key
+        request_hash: VARCHAR - sha256 of the message's text, retries must match,
+            NULL for keys stored before it was kept
+        response: TEXT - serialized MessageResponse returned on retries
+        created_at: timestamp with time zone - key's creation time
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(
+        String(255),
+        nullable=False,
+        unique=True,
+        index=True,
+    )
+    chat_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("chats.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    message_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("messages.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    request_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    response: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        server_default=func.now(),
+        nullable=False,
+        index=True,
+    )
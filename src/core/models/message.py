@@ -2,9 +2,17 @@ from datetime import datetime
 from typing import TYPE_CHECKING
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import DateTime, CheckConstraint, ForeignKey, String, func
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    CheckConstraint,
+    ForeignKey,
+    Index,
+    String,
+    func,
+)
 
-from .base import Base
+from .base import Base, utcnow
 
 
 if TYPE_CHECKING:
@@ -16,18 +24,32 @@ class Message(Base):
     Model for messages
 
     Fields:
-        chat_id: INT - points at this message's chat (M-1)
+        chat_id: BIGINT - points at this message's chat (M-1)
+        seq: BIGINT - position in chat, from 1 without gaps, unique per chat
         text: VARCHAR - message text, non-empty, max lenght (5000)
         created_at: timestamp with time zone - message's creation time
+        legacy_id: BIGINT - message's id in legacy system, set by bulk import,
+            unique per chat
 
     Relationships:
         chat: Chat - points at this message's chat
     """
 
+    __table_args__ = (
+        # recent messages of chat(s), newest first
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at"),
+        # messages of chat after the given position, for sync
+        Index("ux_messages_chat_id_seq", "chat_id", "seq", unique=True),
+        # messages already imported, skipped by resumed import
+        Index("ux_messages_chat_id_legacy_id", "chat_id", "legacy_id", unique=True),
+    )
+
     chat_id: Mapped[int] = mapped_column(
+        BigInteger,
         ForeignKey("chats.id", ondelete="CASCADE"),
         nullable=False,
     )
+    seq: Mapped[int] = mapped_column(BigInteger, nullable=False)
     text: Mapped[str] = mapped_column(
         String(5000),
         CheckConstraint("length(text) > 0", name="text_not_empty"),
@@ -35,7 +57,9 @@ class Message(Base):
     )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
+        default=utcnow,
         server_default=func.now(),
         nullable=False,
     )
+    legacy_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     chat: Mapped["Chat"] = relationship(back_populates="messages", lazy="joined")
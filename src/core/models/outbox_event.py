@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DateTime, Index, Integer, String, Text, func
+
+from .base import Base, utcnow
+
+
+class OutboxEvent(Base):
+    """
+    Model for events of committed changes waiting to be dispatched,
+    written in the same transaction as the change. Ids grow with time,
+    so they order events of a chat.
+
+    Fields:
+        chat_id: BIGINT - chat the event is about, no foreign key,
+            events of deleted chats are dispatched too
+        type: VARCHAR - event type, e.g. message.created
+        payload: TEXT - event data as JSON
+        created_at: timestamp with time zone - time of the change
+        available_at: timestamp with time zone - dispatched not before that
+        attempts: INTEGER - failed dispatch attempts
+        last_error: TEXT - error of the last failed attempt
+        dead_at: timestamp with time zone - time dispatch was given up,
+            dead events don't hold back later events of the chat
+    """
+
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # earlier events of the same chat, checked before dispatching
+        Index("ix_outbox_events_chat_id_id", "chat_id", "id"),
+        # events due for dispatch
+        Index("ix_outbox_events_available_at", "available_at"),
+    )
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    type: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        server_default=func.now(),
+        nullable=False,
+    )
+    available_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        server_default=func.now(),
+        nullable=False,
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer,
+        default=0,
+        server_default="0",
+        nullable=False,
+    )
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    dead_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )
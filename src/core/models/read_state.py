@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, func
+
+from .base import Base, utcnow
+
+
+class ReadState(Base):
+    """
+    Model for read positions of chats' readers
+
+    Fields:
+        chat_id: BIGINT - chat being read
+        reader_id: BIGINT - reader's id in client's system
+        last_read_seq: BIGINT - seq of the last message reader has read
+        updated_at: timestamp with time zone - time of the last flush
+    """
+
+    __tablename__ = "read_states"
+    __table_args__ = (
+        # reader's position in chat, target of upserts
+        Index("ux_read_states_chat_id_reader_id", "chat_id", "reader_id", unique=True),
+    )
+
+    chat_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("chats.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    reader_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_read_seq: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        server_default=func.now(),
+        nullable=False,
+    )
@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Callable, Iterable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .db_helper import DBHelper, db_helper
+from .ids import process_generator
+
+T = TypeVar("T")
+
+# chat's bucket is the lowest BUCKET_BITS of its id
+BUCKET_BITS = 8
+BUCKETS = 1 << BUCKET_BITS
+BUCKET_MASK = BUCKETS - 1
+DEFAULT_SHARD = "default"
+
+# chat ids carry their bucket, leaving 16 ids per millisecond per process
+chat_id_generator = process_generator(tag_bits=BUCKET_BITS)
+
+
+class BucketFrozen(Exception):
+    """Raised on writes to a bucket being moved to another shard"""
+
+    def __init__(self, bucket: int):
+        super().__init__(f"Bucket {bucket} is being moved to another shard")
+        self.bucket = bucket
+
+
+def bucket_of(chat_id: int) -> int:
+    return chat_id & BUCKET_MASK
+
+
+def spread_buckets(shards: list[str]) -> list[str]:
+    """Assign buckets to shards round-robin"""
+
+    return [shards[bucket % len(shards)] for bucket in range(BUCKETS)]
+
+
+class ShardMap:
+    """
+    Routes chats, together with their messages, to shards by chat's id.
+    Buckets encoded into ids are assigned to shards by the map,
+    so a bucket can be moved to another shard without changing any ids.
+    Frozen buckets, the ones being moved, are read-only.
+
+    Args:
+        shards: dict[str, DBHelper] - engine and pool of every shard by name
+        buckets: list[str] - shard's name of every bucket
+        map_file: Path | None - JSON file buckets are reloaded from and saved to
+    """
+
+    def __init__(
+        self,
+        shards: dict[str, DBHelper],
+        buckets: list[str],
+        map_file: Path | None = None,
+    ):
+        self.shards = shards
+        self.map_file = map_file
+        self.buckets = self._validate(buckets)
+        self.frozen: set[int] = set()
+        self._next_bucket = itertools.count()
+        self._map_mtime: float | None = None
+        self._checked_at = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "ShardMap":
+        if settings.shards.urls:
+            shards = {
+                name: DBHelper(url=url, echo=settings.db.echo)
+                for name, url in settings.shards.urls.items()
+            }
+        else:
+            shards = {DEFAULT_SHARD: db_helper}
+        map_file = settings.shards.map_file
+        shard_map = cls(
+            shards, spread_buckets(list(shards)), Path(map_file) if map_file else None
+        )
+        shard_map.reload()
+        return shard_map
+
+    def shard_of(self, chat_id: int, write: bool = False) -> str:
+        """
+        Args:
+            chat_id: int - chat's id
+            write: bool - raise BucketFrozen if chat's bucket is frozen
+
+        Returns:
+            str - name of chat's shard
+        """
+
+        bucket = bucket_of(chat_id)
+        if write and bucket in self.frozen:
+            raise BucketFrozen(bucket)
+        return self.buckets[bucket]
+
+    def group(self, chat_ids: Iterable[int]) -> dict[str, list[int]]:
+        """
+        Returns:
+            dict[str, list[int]] - chat ids by shard's name, in given order
+        """
+
+        groups: dict[str, list[int]] = {}
+        for chat_id in chat_ids:
+            groups.setdefault(self.shard_of(chat_id), []).append(chat_id)
+        return groups
+
+    def new_chat_id(self, bucket: int | None = None) -> int:
+        """
+        Allocate id for a new chat
+
+        Args:
+            bucket: int | None - bucket to put chat in,
+                round-robin over not frozen buckets if None
+
+        Returns:
+            int - snowflake id with bucket in its lowest bits
+        """
+
+        if bucket is None:
+            for _ in range(BUCKETS):
+                bucket = next(self._next_bucket) & BUCKET_MASK
+                if bucket not in self.frozen:
+                    break
+            else:
+                raise BucketFrozen(bucket)
+        elif bucket in self.frozen:
+            raise BucketFrozen(bucket)
+        return chat_id_generator.next_id(tag=bucket)
+
+    def freeze(self, bucket: int) -> None:
+        self.frozen.add(bucket)
+
+    def move_bucket(self, bucket: int, shard: str) -> None:
+        """Assign bucket to shard and unfreeze it"""
+
+        buckets = list(self.buckets)
+        buckets[bucket] = shard
+        self.buckets = self._validate(buckets)
+        self.frozen.discard(bucket)
+
+    def save(self) -> None:
+        """Write buckets to map_file atomically"""
+
+        tmp = self.map_file.with_name(f"{self.map_file.name}.tmp")
+        tmp.write_text(
+            json.dumps({"buckets": self.buckets, "frozen": sorted(self.frozen)})
+        )
+        os.replace(tmp, self.map_file)
+        self._map_mtime = self.map_file.stat().st_mtime
+
+    def reload(self) -> bool:
+        """
+        Load buckets from map_file if it has changed since last load
+
+        Returns:
+            bool - whether buckets were reloaded
+        """
+
+        self._checked_at = time.monotonic()
+        if self.map_file is None or not self.map_file.exists():
+            return False
+        mtime = self.map_file.stat().st_mtime
+        if mtime == self._map_mtime:
+            return False
+        data = json.loads(self.map_file.read_text())
+        self.buckets = self._validate(data["buckets"])
+        self.frozen = set(data.get("frozen", ()))
+        self._map_mtime = mtime
+        return True
+
+    def maybe_reload(self) -> None:
+        if time.monotonic() - self._checked_at >= settings.shards.reload_interval:
+            self.reload()
+
+    async def session_dependency(self) -> AsyncGenerator["ShardSessions"]:
+        self.maybe_reload()
+        shards = ShardSessions(self)
+        try:
+            yield shards
+        finally:
+            await shards.close()
+
+    async def dispose(self) -> None:
+        for shard in self.shards.values():
+            await shard.dispose()
+
+    def _validate(self, buckets: list[str]) -> list[str]:
+        if len(buckets) != BUCKETS:
+            raise ValueError(f"Shard map must have {BUCKETS} buckets")
+        unknown = set(buckets) - self.shards.keys()
+        if unknown:
+            raise ValueError(f"Unknown shards in map: {', '.join(sorted(unknown))}")
+        return buckets
+
+
+class ShardSessions:
+    """
+    Sessions of one unit of work, at most one per shard, opened on first use.
+    Sessions of different shards may be used concurrently.
+
+    Args:
+        shard_map: ShardMap - routes chats to shards
+        open_session: Callable[[str], AsyncSession] | None - opens session
+            of shard by name, with shard's session factory by default
+    """
+
+    def __init__(
+        self,
+        shard_map: ShardMap,
+        open_session: Callable[[str], AsyncSession] | None = None,
+    ):
+        self.map = shard_map
+        self._open_session = open_session or (
+            lambda shard: shard_map.shards[shard].session_factory()
+        )
+        self._sessions: dict[str, AsyncSession] = {}
+
+    def fork(self) -> "ShardSessions":
+        """
+        Returns:
+            ShardSessions - sessions of another unit of work, opened the same way,
+            for work outliving this one, e.g. shared by several requests
+        """
+
+        return ShardSessions(self.map, self._open_session)
+
+    def get(self, shard: str) -> AsyncSession:
+        session = self._sessions.get(shard)
+        if session is None:
+            session = self._sessions[shard] = self._open_session(shard)
+        return session
+
+    def for_chat(self, chat_id: int, write: bool = False) -> AsyncSession:
+        """
+        Args:
+            chat_id: int - chat's id
+            write: bool - raise BucketFrozen if chat's bucket is frozen
+
+        Returns:
+            AsyncSession - session of chat's shard
+        """
+
+        return self.get(self.map.shard_of(chat_id, write))
+
+    async def scatter(
+        self,
+        chat_ids: Iterable[int],
+        fn: Callable[[AsyncSession, list[int]], Awaitable[T]],
+    ) -> list[T]:
+        """
+        Run fn concurrently on every shard holding some of chats
+
+        Args:
+            chat_ids: Iterable[int] - chats' ids
+            fn: callable - called with shard's session and its chat ids
+
+        Returns:
+            list[T] - fn results, one per shard
+        """
+
+        return await asyncio.gather(
+            *(
+                fn(self.get(shard), ids)
+                for shard, ids in self.map.group(chat_ids).items()
+            )
+        )
+
+    async def broadcast(self, fn: Callable[[AsyncSession], Awaitable[T]]) -> list[T]:
+        """
+        Run fn concurrently on every shard
+
+        Returns:
+            list[T] - fn results, one per shard
+        """
+
+        return await asyncio.gather(*(fn(self.get(shard)) for shard in self.map.shards))
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+shard_map = ShardMap.from_settings()
@@ -0,0 +1,218 @@
+import asyncio
+import random
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from .config import settings
+from .ids import MAX_WORKER_ID, WorkerIdUnavailable, assign_worker_id, id_generator
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# first key of advisory locks of worker ids, the second one is worker id
+LOCK_CLASS = 0x534E4F57
+
+
+class WorkerIdLease:
+    """
+    Worker id held by this process as a PostgreSQL session-level advisory
+    lock, on a connection of its own. The lock goes away with the connection,
+    so ids of crashed processes are free again without any expiry.
+
+    The lock is freed as soon as its connection drops, before this process
+    can notice, so ids are generated only for ttl seconds after the last
+    check that the lock is held, and a process locking a worker id waits
+    ttl seconds before using it. Two processes never use it at once.
+
+    Args:
+        url: str - PostgreSQL url, the same for every process
+        ttl: float - seconds the worker id is used after a successful check
+    """
+
+    def __init__(self, url: str, ttl: float):
+        self._engine = create_async_engine(url, poolclass=NullPool)
+        self._connection: AsyncConnection | None = None
+        self._keeper: asyncio.Task | None = None
+        self.ttl = ttl
+        self.worker_id: int | None = None
+
+    async def acquire(self, worker_id: int | None = None) -> int:
+        """
+        Lock worker id, the given one or any free one
+
+        Args:
+            worker_id: int | None - configured worker id, checked it isn't
+                used by another process
+
+        Returns:
+            int - locked worker id
+
+        Raises:
+            WorkerIdUnavailable - worker id is used, or all of them are
+        """
+
+        candidates = list(range(MAX_WORKER_ID + 1))
+        if worker_id is not None:
+            candidates = [worker_id]
+        else:
+            # processes starting together mostly don't try the same ids
+            offset = random.randrange(len(candidates))
+            candidates = candidates[offset:] + candidates[:offset]
+
+        connection = await self._engine.connect()
+        try:
+            for candidate in candidates:
+                if await self._try_lock(connection, candidate):
+                    self._connection, self.worker_id = connection, candidate
+                    return candidate
+        except BaseException:
+            await connection.close()
+            raise
+        await connection.close()
+        if worker_id is not None:
+            raise WorkerIdUnavailable(
+                f"Worker id {worker_id} is used by another process"
+            )
+        raise WorkerIdUnavailable("All worker ids are used")
+
+    async def confirm(self, timeout: float) -> bool:
+        """
+        Check the lock is held, and let ids be generated
+        for ttl seconds from the check
+
+        Args:
+            timeout: float - seconds the check may take
+
+        Returns:
+            bool - False if the connection is lost or doesn't answer in time
+        """
+
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                await self._connection.execute(text("SELECT 1"))
+                await self._connection.commit()
+        except (SQLAlchemyError, TimeoutError) as exc:
+            logger.error(f"Lost lease of worker id {self.worker_id}: {exc!r}")
+            return False
+        # the lock was held when the check started, another process
+        # locking it later waits ttl before using it
+        assign_worker_id(self.worker_id, valid_until=started + self.ttl)
+        return True
+
+    def start(self, interval: float) -> None:
+        """Confirm the lock every interval seconds in background, till released"""
+
+        self._keeper = asyncio.create_task(self.keep(interval))
+
+    async def keep(self, interval: float) -> None:
+        """
+        Confirm the lock every interval seconds, till cancelled.
+        If its connection is lost, ids aren't generated till the same
+        worker id is locked again and ttl passes.
+        """
+
+        while True:
+            await asyncio.sleep(interval)
+            if await self.confirm(timeout=interval):
+                continue
+            assign_worker_id(None)
+            await self._close_connection()
+            while not await self._relock():
+                await asyncio.sleep(interval)
+            # a process that held the worker id meanwhile stops using it
+            await asyncio.sleep(self.ttl)
+            logger.info(f"Leased worker id {self.worker_id} again")
+
+    async def release(self) -> None:
+        if self._keeper is not None:
+            self._keeper.cancel()
+            await asyncio.gather(self._keeper, return_exceptions=True)
+            self._keeper = None
+        assign_worker_id(None)
+        await self._close_connection()
+        await self._engine.dispose()
+
+    async def _relock(self) -> bool:
+        try:
+            connection = await self._engine.connect()
+        except SQLAlchemyError as exc:
+            logger.warning(f"Leasing worker id {self.worker_id} failed: {exc}")
+            return False
+        try:
+            if await self._try_lock(connection, self.worker_id):
+                self._connection = connection
+                return True
+        except SQLAlchemyError as exc:
+            logger.warning(f"Leasing worker id {self.worker_id} failed: {exc}")
+        await connection.close()
+        return False
+
+    @staticmethod
+    async def _try_lock(connection: AsyncConnection, worker_id: int) -> bool:
+        locked = await connection.scalar(
+            text("SELECT pg_try_advisory_lock(:lock_class, :worker_id)"),
+            {"lock_class": LOCK_CLASS, "worker_id": worker_id},
+        )
+        # outside of a transaction, the lock belongs to the session
+        await connection.commit()
+        return bool(locked)
+
+    async def _close_connection(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            await self._connection.close()
+        except SQLAlchemyError:
+            pass
+        self._connection = None
+
+
+async def lease_worker_id(url: str) -> WorkerIdLease | None:
+    """
+    Make sure this process has a worker id no other process has,
+    before it writes anything. On PostgreSQL the configured worker id
+    is locked, or a free one is leased, and confirmed in background
+    till released. Elsewhere the worker id must be configured.
+
+    Args:
+        url: str - url of the db leases are taken in, the same for every process
+
+    Returns:
+        WorkerIdLease | None - lease to keep and release, None if not leased
+
+    Raises:
+        WorkerIdUnavailable - no unique worker id for this process
+    """
+
+    if settings.ids.derive_worker_id or make_url(url).get_backend_name() != (
+        "postgresql"
+    ):
+        if id_generator.worker_id is None:
+            raise WorkerIdUnavailable(
+                "Set unique ID_WORKER_ID of this process or use PostgreSQL "
+                "to lease one, ID_DERIVE_WORKER_ID=true is for dev and tests"
+            )
+        return None
+
+    # configured worker id isn't used till it's locked
+    assign_worker_id(None)
+    lease = WorkerIdLease(url, settings.ids.lease_ttl)
+    interval = settings.ids.lease_check_interval
+    try:
+        worker_id = await lease.acquire(settings.ids.worker_id)
+        # a process that just lost the worker id stops using it
+        await asyncio.sleep(lease.ttl)
+        if not await lease.confirm(timeout=interval):
+            raise WorkerIdUnavailable(f"Lease of worker id {worker_id} was lost")
+    except BaseException:
+        await lease.release()
+        raise
+    lease.start(interval)
+    logger.info(f"Leased worker id {worker_id}")
+    return lease
@@ -0,0 +1,77 @@
+"""
+Import chats and messages from NDJSON file
+
+Usage:
+    python src/import_chats.py data.ndjson [--checkpoint data.ndjson.checkpoint]
+
+Progress is saved to checkpoint file after every committed chunk,
+running the command again resumes the import from there.
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import AsyncIterator
+
+from app.schemas import ImportReport
+from app.services import ImportService
+from app.services.importer import IMPORT_CHUNK_SIZE
+from core import ShardSessions, get_logger, setup_logging, shard_map
+from core.worker_lease import lease_worker_id
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+async def read_lines(path: Path) -> AsyncIterator[bytes]:
+    with path.open("rb") as file:
+        for line in file:
+            yield line
+
+
+def load_checkpoint(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return json.loads(path.read_text())["next_line"]
+
+
+def save_checkpoint(path: Path, report: ImportReport) -> None:
+    path.write_text(json.dumps({"next_line": report.next_line}))
+
+
+async def main(source: Path, checkpoint: Path, chunk_size: int) -> ImportReport:
+    start_line = load_checkpoint(checkpoint)
+    if start_line:
+        logger.info(f"Resuming import of {source} from line {start_line}")
+
+    lease = await lease_worker_id(shard_map.shards[min(shard_map.shards)].url)
+    shards = ShardSessions(shard_map)
+    try:
+        report = await ImportService.import_ndjson(
+            shards,
+            read_lines(source),
+            start_line=start_line,
+            chunk_size=chunk_size,
+            on_progress=lambda report: save_checkpoint(checkpoint, report),
+        )
+    finally:
+        await shards.close()
+        if lease is not None:
+            await lease.release()
+    await shard_map.dispose()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", type=Path)
+    parser.add_argument("--checkpoint", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.source.with_name(
+        f"{args.source.name}.checkpoint"
+    )
+    report = asyncio.run(main(args.source, checkpoint, args.chunk_size))
+    print(report.model_dump_json(indent=2))
@@ -8,7 +8,8 @@ logger = get_logger(__name__)
 
 def main() -> None:
     uvicorn.run(
-        "app.app:app",
+        "app.app:create_app",
+        factory=True,
         port=8000,
         host="0.0.0.0",
         reload=True,
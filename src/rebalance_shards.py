@@ -0,0 +1,84 @@
+"""
+Move a bucket of chats to another shard
+
+Usage:
+    SHARD_MAP_FILE=shards.json python src/rebalance_shards.py BUCKET TARGET
+
+Chats are copied while the source shard keeps serving them. Then the
+bucket is frozen in the map file, and after grace seconds, when every app
+process has reloaded the map and stopped writing to the bucket, rows written
+meanwhile are copied again and rows deleted meanwhile are deleted. Finally
+the bucket is switched to the target and, after another grace period,
+deleted from the source.
+"""
+
+import argparse
+import asyncio
+
+from app.services import RebalanceService
+from app.services.rebalance import REBALANCE_BATCH_SIZE
+from core import ShardSessions, get_logger, settings, setup_logging, shard_map
+from core.sharding import BUCKETS
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+async def main(bucket: int, target: str, grace: float, batch_size: int) -> None:
+    source = shard_map.buckets[bucket]
+    if source == target:
+        logger.info(f"Bucket {bucket} is already on {target}")
+        return
+
+    shards = ShardSessions(shard_map)
+    try:
+        copied = await RebalanceService.copy_bucket(
+            shards.get(source), shards.get(target), bucket, batch_size
+        )
+        logger.info(f"Copied bucket {bucket} from {source} to {target}: {copied}")
+
+        # writes would race for chats' seqs on two shards
+        shard_map.freeze(bucket)
+        shard_map.save()
+        logger.info(f"Bucket {bucket} is frozen, waiting {grace}s")
+        await asyncio.sleep(grace)
+
+        copied = await RebalanceService.copy_bucket(
+            shards.get(source), shards.get(target), bucket, batch_size
+        )
+        logger.info(f"Copied rows written before the freeze: {copied}")
+        # rows deleted after the first copy must not come back on target
+        pruned = await RebalanceService.prune_bucket(
+            shards.get(source), shards.get(target), bucket, batch_size
+        )
+        logger.info(f"Deleted rows gone from {source}: {pruned}")
+
+        shard_map.move_bucket(bucket, target)
+        shard_map.save()
+        logger.info(f"Bucket {bucket} is served by {target}, waiting {grace}s")
+        await asyncio.sleep(grace)
+        deleted = await RebalanceService.delete_bucket(
+            shards.get(source), bucket, batch_size
+        )
+        logger.info(f"Deleted {deleted} chats of bucket {bucket} from {source}")
+    finally:
+        await shards.close()
+        await shard_map.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("bucket", type=int, choices=range(BUCKETS), metavar="BUCKET")
+    parser.add_argument("target", choices=list(shard_map.shards))
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=settings.shards.reload_interval * 5,
+        help="seconds for app processes to reload the map",
+    )
+    parser.add_argument("--batch-size", type=int, default=REBALANCE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if shard_map.map_file is None:
+        parser.error("SHARD_MAP_FILE must be set")
+    asyncio.run(main(args.bucket, args.target, args.grace, args.batch_size))
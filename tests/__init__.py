@@ -0,0 +1,4 @@
+import os
+
+# set before app is imported, tests don't lease worker ids
+os.environ.setdefault("ID_DERIVE_WORKER_ID", "true")
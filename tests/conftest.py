@@ -8,10 +8,29 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_asyn
 from sqlalchemy.pool import StaticPool
 
 from app.app import app
-from core import Base
+from app.services.chat import chat_detail_flights, hot_tail, read_markers
+from app.services.idempotency import idempotency_cache
+from app.services.outbox import Event, EventType, outbox_dispatcher
+from core import Base, DBHelper, ShardMap, instrument_engine, settings, shard_map
+from core.sharding import spread_buckets
 from .utils import override_db_session
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+TEST_SHARDS = ("shard_a", "shard_b")
+
+
+def set_sqlite_pragma(dbapi_conn, _):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def clear_caches() -> None:
+    idempotency_cache.clear()
+    chat_detail_flights.clear()
+    hot_tail.clear()
+    read_markers.clear()
+    outbox_dispatcher.reset_stats()
 
 
 @pytest.fixture(scope="session")
@@ -23,6 +42,15 @@ def event_loop() -> Generator:
     loop.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def strict_statement_budget() -> Generator:
+    """Fail tests on routes exceeding their statement budget"""
+
+    settings.db_stats.strict_budget = True
+    yield
+    settings.db_stats.strict_budget = False
+
+
 @pytest.fixture(scope="session")
 async def test_engine() -> AsyncGenerator:
     """Test db engine"""
@@ -33,11 +61,8 @@ async def test_engine() -> AsyncGenerator:
         poolclass=StaticPool,
     )
 
-    @event.listens_for(engine.sync_engine, "connect")
-    def set_sqlite_pragma(dbapi_conn, _):
-        cursor = dbapi_conn.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragma)
+    instrument_engine(engine)
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -79,8 +104,66 @@ async def client(
     """Test client with overridden database session"""
 
     override_db_session(test_session)
+    clear_caches()
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as async_client:
         yield async_client
 
     app.dependency_overrides.clear()
+
+
+@pytest.fixture
+async def test_shard_map(tmp_path) -> AsyncGenerator[ShardMap]:
+    """SQLite files standing in for db shards, buckets spread between them"""
+
+    shards = {}
+    for name in TEST_SHARDS:
+        shard = DBHelper(url=f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        event.listen(shard.engine.sync_engine, "connect", set_sqlite_pragma)
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        shards[name] = shard
+
+    sharded = ShardMap(shards, spread_buckets(list(shards)), tmp_path / "shards.json")
+    yield sharded
+    await sharded.dispose()
+
+
+@pytest.fixture
+async def sharded_client(
+    test_shard_map: ShardMap,
+) -> AsyncGenerator[AsyncClient, None]:
+    """Test client with chats spread over SQLite shards"""
+
+    app.dependency_overrides[shard_map.session_dependency] = (
+        test_shard_map.session_dependency
+    )
+    clear_caches()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as async_client:
+        yield async_client
+
+    app.dependency_overrides.clear()
+
+
+async def ignore_event(event: Event) -> None:
+    pass
+
+
+@pytest.fixture
+def outbox_handled() -> Generator:
+    """Handler of every event type, events nobody handles aren't written"""
+
+    for event_type in EventType:
+        outbox_dispatcher.register(event_type)(ignore_event)
+    yield
+    for event_type in EventType:
+        outbox_dispatcher.unregister(event_type, ignore_event)
+
+
+@pytest.fixture
+def import_headers(monkeypatch) -> dict[str, str]:
+    """Headers of an admin allowed to import chats"""
+
+    monkeypatch.setattr(settings.imports, "admin_token", "secret")
+    return {"X-Admin-Token": "secret"}
@@ -0,0 +1,175 @@
+import asyncio
+
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.middlewares import AdaptiveLimiter, AdmissionControlMiddleware
+from app.middlewares.admission import Priority
+
+
+def make_limiter(**kwargs) -> AdaptiveLimiter:
+    options = dict(
+        initial_limit=1,
+        min_limit=1,
+        max_limit=10,
+        target_latency=0.1,
+        max_queue=10,
+        max_wait=1.0,
+    )
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+class TestAdaptiveLimiter:
+    """Tests for AdaptiveLimiter admission and limit adaptation"""
+
+    async def test_admits_under_limit(self):
+        limiter = make_limiter(initial_limit=2)
+
+        assert await limiter.acquire(Priority.read)
+        assert await limiter.acquire(Priority.write)
+        assert limiter.in_flight == 2
+
+    async def test_sheds_when_queue_full(self):
+        limiter = make_limiter(max_queue=0)
+        await limiter.acquire(Priority.read)
+
+        assert not await limiter.acquire(Priority.read)
+        assert limiter.stats()["shed"][Priority.read] == 1
+
+    async def test_sheds_after_max_wait(self):
+        limiter = make_limiter(max_wait=0.01)
+        await limiter.acquire(Priority.read)
+
+        assert not await limiter.acquire(Priority.read)
+        assert limiter.stats()["queued"][Priority.read] == 0
+
+    async def test_slot_handed_over_at_timeout(self, monkeypatch):
+        limiter = make_limiter()
+        await limiter.acquire(Priority.read)
+
+        async def wait_for(waiter, timeout):
+            # the slot is freed right before the wait times out
+            limiter.release()
+            assert waiter.done()
+            raise TimeoutError
+
+        monkeypatch.setattr(asyncio, "wait_for", wait_for)
+
+        assert await limiter.acquire(Priority.read)
+        assert limiter.in_flight == 1
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    async def test_writes_admitted_before_reads(self):
+        limiter = make_limiter()
+        await limiter.acquire(Priority.read)
+        order = []
+
+        async def wait(priority):
+            await limiter.acquire(priority)
+            order.append(priority)
+            limiter.release()
+
+        read = asyncio.create_task(wait(Priority.read))
+        await asyncio.sleep(0)
+        write = asyncio.create_task(wait(Priority.write))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(read, write)
+
+        assert order == [Priority.write, Priority.read]
+
+    async def test_limit_adapts_to_latency(self):
+        limiter = make_limiter(initial_limit=5)
+
+        await limiter.acquire(Priority.read)
+        limiter.release(latency=1.0)
+        assert limiter.limit < 5
+
+        limit = limiter.limit
+        await limiter.acquire(Priority.read)
+        limiter.release(latency=0.01)
+        assert limiter.limit > limit
+
+    async def test_limit_bounded(self):
+        limiter = make_limiter(initial_limit=2, min_limit=2, max_limit=2)
+
+        for latency in (1.0, 0.01):
+            await limiter.acquire(Priority.read)
+            limiter.release(latency=latency)
+            assert limiter.limit == 2
+
+
+class TestAdmissionControlMiddleware:
+    """Tests for shedding over capacity requests"""
+
+    async def test_overloaded_request_shed(self):
+        release = asyncio.Event()
+
+        async def slow(request):
+            await release.wait()
+            return PlainTextResponse("ok")
+
+        app = Starlette(routes=[Route("/slow", slow)])
+        limiter = make_limiter(max_queue=0)
+        asgi = AdmissionControlMiddleware(app, limiter=limiter)
+
+        async with AsyncClient(
+            transport=ASGITransport(app=asgi), base_url="http://test"
+        ) as client:
+            first = asyncio.create_task(client.get("/slow"))
+            while not limiter.in_flight:
+                await asyncio.sleep(0)
+
+            shed = await client.get("/slow")
+            release.set()
+            admitted = await first
+
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "1"
+        assert admitted.status_code == 200
+        assert limiter.in_flight == 0
+
+    async def test_metrics_exempt(self, client):
+        response = await client.get("/api/metrics/admission")
+
+        assert response.status_code == 200
+        assert {"limit", "in_flight", "queued", "shed"} <= response.json().keys()
+
+    async def test_request_past_deadline_cancelled(self):
+        cancelled = asyncio.Event()
+
+        async def stuck(request):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return PlainTextResponse("ok")
+
+        async def stream(request):
+            async def body():
+                await asyncio.sleep(0.05)
+                yield b"ok"
+
+            return StreamingResponse(body())
+
+        app = Starlette(routes=[Route("/stuck", stuck), Route("/stream", stream)])
+        limiter = make_limiter()
+        asgi = AdmissionControlMiddleware(app, limiter=limiter, timeout=0.02)
+
+        async with AsyncClient(
+            transport=ASGITransport(app=asgi), base_url="http://test"
+        ) as client:
+            timed_out = await client.get("/stuck")
+            streamed = await client.get("/stream")
+
+        assert timed_out.status_code == 503
+        assert "Retry-After" in timed_out.headers
+        assert cancelled.is_set()
+        # the body is streamed past the deadline once the response started
+        assert streamed.text == "ok"
+        assert limiter.in_flight == 0
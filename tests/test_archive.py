@@ -0,0 +1,234 @@
+import json
+import threading
+from datetime import timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import ArchiveService
+from app.services import archive
+from app.services.archive import SegmentMissing
+from app.services.segments import LocalSegmentStore
+from core import ShardSessions, shard_map
+from core.models import Chat, Message
+from core.models.base import utcnow
+from .conftest import clear_caches
+from .utils import CHAT_URL, create_chat, create_message
+
+
+@pytest.fixture(autouse=True)
+def segment_store(tmp_path, monkeypatch) -> LocalSegmentStore:
+    store = LocalSegmentStore(tmp_path / "archive")
+    monkeypatch.setattr(archive, "segment_store", store)
+    return store
+
+
+async def create_chat_with_messages(client: AsyncClient, count: int) -> int:
+    chat_id = (await create_chat(client, "Archived")).json()["id"]
+    for i in range(1, count + 1):
+        await create_message(client, chat_id, f"Message {i}")
+    return chat_id
+
+
+async def archive_all(session: AsyncSession, **kwargs) -> int:
+    shards = ShardSessions(shard_map, lambda shard: session)
+    archived = await ArchiveService.archive_idle_chats(
+        shards, utcnow() + timedelta(days=1), **kwargs
+    )
+    # cached chat details must not hide reads from segments
+    clear_caches()
+    return archived
+
+
+async def count_messages(session: AsyncSession) -> int:
+    return await session.scalar(select(func.count()).select_from(Message))
+
+
+class TestArchive:
+    """Tests for moving messages of idle chats to segments"""
+
+    async def test_archive_idle_chats(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, 5)
+        await create_chat(client, "Empty")
+
+        archived = await archive_all(test_session, block_size=2)
+
+        assert archived == 1
+        assert await count_messages(test_session) == 0
+        chat = await test_session.get(Chat, chat_id)
+        await test_session.refresh(chat)
+        assert chat.archived_seq == 5
+        assert chat.archive_segment is not None
+
+    async def test_recent_chats_not_archived(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        await create_chat_with_messages(client, 2)
+        shards = ShardSessions(shard_map, lambda shard: test_session)
+
+        archived = await ArchiveService.archive_idle_chats(
+            shards, utcnow() - timedelta(days=1)
+        )
+
+        assert archived == 0
+        assert await count_messages(test_session) == 2
+
+    async def test_rearchive_keeps_earlier_messages(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, 3)
+        await archive_all(test_session)
+        await create_message(client, chat_id, "Message 4")
+
+        assert await archive_all(test_session) == 1
+        assert await archive_all(test_session) == 0
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}", params={"limit": 10})
+        assert [msg["seq"] for msg in response.json()["messages"]] == [4, 3, 2, 1]
+
+
+class TestCompactSegments:
+    """Tests for dropping deleted chats from segments"""
+
+    async def compact(self, session: AsyncSession) -> int:
+        shards = ShardSessions(shard_map, lambda shard: session)
+        return await ArchiveService.compact_segments(shards, grace=timedelta(0))
+
+    async def test_deleted_chat_dropped(
+        self,
+        client: AsyncClient,
+        test_session: AsyncSession,
+        segment_store: LocalSegmentStore,
+    ):
+        kept = await create_chat_with_messages(client, 2)
+        deleted = await create_chat_with_messages(client, 3)
+        await archive_all(test_session)
+        (old,) = await segment_store.names()
+        await client.delete(f"{CHAT_URL}/{deleted}")
+
+        assert await self.compact(test_session) == 1
+        assert await self.compact(test_session) == 1
+        assert await self.compact(test_session) == 0
+
+        (new,) = await segment_store.names()
+        assert new != old
+        assert segment_store.open_index(new).chat_ids() == {int(kept)}
+        clear_caches()
+        response = await client.get(f"{CHAT_URL}/{kept}")
+        assert [msg["seq"] for msg in response.json()["messages"]] == [2, 1]
+
+    async def test_young_segments_left(
+        self,
+        client: AsyncClient,
+        test_session: AsyncSession,
+        segment_store: LocalSegmentStore,
+    ):
+        chat_id = await create_chat_with_messages(client, 2)
+        await archive_all(test_session)
+        await client.delete(f"{CHAT_URL}/{chat_id}")
+        shards = ShardSessions(shard_map, lambda shard: test_session)
+
+        assert await ArchiveService.compact_segments(shards) == 0
+        assert len(await segment_store.names()) == 1
+
+    async def test_missing_segment_fails_check(
+        self,
+        client: AsyncClient,
+        test_session: AsyncSession,
+        segment_store: LocalSegmentStore,
+    ):
+        await create_chat_with_messages(client, 2)
+        await archive_all(test_session)
+        shards = ShardSessions(shard_map, lambda shard: test_session)
+        await ArchiveService.check_segments(shards)
+
+        (name,) = await segment_store.names()
+        await segment_store.remove(name)
+
+        with pytest.raises(SegmentMissing):
+            await ArchiveService.check_segments(shards)
+
+
+class TestArchiveReadThrough:
+    """Tests for reading archived messages through chats API"""
+
+    async def test_chat_detail(self, client: AsyncClient, test_session: AsyncSession):
+        chat_id = await create_chat_with_messages(client, 5)
+        await archive_all(test_session, block_size=2)
+        await create_message(client, chat_id, "Message 6")
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}", params={"limit": 4})
+
+        assert response.status_code == 200
+        assert [msg["text"] for msg in response.json()["messages"]] == [
+            "Message 6",
+            "Message 5",
+            "Message 4",
+            "Message 3",
+        ]
+
+    async def test_batch_get(self, client: AsyncClient, test_session: AsyncSession):
+        chat_id = await create_chat_with_messages(client, 3)
+        await archive_all(test_session)
+
+        response = await client.post(
+            f"{CHAT_URL}:batchGet", json={"chat_ids": [chat_id], "limit": 2}
+        )
+
+        assert response.status_code == 200
+        messages = response.json()["chats"][0]["messages"]
+        assert [msg["seq"] for msg in messages] == [3, 2]
+
+    async def test_export(self, client: AsyncClient, test_session: AsyncSession):
+        chat_id = await create_chat_with_messages(client, 3)
+        await archive_all(test_session, block_size=2)
+        await create_message(client, chat_id, "Message 4")
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export")
+
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["seq"] for line in lines] == [1, 2, 3, 4]
+
+    async def test_sync(self, client: AsyncClient, test_session: AsyncSession):
+        chat_id = await create_chat_with_messages(client, 5)
+        await archive_all(test_session, block_size=2)
+        await create_message(client, chat_id, "Message 6")
+
+        response = await client.get(
+            "/api/sync", params={"since": f"{chat_id}:1", "limit": 4}
+        )
+
+        *messages, cursor = [json.loads(line) for line in response.text.splitlines()]
+        assert [msg["seq"] for msg in messages] == [2, 3, 4, 5]
+        assert cursor["since"] == f"{chat_id}:5"
+        assert cursor["more"] is True
+
+    async def test_segments_read_off_event_loop(
+        self,
+        client: AsyncClient,
+        test_session: AsyncSession,
+        segment_store: LocalSegmentStore,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        chat_id = await create_chat_with_messages(client, 3)
+        await archive_all(test_session)
+        segment_store._maps.clear()
+        threads = []
+        open_segment = segment_store._open
+
+        def spy_open(name: str):
+            threads.append(threading.current_thread())
+            return open_segment(name)
+
+        monkeypatch.setattr(segment_store, "_open", spy_open)
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}")
+
+        assert [msg["seq"] for msg in response.json()["messages"]] == [3, 2, 1]
+        assert threads
+        assert threading.main_thread() not in threads
@@ -0,0 +1,63 @@
+from httpx import AsyncClient
+
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+BATCH_GET_URL = f"{CHAT_URL}:batchGet"
+
+
+class TestBatchGetChats:
+    """Tests for POST {CHAT_URL}:batchGet"""
+
+    async def test_batch_get_success(self, client: AsyncClient):
+        chat_ids = []
+        for i in range(3):
+            chat_id = (await create_chat(client, f"Chat {i}")).json()["id"]
+            for j in range(i * 2):
+                await create_message(client, chat_id, f"Chat {i} message {j}")
+            chat_ids.append(chat_id)
+
+        with assert_max_statements(2):
+            response = await client.post(
+                BATCH_GET_URL, json={"chat_ids": chat_ids[::-1], "limit": 3}
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["not_found"] == []
+        assert [item["chat"]["id"] for item in data["chats"]] == chat_ids[::-1]
+        assert [len(item["messages"]) for item in data["chats"]] == [3, 2, 0]
+        assert [msg["text"] for msg in data["chats"][0]["messages"]] == [
+            "Chat 2 message 3",
+            "Chat 2 message 2",
+            "Chat 2 message 1",
+        ]
+
+    async def test_batch_get_not_found(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+
+        response = await client.post(
+            BATCH_GET_URL, json={"chat_ids": [chat_id, 99999, chat_id]}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["chat"]["id"] for item in data["chats"]] == [chat_id]
+        assert data["not_found"] == ["99999"]
+
+    async def test_batch_get_numeric_ids(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+
+        response = await client.post(BATCH_GET_URL, json={"chat_ids": [int(chat_id)]})
+
+        assert response.status_code == 200
+        assert response.json()["chats"][0]["chat"]["id"] == chat_id
+
+    async def test_batch_get_empty_ids(self, client: AsyncClient):
+        response = await client.post(BATCH_GET_URL, json={"chat_ids": []})
+
+        assert response.status_code == 422
+
+    async def test_batch_get_too_many_ids(self, client: AsyncClient):
+        response = await client.post(BATCH_GET_URL, json={"chat_ids": list(range(101))})
+
+        assert response.status_code == 422
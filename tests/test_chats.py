@@ -14,7 +14,7 @@ class TestCreateChat:
         assert data["title"] == "Test Chat"
         assert "id" in data
         assert "created_at" in data
-        assert isinstance(data["id"], int)
+        assert isinstance(data["id"], str)
 
     async def test_create_chat_min_length_title(self, client: AsyncClient):
         response = await create_chat(client, "A")
@@ -188,7 +188,7 @@ class TestCreateMessage:
         assert data["chat_id"] == chat_id
         assert "id" in data
         assert "created_at" in data
-        assert isinstance(data["id"], int)
+        assert isinstance(data["id"], str)
 
     async def test_create_message_min_length(self, client: AsyncClient):
         """Creating a message with minimum length text"""
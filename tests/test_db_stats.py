@@ -0,0 +1,65 @@
+import pytest
+from httpx import AsyncClient
+
+from app.middlewares import DBStatsMiddleware
+from core import DBStats, StatementBudgetExceeded, statement_budget
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+
+class TestServerTiming:
+    """Tests for Server-Timing header added by DBStatsMiddleware"""
+
+    async def test_server_timing_header(self, client: AsyncClient):
+        response = await create_chat(client, "Test Chat")
+
+        assert response.status_code == 201
+        server_timing = response.headers["server-timing"]
+        assert server_timing.startswith("db;dur=")
+        assert "statements" in server_timing
+
+    async def test_get_chat_detail_statements(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        for i in range(5):
+            await create_message(client, chat_id, f"Message {i}")
+
+        with assert_max_statements(2) as stats:
+            response = await client.get(f"{CHAT_URL}/{chat_id}")
+
+        assert response.status_code == 200
+        assert (
+            f'desc="{stats.statements} statements"' in response.headers["server-timing"]
+        )
+
+
+class TestStatementBudget:
+    """Tests for statement budget checks"""
+
+    @staticmethod
+    def make_scope(limit: int) -> dict:
+        @statement_budget(limit)
+        async def endpoint():
+            pass
+
+        return {"method": "GET", "path": "/test", "endpoint": endpoint}
+
+    @staticmethod
+    def make_stats(statements: int) -> DBStats:
+        stats = DBStats()
+        for _ in range(statements):
+            stats.record(0.001)
+        return stats
+
+    def test_within_budget(self):
+        DBStatsMiddleware.check_budget(self.make_scope(2), self.make_stats(2))
+
+    def test_budget_exceeded(self):
+        with pytest.raises(StatementBudgetExceeded):
+            DBStatsMiddleware.check_budget(self.make_scope(2), self.make_stats(3))
+
+    def test_nested_stats_count_towards_parent(self):
+        parent = DBStats()
+        child = DBStats(parent=parent)
+        child.record(0.5)
+
+        assert parent.statements == child.statements == 1
+        assert parent.duration == child.duration == 0.5
@@ -0,0 +1,162 @@
+import zlib
+
+import msgpack
+import pytest
+from httpx import AsyncClient
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from app.middlewares import CompressionMiddleware
+from app.services import encoding
+from app.services.encoding import ResponseFormat, pack
+from .utils import CHAT_URL, create_chat, create_message
+
+MSGPACK = {"Accept": "application/msgpack"}
+
+
+async def create_long_chat(client: AsyncClient, messages: int = 3) -> int:
+    chat_id = (await create_chat(client, "Long")).json()["id"]
+    for i in range(messages):
+        await create_message(client, chat_id, f"Message {i} " + "x" * 1000)
+    return chat_id
+
+
+class TestMessagePack:
+    """Tests for MessagePack responses negotiated by Accept header"""
+
+    @pytest.mark.parametrize(
+        ("accept", "expected"),
+        [
+            ("application/msgpack", ResponseFormat.msgpack),
+            ("application/json;q=0.5, application/x-msgpack", ResponseFormat.msgpack),
+            ("application/msgpack;q=0.1, */*", ResponseFormat.json),
+            ("text/html", ResponseFormat.json),
+            (None, ResponseFormat.json),
+        ],
+    )
+    def test_from_accept(self, accept, expected):
+        assert ResponseFormat.from_accept(accept) == expected
+
+    async def test_chat_detail(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        as_json = await client.get(f"{CHAT_URL}/{chat_id}")
+        response = await client.get(f"{CHAT_URL}/{chat_id}", headers=MSGPACK)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert "Accept" in response.headers["vary"]
+        assert msgpack.unpackb(response.content) == as_json.json()
+
+    async def test_batch_get(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.post(
+            f"{CHAT_URL}:batchGet", json={"chat_ids": [chat_id, 1]}, headers=MSGPACK
+        )
+
+        assert response.status_code == 200
+        batch = msgpack.unpackb(response.content)
+        assert len(batch["chats"][0]["messages"]) == 3
+        assert batch["not_found"] == ["1"]
+
+    async def test_export(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export", headers=MSGPACK)
+
+        assert response.headers["content-type"] == "application/msgpack"
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(response.content)
+        assert [message["seq"] for message in unpacker] == [1, 2, 3]
+
+    def test_pack_without_msgpack(self, monkeypatch):
+        monkeypatch.setattr(encoding, "msgpack", None)
+
+        with pytest.raises(HTTPException) as exc_info:
+            pack({"id": 1})
+
+        assert exc_info.value.status_code == 406
+
+    async def test_export_format_wins_over_accept(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.get(
+            f"{CHAT_URL}/{chat_id}/export", params={"format": "csv"}, headers=MSGPACK
+        )
+
+        assert response.headers["content-type"].startswith("text/csv")
+
+
+class TestCompression:
+    """Tests for response compression negotiated by Accept-Encoding"""
+
+    async def test_gzip_large_response(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.get(
+            f"{CHAT_URL}/{chat_id}", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert len(response.json()["messages"]) == 3
+
+    async def test_zstd_preferred(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.get(
+            f"{CHAT_URL}/{chat_id}/export", headers={"Accept-Encoding": "gzip, zstd"}
+        )
+
+        assert response.headers["content-encoding"] == "zstd"
+        assert len(response.text.splitlines()) == 3
+
+    async def test_small_response_not_compressed(self, client: AsyncClient):
+        response = await client.post(
+            CHAT_URL, json={"title": "Small"}, headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 201
+        assert "content-encoding" not in response.headers
+
+    async def test_identity(self, client: AsyncClient):
+        chat_id = await create_long_chat(client)
+
+        response = await client.get(
+            f"{CHAT_URL}/{chat_id}", headers={"Accept-Encoding": "gzip;q=0, identity"}
+        )
+
+        assert "content-encoding" not in response.headers
+
+    async def test_streamed_chunks_flushed(self):
+        async def stream():
+            yield b"first\n"
+            yield b"second\n"
+
+        app = Starlette(routes=[Route("/", lambda _: StreamingResponse(stream()))])
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            # no disconnect listener, receive is never called
+            "asgi": {"spec_version": "2.4"},
+            "method": "GET",
+            "path": "/",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        await CompressionMiddleware(app)(scope, receive, send)
+
+        start, first, *_ = messages
+        assert (b"content-encoding", b"gzip") in start["headers"]
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        # first chunk decodes before the rest arrives
+        assert decompressor.decompress(first["body"]) == b"first\n"
@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+
+from httpx import AsyncClient
+
+from .utils import CHAT_URL, create_chat, create_message
+
+
+class TestExportChat:
+    """Tests for GET {CHAT_URL}/{chat_id}/export"""
+
+    async def test_export_ndjson(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Export Chat")).json()["id"]
+        for i in range(3):
+            await create_message(client, chat_id, f"Message {i}")
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["text"] for line in lines] == [f"Message {i}" for i in range(3)]
+        assert all(line["chat_id"] == chat_id for line in lines)
+
+    async def test_export_csv(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Export Chat")).json()["id"]
+        await create_message(client, chat_id, 'Text with "quotes", commas\nand lines')
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export?format=csv")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 1
+        assert rows[0]["text"] == 'Text with "quotes", commas\nand lines'
+        assert rows[0]["chat_id"] == chat_id
+
+    async def test_export_empty_chat(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Empty Chat")).json()["id"]
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export")
+
+        assert response.status_code == 200
+        assert response.text == ""
+
+    async def test_export_unknown_format(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Export Chat")).json()["id"]
+
+        response = await client.get(f"{CHAT_URL}/{chat_id}/export?format=xml")
+
+        assert response.status_code == 422
+
+    async def test_export_chat_not_found(self, client: AsyncClient):
+        response = await client.get(f"{CHAT_URL}/99999/export")
+
+        assert response.status_code == 404
@@ -0,0 +1,152 @@
+from datetime import UTC, datetime
+
+from httpx import AsyncClient
+
+from app.services.hot_tail import HotTail
+from core.models import Chat, Message
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+
+def make_chat(chat_id: int) -> Chat:
+    return Chat(id=chat_id, title=f"Chat {chat_id}", created_at=datetime.now(UTC))
+
+
+def make_messages(chat_id: int, count: int, text: str = "text") -> list[Message]:
+    """Messages newest first, as get_recent_messages returns them"""
+
+    return [
+        Message(
+            id=chat_id * 1000 + i,
+            chat_id=chat_id,
+            text=f"{text} {i}",
+            created_at=datetime.now(UTC),
+        )
+        for i in reversed(range(count))
+    ]
+
+
+def make_hot_tail(**kwargs) -> HotTail:
+    options = {"capacity": 3, "max_chats": 10, "max_bytes": 10**6, "max_age": 60}
+    return HotTail(**(options | kwargs))
+
+
+def fill(hot_tail: HotTail, chat_id: int, count: int, text: str = "text") -> None:
+    hot_tail.begin_fill(chat_id)
+    hot_tail.fill(make_chat(chat_id), make_messages(chat_id, count, text))
+
+
+class TestHotTail:
+    """Tests for HotTail cache"""
+
+    def test_serves_newest_first(self):
+        hot_tail = make_hot_tail()
+        fill(hot_tail, 1, 3)
+
+        detail = hot_tail.get(1, 2).detail(2)
+
+        assert [msg.text for msg in detail.messages] == ["text 2", "text 1"]
+        assert hot_tail.stats()["hits"] == 1
+
+    def test_complete_chat_serves_any_limit(self):
+        hot_tail = make_hot_tail()
+        fill(hot_tail, 1, 2)
+
+        assert len(hot_tail.get(1, 100).detail(100).messages) == 2
+
+    def test_full_tail_misses_bigger_limit(self):
+        hot_tail = make_hot_tail()
+        fill(hot_tail, 1, 3)
+
+        assert hot_tail.get(1, 4) is None
+        assert hot_tail.stats()["misses"] == 1
+
+    def test_append_drops_oldest(self):
+        hot_tail = make_hot_tail()
+        fill(hot_tail, 1, 2)
+        for message in make_messages(1, 2, "new"):
+            hot_tail.append(message)
+
+        tail = hot_tail.get(1, 3)
+
+        assert not tail.complete
+        assert [msg.text for msg in tail.detail(3).messages] == [
+            "new 0",
+            "new 1",
+            "text 1",
+        ]
+
+    def test_write_during_fill_discards_it(self):
+        hot_tail = make_hot_tail()
+        hot_tail.begin_fill(1)
+        hot_tail.append(make_messages(1, 1)[0])
+        hot_tail.fill(make_chat(1), make_messages(1, 2))
+
+        assert hot_tail.get(1, 1) is None
+
+    def test_lru_eviction_by_chats(self):
+        hot_tail = make_hot_tail(max_chats=2)
+        fill(hot_tail, 1, 1)
+        fill(hot_tail, 2, 1)
+        hot_tail.get(1, 1)
+        fill(hot_tail, 3, 1)
+
+        assert hot_tail.get(2, 1) is None
+        assert hot_tail.get(1, 1) is not None
+        assert hot_tail.stats()["evictions"] == 1
+
+    def test_eviction_by_bytes(self):
+        hot_tail = make_hot_tail(max_bytes=3000)
+        fill(hot_tail, 1, 3, "A" * 500)
+        fill(hot_tail, 2, 3, "A" * 500)
+
+        stats = hot_tail.stats()
+        assert stats["chats"] == 1
+        assert stats["bytes"] <= 3000
+
+    def test_expired_chat_misses(self):
+        hot_tail = make_hot_tail(max_age=0)
+        fill(hot_tail, 1, 1)
+
+        assert hot_tail.get(1, 1) is None
+
+
+class TestChatDetailHotTail:
+    """Tests for GET {CHAT_URL}/{chat_id} served from hot tail"""
+
+    async def test_second_read_without_db(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Hot Chat")).json()["id"]
+        await create_message(client, chat_id, "First")
+        first = await client.get(f"{CHAT_URL}/{chat_id}")
+
+        await create_message(client, chat_id, "Second")
+        with assert_max_statements(0):
+            second = await client.get(f"{CHAT_URL}/{chat_id}?limit=5")
+
+        assert second.json()["chat"] == first.json()["chat"]
+        assert [msg["text"] for msg in second.json()["messages"]] == [
+            "Second",
+            "First",
+        ]
+
+    async def test_deleted_chat_evicted(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Hot Chat")).json()["id"]
+        await client.get(f"{CHAT_URL}/{chat_id}")
+
+        await client.delete(f"{CHAT_URL}/{chat_id}")
+        response = await client.get(f"{CHAT_URL}/{chat_id}")
+
+        assert response.status_code == 404
+
+    async def test_stats(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Hot Chat")).json()["id"]
+        await client.get(f"{CHAT_URL}/{chat_id}")
+        await client.get(f"{CHAT_URL}/{chat_id}")
+
+        response = await client.get("/api/metrics/hot-tail")
+
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["chats"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
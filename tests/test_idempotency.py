@@ -0,0 +1,158 @@
+import asyncio
+from datetime import timedelta
+
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import IdempotencyService
+from app.services.idempotency import IdempotencyCache, idempotency_cache
+from core import ShardSessions, shard_map
+from core.models import IdempotencyKey
+from .utils import CHAT_URL, create_chat
+
+
+async def post_message(client: AsyncClient, chat_id: int, text: str, key: str):
+    return await client.post(
+        f"{CHAT_URL}/{chat_id}/messages",
+        json={"text": text},
+        headers={"Idempotency-Key": key},
+    )
+
+
+class TestIdempotentMessagePosting:
+    """Tests for Idempotency-Key of POST {CHAT_URL}/{chat_id}/messages"""
+
+    async def test_retry_returns_original_message(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+
+        first = await post_message(client, chat_id, "Hello", "key-1")
+        retry = await post_message(client, chat_id, "Hello", "key-1")
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.json() == first.json()
+        assert "idempotent-replayed" not in first.headers
+        assert retry.headers["idempotent-replayed"] == "true"
+
+        detail = (await client.get(f"{CHAT_URL}/{chat_id}")).json()
+        assert len(detail["messages"]) == 1
+
+    async def test_retry_served_from_db(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        first = await post_message(client, chat_id, "Hello", "key-1")
+
+        # another worker doesn't have the key cached
+        idempotency_cache.clear()
+        retry = await post_message(client, chat_id, "Hello", "key-1")
+
+        assert retry.json() == first.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+
+    async def test_different_keys_create_messages(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+
+        first = await post_message(client, chat_id, "Hello", "key-1")
+        second = await post_message(client, chat_id, "Hello", "key-2")
+
+        assert first.json()["id"] != second.json()["id"]
+
+    async def test_key_reused_for_another_chat(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        other_chat_id = (await create_chat(client, "Other Chat")).json()["id"]
+        await post_message(client, chat_id, "Hello", "key-1")
+
+        response = await post_message(client, other_chat_id, "Hello", "key-1")
+
+        assert response.status_code == 422
+
+    async def test_key_reused_for_another_text(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        await post_message(client, chat_id, "Hello", "key-1")
+
+        cached = await post_message(client, chat_id, "Bye", "key-1")
+        idempotency_cache.clear()
+        stored = await post_message(client, chat_id, "Bye", "key-1")
+
+        assert cached.status_code == stored.status_code == 422
+        assert "another request" in stored.json()["detail"]
+
+    async def test_cached_key_gone_from_db_not_replayed(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        await post_message(client, chat_id, "Hello", "key-1")
+
+        # another worker purged the key or deleted its chat, this one has it cached
+        await test_session.execute(
+            IdempotencyKey.__table__.delete().where(IdempotencyKey.key == "key-1")
+        )
+        await test_session.commit()
+        retry = await post_message(client, chat_id, "Hello", "key-1")
+
+        assert retry.status_code == 201
+        assert "idempotent-replayed" not in retry.headers
+        detail = (await client.get(f"{CHAT_URL}/{chat_id}")).json()
+        assert len(detail["messages"]) == 2
+
+    async def test_expired_keys_purged(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = (await create_chat(client, "Test Chat")).json()["id"]
+        await post_message(client, chat_id, "Hello", "key-1")
+        await post_message(client, chat_id, "Hello", "key-2")
+        await test_session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == "key-1")
+            .values(
+                created_at=IdempotencyKey.created_at
+                - timedelta(seconds=idempotency_cache.ttl + 1)
+            )
+        )
+        await test_session.commit()
+
+        assert await IdempotencyService.purge_expired(test_session) == 1
+        assert list(await test_session.scalars(select(IdempotencyKey.key))) == ["key-2"]
+
+    async def test_purger_survives_failed_purge(self, monkeypatch):
+        purges = []
+
+        async def purge_expired(session):
+            purges.append(session)
+            if len(purges) == 1:
+                raise OSError("Connection refused")
+            return 0
+
+        monkeypatch.setattr(IdempotencyService, "purge_expired", purge_expired)
+        monkeypatch.setattr(ShardSessions, "get", lambda self, shard: shard)
+        purger = asyncio.create_task(
+            IdempotencyService.purge_expired_every(shard_map, 0.001)
+        )
+        while len(purges) < 2 and not purger.done():
+            await asyncio.sleep(0.001)
+        purger.cancel()
+
+        # every shard is purged each time
+        assert len(purges) >= 2
+        assert set(purges) == set(shard_map.shards)
+
+
+class TestIdempotencyCache:
+    """Tests for IdempotencyCache eviction"""
+
+    def test_lru_eviction(self):
+        cache = IdempotencyCache(max_size=2, ttl=60)
+        cache.put("a", 1, None, None)
+        cache.put("b", 1, None, None)
+        cache.get("a")
+        cache.put("c", 1, None, None)
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert len(cache) == 2
+
+    def test_ttl_eviction(self):
+        cache = IdempotencyCache(max_size=2, ttl=60)
+        cache.put("a", 1, None, None, ttl=0)
+
+        assert cache.get("a") is None
+        assert len(cache) == 0
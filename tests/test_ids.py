@@ -0,0 +1,124 @@
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+
+from core import settings
+from core.ids import (
+    MAX_WORKER_ID,
+    SEQUENCE_BITS,
+    WORKER_ID_BITS,
+    SnowflakeGenerator,
+    WorkerIdUnavailable,
+    assign_worker_id,
+    id_created_at,
+    id_generator,
+)
+from core.worker_lease import WorkerIdLease, lease_worker_id
+from .utils import create_chat, create_message
+
+
+class TestSnowflakeGenerator:
+    """Tests for SnowflakeGenerator"""
+
+    def test_ids_unique_and_increasing(self):
+        generator = SnowflakeGenerator(worker_id=1)
+
+        ids = [generator.next_id() for _ in range(10_000)]
+
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+
+    def test_worker_id_encoded(self):
+        generator = SnowflakeGenerator(worker_id=MAX_WORKER_ID)
+
+        id_ = generator.next_id()
+
+        assert (id_ >> SEQUENCE_BITS) & ((1 << WORKER_ID_BITS) - 1) == MAX_WORKER_ID
+
+    def test_workers_dont_collide(self):
+        first = SnowflakeGenerator(worker_id=1)
+        second = SnowflakeGenerator(worker_id=2)
+
+        first_ids = {first.next_id() for _ in range(1000)}
+        second_ids = {second.next_id() for _ in range(1000)}
+
+        assert not first_ids & second_ids
+
+    def test_created_at_encoded(self):
+        id_ = SnowflakeGenerator(worker_id=0).next_id()
+
+        assert abs(id_created_at(id_) - datetime.now(UTC)) < timedelta(seconds=1)
+
+    @pytest.mark.parametrize("worker_id", [-1, MAX_WORKER_ID + 1])
+    def test_invalid_worker_id(self, worker_id: int):
+        with pytest.raises(ValueError):
+            SnowflakeGenerator(worker_id=worker_id)
+
+    def test_unassigned_worker_id(self):
+        generator = SnowflakeGenerator(worker_id=None)
+
+        with pytest.raises(WorkerIdUnavailable):
+            generator.next_id()
+
+        generator.assign(3)
+        assert (generator.next_id() >> SEQUENCE_BITS) & MAX_WORKER_ID == 3
+
+    def test_lease_not_confirmed(self):
+        generator = SnowflakeGenerator(worker_id=None)
+
+        generator.assign(3, valid_until=time.monotonic() + 60)
+        generator.next_id()
+        generator.assign(3, valid_until=time.monotonic())
+
+        with pytest.raises(WorkerIdUnavailable):
+            generator.next_id()
+
+
+class TestWorkerIdLease:
+    """Tests for worker id of the process"""
+
+    @pytest.fixture
+    def unassigned(self, monkeypatch):
+        worker_id = id_generator.worker_id
+        monkeypatch.setattr(settings.ids, "derive_worker_id", False)
+        assign_worker_id(None)
+        yield
+        assign_worker_id(worker_id)
+
+    async def test_startup_fails_without_worker_id(self, unassigned):
+        with pytest.raises(WorkerIdUnavailable):
+            await lease_worker_id("sqlite+aiosqlite:///:memory:")
+
+    async def test_configured_worker_id_kept(self, unassigned):
+        assign_worker_id(5)
+
+        assert await lease_worker_id("sqlite+aiosqlite:///:memory:") is None
+        assert id_generator.worker_id == 5
+
+    async def test_confirm_fences_ids(self, unassigned):
+        lease = WorkerIdLease("sqlite+aiosqlite:///:memory:", ttl=60)
+        lease.worker_id = 7
+        lease._connection = await lease._engine.connect()
+
+        assert await lease.confirm(timeout=1)
+        assert (id_generator.next_id() >> SEQUENCE_BITS) & MAX_WORKER_ID == 7
+
+        # lock connection is gone, the check fails
+        await lease._connection.close()
+        assert not await lease.confirm(timeout=1)
+        await lease.release()
+        with pytest.raises(WorkerIdUnavailable):
+            id_generator.next_id()
+
+
+class TestModelIds:
+    """Tests for ids generated for created chats and messages"""
+
+    async def test_ids_are_64_bit(self, client: AsyncClient):
+        chat = (await create_chat(client, "Test Chat")).json()
+        message = (await create_message(client, chat["id"], "Hello")).json()
+
+        # strings, past 2**53 JavaScript numbers would round them
+        assert 2**53 < int(chat["id"]) < int(message["id"]) < 2**63
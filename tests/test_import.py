@@ -0,0 +1,174 @@
+import json
+
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import settings
+from core.models import Chat
+from .utils import CHAT_URL
+
+IMPORT_URL = f"{CHAT_URL}/import"
+
+LEGACY_CHAT = {"type": "chat", "id": 7, "title": "Legacy Chat"}
+
+
+def to_ndjson(*records: dict | str) -> str:
+    return "\n".join(
+        record if isinstance(record, str) else json.dumps(record) for record in records
+    )
+
+
+async def get_imported_chat_id(session: AsyncSession, legacy_id: int) -> int | None:
+    return await session.scalar(select(Chat.id).where(Chat.legacy_id == legacy_id))
+
+
+class TestImportChats:
+    """Tests for POST {CHAT_URL}/import"""
+
+    async def test_import_success(
+        self, client: AsyncClient, import_headers: dict, test_session: AsyncSession
+    ):
+        body = to_ndjson(
+            LEGACY_CHAT,
+            {"type": "message", "chat_id": 7, "text": "First"},
+            {
+                "type": "message",
+                "chat_id": 7,
+                "text": "Second",
+                "created_at": "2030-01-01T00:00:00Z",
+            },
+        )
+
+        response = await client.post(IMPORT_URL, headers=import_headers, content=body)
+
+        assert response.status_code == 200
+        report = response.json()
+        assert report["chats"] == 1
+        assert report["messages"] == 2
+        assert report["error_count"] == 0
+        assert report["next_line"] == 3
+
+        chat_id = await get_imported_chat_id(test_session, 7)
+        detail = (await client.get(f"{CHAT_URL}/{chat_id}")).json()
+        assert detail["chat"]["title"] == "Legacy Chat"
+        assert [msg["text"] for msg in detail["messages"]] == ["Second", "First"]
+
+    async def test_import_invalid_lines(
+        self, client: AsyncClient, import_headers: dict
+    ):
+        body = to_ndjson(
+            LEGACY_CHAT,
+            "not json",
+            {"type": "reaction", "chat_id": 7},
+            {"type": [], "chat_id": 7},
+            {"type": "message", "chat_id": 7, "text": "A" * 5001},
+            {"type": "message", "chat_id": 7, "text": "   "},
+            {"type": "message", "chat_id": 8, "text": "Unknown chat"},
+            {"type": "message", "chat_id": 7, "text": "Valid"},
+        )
+
+        response = await client.post(IMPORT_URL, headers=import_headers, content=body)
+
+        report = response.json()
+        assert report["chats"] == 1
+        assert report["messages"] == 1
+        assert report["error_count"] == 6
+        assert [error["line"] for error in report["errors"]] == [2, 3, 4, 5, 6, 7]
+
+    async def test_import_resume(
+        self, client: AsyncClient, import_headers: dict, test_session: AsyncSession
+    ):
+        body = to_ndjson(
+            LEGACY_CHAT,
+            {"type": "message", "chat_id": 7, "text": "First"},
+            {"type": "message", "chat_id": 7, "text": "Second"},
+        )
+        await client.post(
+            IMPORT_URL,
+            headers=import_headers,
+            content=to_ndjson(*body.splitlines()[:2]),
+        )
+
+        response = await client.post(
+            f"{IMPORT_URL}?start_line=2", headers=import_headers, content=body
+        )
+
+        report = response.json()
+        assert report["chats"] == 0
+        assert report["messages"] == 1
+        assert report["next_line"] == 3
+
+        chat_id = await get_imported_chat_id(test_session, 7)
+        detail = (await client.get(f"{CHAT_URL}/{chat_id}")).json()
+        assert {msg["text"] for msg in detail["messages"]} == {"First", "Second"}
+
+    async def test_import_again_skips_messages_with_id(
+        self, client: AsyncClient, import_headers: dict, test_session: AsyncSession
+    ):
+        body = to_ndjson(
+            LEGACY_CHAT,
+            {"type": "message", "id": 1, "chat_id": 7, "text": "First"},
+            {"type": "message", "id": 2, "chat_id": 7, "text": "Second"},
+        )
+        await client.post(
+            IMPORT_URL,
+            headers=import_headers,
+            content=to_ndjson(*body.splitlines()[:2]),
+        )
+
+        # checkpoint lost, the first chunk is imported again
+        response = await client.post(IMPORT_URL, headers=import_headers, content=body)
+
+        report = response.json()
+        assert report["messages"] == 1
+        assert report["skipped_messages"] == 1
+        chat_id = await get_imported_chat_id(test_session, 7)
+        detail = (await client.get(f"{CHAT_URL}/{chat_id}")).json()
+        assert [msg["seq"] for msg in detail["messages"]] == [2, 1]
+        assert [msg["text"] for msg in detail["messages"]] == ["Second", "First"]
+
+    async def test_import_existing_chat_skipped(
+        self, client: AsyncClient, import_headers: dict
+    ):
+        await client.post(
+            IMPORT_URL, headers=import_headers, content=to_ndjson(LEGACY_CHAT)
+        )
+
+        response = await client.post(
+            IMPORT_URL, headers=import_headers, content=to_ndjson(LEGACY_CHAT)
+        )
+
+        report = response.json()
+        assert report["chats"] == 0
+        assert report["skipped_chats"] == 1
+
+    async def test_import_requires_admin_token(self, client: AsyncClient, monkeypatch):
+        body = to_ndjson(LEGACY_CHAT)
+
+        unset = await client.post(IMPORT_URL, content=body)
+        monkeypatch.setattr(settings.imports, "admin_token", "secret")
+        wrong = await client.post(
+            IMPORT_URL, headers={"X-Admin-Token": "wrong"}, content=body
+        )
+
+        assert unset.status_code == wrong.status_code == 403
+
+    async def test_import_out_of_range_ids(
+        self, client: AsyncClient, import_headers: dict
+    ):
+        body = to_ndjson(
+            {"type": "chat", "id": 2**63, "title": "Too big"},
+            LEGACY_CHAT,
+            {"type": "message", "chat_id": -1, "text": "Negative chat"},
+            {"type": "message", "id": 2**64, "chat_id": 7, "text": "Too big"},
+            {"type": "message", "chat_id": 7, "text": "Valid"},
+        )
+
+        response = await client.post(IMPORT_URL, headers=import_headers, content=body)
+
+        report = response.json()
+        assert report["aborted"] is None
+        assert report["chats"] == 1
+        assert report["messages"] == 1
+        assert [error["line"] for error in report["errors"]] == [1, 3, 4]
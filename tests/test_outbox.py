@@ -0,0 +1,230 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.outbox import Event, EventType, OutboxDispatcher, outbox_dispatcher
+from core import shard_map
+from core.models import OutboxEvent
+from .conftest import ignore_event
+from .utils import CHAT_URL, create_chat, create_message
+
+
+async def get_events(session: AsyncSession) -> list[OutboxEvent]:
+    session.expunge_all()
+    return list(await session.scalars(select(OutboxEvent).order_by(OutboxEvent.id)))
+
+
+class Recorder:
+    """Handler recording texts of messages, failing on chosen ones"""
+
+    def __init__(self, fail: set[str] = frozenset(), times: int = 1):
+        self.handled: list[tuple[int, str]] = []
+        self.fail = fail
+        self.times = times
+        self.failures = 0
+
+    async def __call__(self, event: Event) -> None:
+        text = event.payload["text"]
+        if text in self.fail and self.failures < self.times:
+            self.failures += 1
+            raise RuntimeError(f"Failed on {text}")
+        self.handled.append((event.chat_id, text))
+
+
+def make_dispatcher(recorder: Recorder, **kwargs) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(retry_delay=0, **kwargs)
+    dispatcher.register(EventType.message_created)(recorder)
+    return dispatcher
+
+
+async def create_chat_with_messages(client: AsyncClient, *texts: str) -> int:
+    chat_id = int((await create_chat(client, "Outbox")).json()["id"])
+    for text in texts:
+        await create_message(client, chat_id, text)
+    return chat_id
+
+
+@pytest.mark.usefixtures("outbox_handled")
+class TestOutbox:
+    """Tests for outbox events and their dispatch"""
+
+    async def test_events_committed_with_changes(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, "Hello")
+        await client.post(
+            f"{CHAT_URL}/{chat_id}/messages",
+            json={"text": "Once"},
+            headers={"Idempotency-Key": "outbox-key"},
+        )
+        await client.delete(f"{CHAT_URL}/{chat_id}")
+
+        events = await get_events(test_session)
+
+        assert [event.type for event in events] == [
+            "chat.created",
+            "message.created",
+            "message.created",
+            "chat.deleted",
+        ]
+        assert {event.chat_id for event in events} == {chat_id}
+        assert json.loads(events[0].payload)["title"] == "Outbox"
+        assert json.loads(events[2].payload)["seq"] == 2
+
+    async def test_unhandled_events_not_written(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        outbox_dispatcher.unregister(EventType.message_created, ignore_event)
+        try:
+            await create_chat_with_messages(client, "Hello")
+        finally:
+            outbox_dispatcher.register(EventType.message_created)(ignore_event)
+
+        events = await get_events(test_session)
+
+        assert [event.type for event in events] == ["chat.created"]
+
+    async def test_handlers_run_outside_claim(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        await create_chat_with_messages(client, "a1")
+        in_transaction = []
+        dispatcher = OutboxDispatcher()
+
+        @dispatcher.register(EventType.message_created)
+        async def check(event: Event) -> None:
+            in_transaction.append(test_session.in_transaction())
+
+        assert await dispatcher.dispatch_batch(test_session) == 2
+        assert in_transaction == [False]
+        assert await get_events(test_session) == []
+
+    async def test_rejected_change_has_no_event(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        response = await create_message(client, 1, "Nowhere")
+
+        assert response.status_code == 404
+        assert await get_events(test_session) == []
+
+    async def test_dispatch_in_order_per_chat(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        first = await create_chat_with_messages(client, "a1", "a2", "a3")
+        second = await create_chat_with_messages(client, "b1")
+        recorder = Recorder()
+        dispatcher = make_dispatcher(recorder)
+
+        assert await dispatcher.dispatch_batch(test_session) == 6
+
+        assert [text for chat_id, text in recorder.handled if chat_id == first] == [
+            "a1",
+            "a2",
+            "a3",
+        ]
+        assert (second, "b1") in recorder.handled
+        assert await get_events(test_session) == []
+        stats = dispatcher.stats()
+        assert stats["dispatched"] == {"chat.created": 2, "message.created": 4}
+        assert stats["max_lag"] >= stats["last_lag"] > 0
+
+    async def test_failure_holds_back_chat(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        first = await create_chat_with_messages(client, "a1", "a2")
+        second = await create_chat_with_messages(client, "b1")
+        recorder = Recorder(fail={"a1"})
+        dispatcher = make_dispatcher(recorder)
+
+        await dispatcher.dispatch_batch(test_session)
+
+        assert recorder.handled == [(second, "b1")]
+        failed, held = await get_events(test_session)
+        assert (failed.attempts, held.attempts) == (1, 0)
+        assert "Failed on a1" in failed.last_error
+        assert dispatcher.stats()["retried"] == 1
+
+        await dispatcher.dispatch_batch(test_session)
+
+        assert recorder.handled[1:] == [(first, "a1"), (first, "a2")]
+        assert await get_events(test_session) == []
+
+    async def test_retry_backoff(self, client: AsyncClient, test_session: AsyncSession):
+        await create_chat_with_messages(client, "a1")
+        recorder = Recorder(fail={"a1"})
+        dispatcher = OutboxDispatcher(retry_delay=60)
+        dispatcher.register(EventType.message_created)(recorder)
+
+        await dispatcher.dispatch_batch(test_session)
+        (event,) = await get_events(test_session)
+
+        assert (event.available_at - event.created_at).total_seconds() >= 60
+        assert await dispatcher.dispatch_batch(test_session) == 0
+        assert recorder.handled == []
+
+    async def test_dead_after_max_attempts(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        first = await create_chat_with_messages(client, "a1", "a2")
+        recorder = Recorder(fail={"a1"}, times=2)
+        dispatcher = make_dispatcher(recorder, max_attempts=2)
+
+        for _ in range(3):
+            await dispatcher.dispatch_batch(test_session)
+        (dead,) = await get_events(test_session)
+
+        assert dead.dead_at is not None
+        assert dead.attempts == 2
+        assert recorder.handled == [(first, "a2")]
+        assert dispatcher.stats()["given_up"] == 1
+        assert await dispatcher.dispatch_batch(test_session) == 0
+
+    async def test_handler_timeout(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        await create_chat_with_messages(client, "slow")
+        dispatcher = OutboxDispatcher(handler_timeout=0.01)
+
+        @dispatcher.register(EventType.message_created)
+        async def slow(event: Event) -> None:
+            await asyncio.sleep(1)
+
+        await dispatcher.dispatch_batch(test_session)
+
+        (event,) = await get_events(test_session)
+        assert "TimeoutError" in event.last_error
+
+    async def test_dispatcher_survives_errors(self, monkeypatch):
+        dispatcher = OutboxDispatcher()
+        calls = []
+
+        async def dispatch(shards):
+            calls.append(shards)
+            if len(calls) == 1:
+                raise OSError("Connection refused")
+            return 0
+
+        monkeypatch.setattr(dispatcher, "dispatch", dispatch)
+        runner = asyncio.create_task(dispatcher.run(shard_map, 0.001))
+        while len(calls) < 2 and not runner.done():
+            await asyncio.sleep(0.001)
+        runner.cancel()
+
+        assert len(calls) == 2
+
+    @pytest.mark.parametrize("messages", [0, 2])
+    async def test_metrics(self, client: AsyncClient, messages: int):
+        await create_chat_with_messages(client, *(f"m{i}" for i in range(messages)))
+
+        response = await client.get("/api/metrics/outbox")
+
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["pending"] == messages + 1
+        assert stats["dead"] == 0
+        assert stats["oldest_pending_age"] >= 0
+        assert stats["dispatched"] == {}
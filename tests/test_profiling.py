@@ -0,0 +1,110 @@
+import asyncio
+import pstats
+from typing import AsyncGenerator
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.app import create_app
+from app.middlewares import profiler
+from core import settings
+
+PROFILE_URL = "/api/admin/profile"
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+async def profiling_client(monkeypatch) -> AsyncGenerator[AsyncClient, None]:
+    """Test client of app with profiling enabled"""
+
+    monkeypatch.setattr(settings.profiling, "enabled", True)
+    monkeypatch.setattr(settings.profiling, "admin_token", "secret")
+    monkeypatch.setattr(settings.profiling, "sample_interval", 0.001)
+    transport = ASGITransport(app=create_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+    if profiler.active:
+        profiler.session.stop()
+    profiler.session = None
+
+
+async def profile(client: AsyncClient, requests: int, **options) -> dict:
+    response = await client.post(
+        PROFILE_URL, json={"requests": requests, **options}, headers=ADMIN_HEADERS
+    )
+    assert response.status_code == 202
+    for _ in range(requests):
+        await asyncio.sleep(0.01)
+        await client.get("/api/health/live")
+    response = await client.get(PROFILE_URL, headers=ADMIN_HEADERS)
+    return response.json()
+
+
+class TestProfiling:
+    """Tests for on-demand profiling of the worker"""
+
+    async def test_disabled_by_default(self, client: AsyncClient):
+        response = await client.post(PROFILE_URL, json={}, headers=ADMIN_HEADERS)
+
+        assert response.status_code == 404
+
+    async def test_admin_token_required(self, profiling_client: AsyncClient):
+        response = await profiling_client.post(
+            PROFILE_URL, json={}, headers={"X-Admin-Token": "guess"}
+        )
+
+        assert response.status_code == 403
+        assert not profiler.active
+
+    async def test_sample_flamegraph(self, profiling_client: AsyncClient):
+        report = await profile(profiling_client, 3)
+
+        assert report["done"]
+        assert report["profiled_requests"] == 3
+        assert report["samples"] > 0
+        response = await profiling_client.get(
+            f"{PROFILE_URL}/flamegraph", headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        stack, count = response.text.splitlines()[0].rsplit(" ", 1)
+        assert ";" in stack
+        assert int(count) > 0
+
+    async def test_cprofile_with_memory(self, profiling_client: AsyncClient, tmp_path):
+        report = await profile(profiling_client, 2, mode="cprofile", memory=True)
+
+        assert report["done"]
+        assert report["allocations"]
+        response = await profiling_client.get(
+            f"{PROFILE_URL}/pstats", headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        path = tmp_path / "profile.prof"
+        path.write_bytes(response.content)
+        assert pstats.Stats(str(path)).total_calls > 0
+        response = await profiling_client.get(
+            f"{PROFILE_URL}/flamegraph",
+            params={"kind": "memory"},
+            headers=ADMIN_HEADERS,
+        )
+        assert response.status_code == 200
+        assert response.text
+
+    async def test_one_session_at_a_time(self, profiling_client: AsyncClient):
+        await profiling_client.post(
+            PROFILE_URL, json={"requests": 10}, headers=ADMIN_HEADERS
+        )
+
+        response = await profiling_client.post(
+            PROFILE_URL, json={}, headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 409
+        response = await profiling_client.get(
+            f"{PROFILE_URL}/flamegraph", headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 409
+
+        response = await profiling_client.delete(PROFILE_URL, headers=ADMIN_HEADERS)
+        assert response.json()["done"]
+        assert response.json()["loop_lag"]["probes"] >= 0
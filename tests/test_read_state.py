@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import ChatService
+from app.services.chat import read_markers
+from core import ShardSessions, shard_map
+from core.models import ReadState
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+READER_ID = 42
+
+
+async def create_chat_with_messages(client: AsyncClient, count: int) -> int:
+    chat_id = (await create_chat(client, "Read")).json()["id"]
+    for i in range(count):
+        await create_message(client, chat_id, f"Message {i}")
+    return chat_id
+
+
+async def mark_read(client: AsyncClient, chat_id: int, seq: int, reader_id=READER_ID):
+    response = await client.put(
+        f"{CHAT_URL}/{chat_id}/read", json={"reader_id": reader_id, "seq": seq}
+    )
+    assert response.status_code == 204
+
+
+async def get_read_state(client: AsyncClient, chat_id: int) -> dict:
+    response = await client.get(
+        f"{CHAT_URL}/{chat_id}/read", params={"reader_id": READER_ID}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def flush(session: AsyncSession) -> int:
+    return await ChatService.flush_read_markers(
+        ShardSessions(shard_map, lambda shard: session)
+    )
+
+
+async def count_read_states(session: AsyncSession) -> int:
+    return await session.scalar(select(func.count()).select_from(ReadState))
+
+
+class TestReadState:
+    """Tests for read positions and unread counts"""
+
+    async def test_unread_count(self, client: AsyncClient):
+        chat_id = await create_chat_with_messages(client, 5)
+
+        with assert_max_statements(0):
+            await mark_read(client, chat_id, 2)
+        with assert_max_statements(1):
+            read_state = await get_read_state(client, chat_id)
+
+        assert read_state == {
+            "chat_id": chat_id,
+            "reader_id": str(READER_ID),
+            "last_read_seq": 2,
+            "last_seq": 5,
+            "unread": 3,
+        }
+        await create_message(client, chat_id, "New")
+        assert (await get_read_state(client, chat_id))["unread"] == 4
+
+    async def test_unread_without_position(self, client: AsyncClient):
+        chat_id = await create_chat_with_messages(client, 2)
+
+        read_state = await get_read_state(client, chat_id)
+
+        assert read_state["last_read_seq"] == 0
+        assert read_state["unread"] == 2
+
+    async def test_marks_coalesced_max_wins(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, 5)
+        for seq in (1, 4, 3):
+            await mark_read(client, chat_id, seq)
+        await mark_read(client, chat_id, 1, reader_id=READER_ID + 1)
+
+        assert await flush(test_session) == 2
+        assert await count_read_states(test_session) == 2
+        assert len(read_markers) == 0
+
+        await mark_read(client, chat_id, 2)
+        await flush(test_session)
+        assert (await get_read_state(client, chat_id))["last_read_seq"] == 4
+
+    async def test_flush_drops_deleted_chats(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, 1)
+        await mark_read(client, chat_id, 1)
+        await client.delete(f"{CHAT_URL}/{chat_id}")
+
+        await flush(test_session)
+
+        assert await count_read_states(test_session) == 0
+        assert len(read_markers) == 0
+
+    async def test_batch_read_states(self, client: AsyncClient):
+        first = await create_chat_with_messages(client, 3)
+        second = await create_chat_with_messages(client, 1)
+        await mark_read(client, first, 1)
+
+        response = await client.post(
+            f"{CHAT_URL}:batchReadStates",
+            json={"reader_id": READER_ID, "chat_ids": [second, 1, first]},
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [state["unread"] for state in data["read_states"]] == [1, 2]
+        assert data["not_found"] == ["1"]
+
+    @pytest.mark.parametrize(
+        "mark", [{"reader_id": 2**70, "seq": 1}, {"reader_id": 1, "seq": 2**63}]
+    )
+    async def test_out_of_range_mark_rejected(self, client: AsyncClient, mark: dict):
+        chat_id = await create_chat_with_messages(client, 1)
+
+        response = await client.put(f"{CHAT_URL}/{chat_id}/read", json=mark)
+
+        assert response.status_code == 422
+        assert len(read_markers) == 0
+
+    async def test_mark_past_last_message_clamped(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = await create_chat_with_messages(client, 2)
+        await mark_read(client, chat_id, 1000)
+
+        assert (await get_read_state(client, chat_id))["last_read_seq"] == 2
+        await flush(test_session)
+        await create_message(client, chat_id, "New")
+
+        read_state = await get_read_state(client, chat_id)
+        assert read_state["last_read_seq"] == 2
+        assert read_state["unread"] == 1
+
+    async def test_cancelled_flush_keeps_positions(
+        self, client: AsyncClient, test_session: AsyncSession, monkeypatch
+    ):
+        chat_id = await create_chat_with_messages(client, 2)
+        await mark_read(client, chat_id, 2)
+
+        async def cancelled():
+            raise asyncio.CancelledError
+
+        monkeypatch.setattr(test_session, "commit", cancelled)
+        with pytest.raises(asyncio.CancelledError):
+            await flush(test_session)
+
+        assert read_markers.get(int(chat_id), READER_ID) == 2
+
+    async def test_flusher_survives_failed_flush(self, monkeypatch):
+        flushes = []
+
+        async def flush_read_markers(shards):
+            flushes.append(shards)
+            if len(flushes) == 1:
+                raise OverflowError("int too big to convert")
+            return 0
+
+        monkeypatch.setattr(ChatService, "flush_read_markers", flush_read_markers)
+        flusher = asyncio.create_task(
+            ChatService.flush_read_markers_every(shard_map, 0.001)
+        )
+        while len(flushes) < 2 and not flusher.done():
+            await asyncio.sleep(0.001)
+        flusher.cancel()
+
+        assert len(flushes) == 2
+
+    async def test_unknown_chat(self, client: AsyncClient):
+        response = await client.get(
+            f"{CHAT_URL}/1/read", params={"reader_id": READER_ID}
+        )
+
+        assert response.status_code == 404
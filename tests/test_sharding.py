@@ -0,0 +1,311 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, func, select
+
+from app.services import RebalanceService
+from core import ShardMap, ShardSessions
+from core.models import Chat, Message
+from core.sharding import BUCKETS, bucket_of
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+
+async def count_rows(shard_map: ShardMap, shard: str, model) -> int:
+    async with shard_map.shards[shard].session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+
+async def create_chats(client: AsyncClient, count: int) -> list[int]:
+    chat_ids = []
+    for i in range(count):
+        chat_id = (await create_chat(client, f"Chat {i}")).json()["id"]
+        await create_message(client, chat_id, f"Message in chat {i}")
+        chat_ids.append(int(chat_id))
+    return chat_ids
+
+
+class TestShardMap:
+    """Tests for routing chats to shards"""
+
+    def test_chat_ids_encode_round_robin_buckets(self, test_shard_map: ShardMap):
+        chat_ids = [test_shard_map.new_chat_id() for _ in range(BUCKETS + 1)]
+
+        assert [bucket_of(chat_id) for chat_id in chat_ids] == [
+            *range(BUCKETS),
+            0,
+        ]
+        assert len(set(chat_ids)) == len(chat_ids)
+
+    def test_group_by_shard(self, test_shard_map: ShardMap):
+        chat_ids = [test_shard_map.new_chat_id(bucket) for bucket in (0, 1, 2)]
+
+        assert test_shard_map.group(chat_ids) == {
+            "shard_a": [chat_ids[0], chat_ids[2]],
+            "shard_b": [chat_ids[1]],
+        }
+
+    def test_move_bucket_saved_and_reloaded(self, test_shard_map: ShardMap):
+        chat_id = test_shard_map.new_chat_id(bucket=0)
+        test_shard_map.move_bucket(0, "shard_b")
+        test_shard_map.save()
+
+        reloaded = ShardMap(
+            test_shard_map.shards,
+            ["shard_a"] * BUCKETS,
+            test_shard_map.map_file,
+        )
+        assert reloaded.reload()
+        assert reloaded.shard_of(chat_id) == "shard_b"
+        assert not reloaded.reload()
+
+    def test_unknown_shard_rejected(self, test_shard_map: ShardMap):
+        with pytest.raises(ValueError):
+            test_shard_map.move_bucket(0, "shard_c")
+
+
+class TestShardedChats:
+    """Tests for chats API over several shards"""
+
+    async def test_chats_spread_over_shards(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 4)
+
+        for shard in test_shard_map.shards:
+            assert await count_rows(test_shard_map, shard, Chat) == 2
+            assert await count_rows(test_shard_map, shard, Message) == 2
+
+        for chat_id in chat_ids:
+            response = await sharded_client.get(f"{CHAT_URL}/{chat_id}")
+            assert response.status_code == 200
+            assert len(response.json()["messages"]) == 1
+
+    async def test_batch_get_gathers_shards(self, sharded_client: AsyncClient):
+        chat_ids = await create_chats(sharded_client, 4)
+
+        with assert_max_statements(4):
+            response = await sharded_client.post(
+                f"{CHAT_URL}:batchGet", json={"chat_ids": [*chat_ids[::-1], 99999]}
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [int(item["chat"]["id"]) for item in data["chats"]] == chat_ids[::-1]
+        assert all(len(item["messages"]) == 1 for item in data["chats"])
+        assert data["not_found"] == ["99999"]
+
+    async def test_delete_on_chat_shard(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 2)
+
+        response = await sharded_client.delete(f"{CHAT_URL}/{chat_ids[1]}")
+
+        assert response.status_code == 204
+        assert await count_rows(test_shard_map, "shard_a", Chat) == 1
+        assert await count_rows(test_shard_map, "shard_b", Chat) == 0
+
+    async def test_import_routes_by_legacy_id(
+        self,
+        sharded_client: AsyncClient,
+        test_shard_map: ShardMap,
+        import_headers: dict,
+    ):
+        lines = [
+            '{"type": "chat", "id": 2, "title": "Even"}',
+            '{"type": "chat", "id": 3, "title": "Odd"}',
+            '{"type": "message", "chat_id": 2, "text": "Hello"}',
+            '{"type": "message", "chat_id": 3, "text": "Hello"}',
+        ]
+
+        response = await sharded_client.post(
+            f"{CHAT_URL}/import", headers=import_headers, content="\n".join(lines)
+        )
+
+        assert response.status_code == 200
+        assert response.json()["messages"] == 2
+        for shard, legacy_id in (("shard_a", 2), ("shard_b", 3)):
+            async with test_shard_map.shards[shard].session_factory() as session:
+                chat = await session.scalar(
+                    select(Chat).where(Chat.legacy_id == legacy_id)
+                )
+            assert bucket_of(chat.id) == legacy_id
+
+    async def test_sync_gathers_shards(self, sharded_client: AsyncClient):
+        chat_ids = await create_chats(sharded_client, 4)
+
+        with assert_max_statements(4):
+            response = await sharded_client.get(
+                "/api/sync", params={"since": ",".join(f"{id_}:0" for id_ in chat_ids)}
+            )
+
+        assert response.status_code == 200
+        *messages, cursor = response.text.splitlines()
+        assert len(messages) == 4
+        assert '"more":false' in cursor
+
+
+@pytest.mark.usefixtures("outbox_handled")
+class TestRebalance:
+    """Tests for moving buckets between shards"""
+
+    async def test_move_bucket(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 3)
+        shards = ShardSessions(test_shard_map)
+
+        copied = await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        test_shard_map.move_bucket(0, "shard_b")
+        deleted = await RebalanceService.delete_bucket(shards.get("shard_a"), bucket=0)
+        await shards.close()
+
+        assert copied == {
+            "chats": 1,
+            "messages": 1,
+            "idempotency_keys": 0,
+            "read_states": 0,
+            "outbox_events": 2,
+        }
+        assert deleted == 1
+        assert await count_rows(test_shard_map, "shard_a", Chat) == 1
+        assert await count_rows(test_shard_map, "shard_b", Chat) == 2
+
+        response = await sharded_client.get(f"{CHAT_URL}/{chat_ids[0]}/export")
+        assert response.status_code == 200
+        assert "Message in chat 0" in response.text
+
+    async def test_chat_deleted_during_move_stays_deleted(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 1)
+        shards = ShardSessions(test_shard_map)
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        await sharded_client.delete(f"{CHAT_URL}/{chat_ids[0]}")
+
+        test_shard_map.freeze(0)
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        pruned = await RebalanceService.prune_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        test_shard_map.move_bucket(0, "shard_b")
+        await shards.close()
+
+        assert pruned == {
+            "chats": 1,
+            "messages": 1,
+            "idempotency_keys": 0,
+            "read_states": 0,
+            "outbox_events": 2,
+        }
+        assert await count_rows(test_shard_map, "shard_b", Chat) == 0
+        response = await sharded_client.get(f"{CHAT_URL}/{chat_ids[0]}")
+        assert response.status_code == 404
+
+    async def test_prune_deletes_rows_gone_from_source(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 1)
+        shards = ShardSessions(test_shard_map)
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        source = shards.get("shard_a")
+        await source.execute(delete(Message).where(Message.chat_id == chat_ids[0]))
+        await source.commit()
+
+        pruned = await RebalanceService.prune_bucket(
+            source, shards.get("shard_b"), bucket=0
+        )
+        await shards.close()
+
+        assert pruned["chats"] == 0
+        assert pruned["messages"] == 1
+        assert await count_rows(test_shard_map, "shard_b", Chat) == 1
+        assert await count_rows(test_shard_map, "shard_b", Message) == 0
+
+    async def test_copy_again_copies_only_new_rows(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 1)
+        shards = ShardSessions(test_shard_map)
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        await create_message(sharded_client, chat_ids[0], "Written during the move")
+
+        copied = await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        await shards.close()
+
+        assert copied == {
+            "chats": 0,
+            "messages": 1,
+            "idempotency_keys": 0,
+            "read_states": 0,
+            "outbox_events": 1,
+        }
+
+    async def test_import_into_frozen_bucket_reported(
+        self,
+        sharded_client: AsyncClient,
+        test_shard_map: ShardMap,
+        import_headers: dict,
+    ):
+        test_shard_map.freeze(2)
+        lines = [
+            '{"type": "chat", "id": 2, "title": "Moving"}',
+            '{"type": "chat", "id": 3, "title": "Staying"}',
+        ]
+
+        response = await sharded_client.post(
+            f"{CHAT_URL}/import", headers=import_headers, content="\n".join(lines)
+        )
+
+        report = response.json()
+        assert report["aborted"] is None
+        assert report["chats"] == 1
+        assert [error["line"] for error in report["errors"]] == [1]
+
+    async def test_frozen_bucket_read_only(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 2)
+        test_shard_map.freeze(0)
+
+        response = await create_message(sharded_client, chat_ids[0], "Hello")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        response = await create_message(sharded_client, chat_ids[1], "Hello")
+        assert response.status_code == 201
+        response = await sharded_client.get(f"{CHAT_URL}/{chat_ids[0]}")
+        assert response.status_code == 200
+
+        chat_id = int((await create_chat(sharded_client, "New")).json()["id"])
+        assert bucket_of(chat_id) != 0
+
+    async def test_copy_again_updates_last_seq(
+        self, sharded_client: AsyncClient, test_shard_map: ShardMap
+    ):
+        chat_ids = await create_chats(sharded_client, 1)
+        shards = ShardSessions(test_shard_map)
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        await create_message(sharded_client, chat_ids[0], "Written during the move")
+        await RebalanceService.copy_bucket(
+            shards.get("shard_a"), shards.get("shard_b"), bucket=0
+        )
+        await shards.close()
+        test_shard_map.move_bucket(0, "shard_b")
+
+        response = await create_message(sharded_client, chat_ids[0], "After the move")
+
+        assert response.status_code == 201
+        assert response.json()["seq"] == 3
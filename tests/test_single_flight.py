@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import ChatService
+from app.services.chat import chat_detail_flights
+from app.services.single_flight import SingleFlight
+from core import ShardSessions, shard_map
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+
+class Counter:
+    def __init__(self, result=None):
+        self.calls = 0
+        self.result = result
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.result
+
+
+class TestSingleFlight:
+    """Tests for SingleFlight coalescing"""
+
+    async def test_concurrent_calls_shared(self):
+        flights = SingleFlight()
+        fn = Counter("result")
+
+        results = await asyncio.gather(*(flights.do("key", fn) for _ in range(10)))
+
+        assert results == ["result"] * 10
+        assert fn.calls == 1
+        assert flights.shared == 9
+
+    async def test_different_keys_not_shared(self):
+        flights = SingleFlight()
+        fn = Counter()
+
+        await asyncio.gather(flights.do("a", fn), flights.do("b", fn))
+
+        assert fn.calls == 2
+
+    async def test_sequential_calls_without_window(self):
+        flights = SingleFlight()
+        fn = Counter()
+
+        await flights.do("key", fn)
+        await flights.do("key", fn)
+
+        assert fn.calls == 2
+
+    async def test_window_reuses_result(self):
+        flights = SingleFlight(window=60)
+        fn = Counter()
+
+        await flights.do("key", fn)
+        await flights.do("key", fn)
+
+        assert fn.calls == 1
+
+    async def test_forget(self):
+        flights = SingleFlight(window=60)
+        fn = Counter()
+
+        await flights.do(("chat", 1), fn)
+        flights.forget(lambda key: key[0] == "chat")
+        await flights.do(("chat", 1), fn)
+
+        assert fn.calls == 2
+
+    async def test_error_shared(self):
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db is down")
+
+        results = await asyncio.gather(
+            flights.do("key", fail), flights.do("key", fail), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await flights.do("key", fail)
+
+
+class TestChatDetailCoalescing:
+    """Tests for ChatService.get_chat_detail coalescing"""
+
+    async def test_concurrent_reads_share_fetch(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = int((await create_chat(client, "Hot Chat")).json()["id"])
+        await create_message(client, chat_id, "Hello")
+
+        with assert_max_statements(3):
+            details = await asyncio.gather(
+                *(
+                    ChatService.get_chat_detail(
+                        ShardSessions(shard_map, lambda shard: test_session),
+                        chat_id,
+                        20,
+                    )
+                    for _ in range(20)
+                )
+            )
+
+        assert len(set(details)) == 1
+
+    async def test_create_message_invalidates(
+        self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        monkeypatch.setattr(chat_detail_flights, "window", 60)
+        chat_id = int((await create_chat(client, "Hot Chat")).json()["id"])
+        await client.get(f"{CHAT_URL}/{chat_id}")
+
+        await create_message(client, chat_id, "Hello")
+        response = await client.get(f"{CHAT_URL}/{chat_id}")
+
+        assert [msg["text"] for msg in response.json()["messages"]] == ["Hello"]
+
+    async def test_first_caller_cancelled(
+        self, client: AsyncClient, test_session: AsyncSession
+    ):
+        chat_id = int((await create_chat(client, "Hot Chat")).json()["id"])
+        await create_message(client, chat_id, "Hello")
+        first_shards = ShardSessions(shard_map, lambda shard: test_session)
+        first = asyncio.create_task(
+            ChatService.get_chat_detail(first_shards, chat_id, 20)
+        )
+        second = asyncio.create_task(
+            ChatService.get_chat_detail(
+                ShardSessions(shard_map, lambda shard: test_session), chat_id, 20
+            )
+        )
+        await asyncio.sleep(0)
+
+        # the first request is gone, its dependency closes its sessions
+        first.cancel()
+        await first_shards.close()
+
+        assert await second is not None
+        with pytest.raises(asyncio.CancelledError):
+            await first
@@ -0,0 +1,45 @@
+from httpx import ASGITransport, AsyncClient
+
+from app.app import create_app
+from core import DBHelper, ShardMap, settings, track_db_stats
+
+READY_URL = "/api/health/ready"
+
+
+class TestStartup:
+    """Tests for app factory, lazy engines and lifespan warm-up"""
+
+    def test_engine_created_on_first_use(self):
+        helper = DBHelper(url="sqlite+aiosqlite:///:memory:")
+
+        assert "engine" not in vars(helper)
+        assert helper.session_factory.kw["bind"] is helper.engine
+
+    async def test_ready_after_warmup(self, test_shard_map: ShardMap):
+        app = create_app(test_shard_map)
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get(READY_URL)
+            assert response.status_code == 503
+
+            with track_db_stats() as stats:
+                async with app.router.lifespan_context(app):
+                    response = await client.get(READY_URL)
+                    assert response.status_code == 200
+                    for shard in test_shard_map.shards.values():
+                        assert (
+                            shard.engine.pool.checkedin()
+                            >= settings.warmup.min_connections
+                        )
+
+            response = await client.get(READY_URL)
+            assert response.status_code == 503
+
+        assert len(stats.engines) == len(test_shard_map.shards)
+        assert stats.statements > 0
+
+    async def test_live(self, client: AsyncClient):
+        response = await client.get("/api/health/live")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
@@ -0,0 +1,148 @@
+import json
+
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import Chat
+
+from .utils import CHAT_URL, assert_max_statements, create_chat, create_message
+
+SYNC_URL = "/api/sync"
+
+
+async def sync(client: AsyncClient, since: str, **params) -> tuple[list, dict]:
+    response = await client.get(SYNC_URL, params={"since": since, **params})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *messages, cursor = [json.loads(line) for line in response.text.splitlines()]
+    return messages, cursor
+
+
+class TestMessageSeq:
+    """Tests for per-chat message sequence numbers"""
+
+    async def test_seq_per_chat(self, client: AsyncClient):
+        first = (await create_chat(client, "First")).json()["id"]
+        second = (await create_chat(client, "Second")).json()["id"]
+
+        seqs = [
+            (await create_message(client, chat_id, "Hello")).json()["seq"]
+            for chat_id in (first, first, second, first)
+        ]
+
+        assert seqs == [1, 2, 1, 3]
+
+    async def test_import_continues_seq(
+        self, client: AsyncClient, test_session: AsyncSession, import_headers: dict
+    ):
+        lines = [
+            '{"type": "chat", "id": 7, "title": "Legacy"}',
+            '{"type": "message", "chat_id": 7, "text": "First"}',
+            '{"type": "message", "chat_id": 7, "text": "Second"}',
+        ]
+        for body in ("\n".join(lines[:2]), lines[2]):
+            response = await client.post(
+                f"{CHAT_URL}/import", headers=import_headers, content=body
+            )
+            assert response.status_code == 200
+        chat_id = await test_session.scalar(select(Chat.id).where(Chat.legacy_id == 7))
+
+        sent = (await create_message(client, chat_id, "Third")).json()
+        messages, _ = await sync(client, f"{chat_id}:0")
+
+        assert sent["seq"] == 3
+        assert [(msg["seq"], msg["text"]) for msg in messages] == [
+            (1, "First"),
+            (2, "Second"),
+            (3, "Third"),
+        ]
+
+
+class TestSync:
+    """Tests for GET /api/sync"""
+
+    async def test_sync_missing_messages(self, client: AsyncClient):
+        chat_ids = []
+        for i in range(2):
+            chat_id = (await create_chat(client, f"Chat {i}")).json()["id"]
+            for j in range(3):
+                await create_message(client, chat_id, f"Chat {i} message {j}")
+            chat_ids.append(chat_id)
+
+        with assert_max_statements(2):
+            messages, cursor = await sync(
+                client, f"{chat_ids[0]}:1,{chat_ids[1]}:3,99999:0"
+            )
+
+        assert [(msg["chat_id"], msg["seq"]) for msg in messages] == [
+            (chat_ids[0], 2),
+            (chat_ids[0], 3),
+        ]
+        assert messages[0]["text"] == "Chat 0 message 1"
+        assert cursor == {
+            "since": f"{chat_ids[0]}:3,{chat_ids[1]}:3,99999:0",
+            "more": False,
+            "not_found": ["99999"],
+        }
+
+    async def test_sync_up_to_date(self, client: AsyncClient):
+        chat_id = (await create_chat(client, "Chat")).json()["id"]
+        await create_message(client, chat_id, "Hello")
+
+        with assert_max_statements(1):
+            messages, cursor = await sync(client, f"{chat_id}:1")
+
+        assert messages == []
+        assert cursor["since"] == f"{chat_id}:1"
+        assert not cursor["more"]
+
+    async def test_sync_bounded_by_limit(self, client: AsyncClient):
+        chat_ids = []
+        for i in range(2):
+            chat_id = (await create_chat(client, f"Chat {i}")).json()["id"]
+            for j in range(5):
+                await create_message(client, chat_id, f"Message {j}")
+            chat_ids.append(chat_id)
+        since = f"{chat_ids[0]}:0,{chat_ids[1]}:0"
+
+        messages, cursor = await sync(client, since, limit=4)
+
+        assert [(msg["chat_id"], msg["seq"]) for msg in messages] == [
+            (chat_ids[0], 1),
+            (chat_ids[0], 2),
+            (chat_ids[1], 1),
+            (chat_ids[1], 2),
+        ]
+        assert cursor["more"]
+
+        received = len(messages)
+        while cursor["more"]:
+            messages, cursor = await sync(client, cursor["since"], limit=4)
+            received += len(messages)
+        assert received == 10
+        assert cursor["since"] == f"{chat_ids[0]}:5,{chat_ids[1]}:5"
+
+    async def test_sync_more_chats_behind_than_limit(self, client: AsyncClient):
+        chat_ids = []
+        for i in range(3):
+            chat_id = (await create_chat(client, f"Chat {i}")).json()["id"]
+            await create_message(client, chat_id, "Message")
+            chat_ids.append(chat_id)
+        since = ",".join(f"{chat_id}:0" for chat_id in chat_ids)
+
+        messages, cursor = await sync(client, since, limit=1)
+
+        assert [msg["chat_id"] for msg in messages] == [chat_ids[0]]
+        assert cursor["more"]
+        assert cursor["since"] == f"{chat_ids[0]}:1,{chat_ids[1]}:0,{chat_ids[2]}:0"
+
+        messages, cursor = await sync(client, cursor["since"], limit=2)
+
+        assert [msg["chat_id"] for msg in messages] == chat_ids[1:]
+        assert not cursor["more"]
+
+    async def test_sync_invalid_since(self, client: AsyncClient):
+        for since in ("", "1", "1:x", "1:2,1:3", "-1:2"):
+            response = await client.get(SYNC_URL, params={"since": since})
+            assert response.status_code == 422, since
@@ -1,8 +1,11 @@
+from contextlib import contextmanager
+from typing import Iterator
+
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.app import app
-from core import db_helper
+from core import DBStats, ShardSessions, db_helper, shard_map, track_db_stats
 from core.models import Chat, Message
 
 CHAT_URL = "/api/chats"
@@ -16,10 +19,17 @@ def override_db_session(session: AsyncSession) -> None:
         return session
 
     async def override_session_dependency():
+        # every request starts with an empty identity map, like in production
+        session.expunge_all()
         yield session
 
+    async def override_shard_sessions():
+        session.expunge_all()
+        yield ShardSessions(shard_map, lambda shard: session)
+
     app.dependency_overrides[db_helper.get_scoped_session] = override_get_scoped_session
     app.dependency_overrides[db_helper.session_dependency] = override_session_dependency
+    app.dependency_overrides[shard_map.session_dependency] = override_shard_sessions
 
 
 async def create_chat(client: AsyncClient, title: str) -> Chat:
@@ -31,3 +41,14 @@ async def create_message(client: AsyncClient, chat_id: int, text: str) -> Messag
         f"{CHAT_URL}/{chat_id}/messages",
         json={"text": text},
     )
+
+
+@contextmanager
+def assert_max_statements(limit: int) -> Iterator[DBStats]:
+    """Fail if the block runs more than limit SQL statements"""
+
+    with track_db_stats() as stats:
+        yield stats
+    assert (
+        stats.statements <= limit
+    ), f"Expected at most {limit} statements, got {stats.statements}"